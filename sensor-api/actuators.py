@@ -0,0 +1,208 @@
+"""
+Non-blocking output for buzzer, vibration motor and relay.
+
+Callers hand a timed sequence of steps to the ActuatorTimeline and get a
+concurrent.futures.Future back right away; a single background thread runs
+the steps at their offsets. `future.cancel()` stops a running sequence and
+runs its cleanup (e.g. pin low), so nothing is left buzzing. A sequence
+started on a busy `channel` replaces the one playing there.
+"""
+
+from concurrent.futures import Future
+import heapq
+import itertools
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from hardware import GPIO
+from structured_log import get_logger
+
+log = get_logger('actuators')
+
+Step = Tuple[float, Callable[[], None]]  # offset in seconds from the start, action
+
+# the last stretch before a step is busy-waited, condition waits can be a few ms late
+SPIN_SECONDS = 0.001
+
+
+class _Sequence():
+    def __init__(self, steps: List[Step], cleanup: Optional[Callable[[], None]], channel: Optional[str]):
+        self.steps = steps
+        self.start = 0.0
+        self.cleanup = cleanup
+        self.channel = channel
+        self.index = 0
+        self.cleaned = False
+        self.future: Future = Future()
+
+
+class ActuatorTimeline():
+    """Runs timed actuator steps on one background thread.
+
+    Steps should be quick (a GPIO write, a PWM change); everything waiting
+    happens on the timeline, never in the caller.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.heap: List[Tuple[float, int, _Sequence]] = []
+        self.counter = itertools.count()
+        self.channels: Dict[str, _Sequence] = {}
+        self.running = True
+        self.steps_run = 0
+        self.max_late = 0.0
+        self.avg_late = 0.0
+        self.thread = threading.Thread(target=self._run, name='actuator-timeline', daemon=True)
+        self.thread.start()
+
+    def run(self, steps: Sequence[Step], cleanup: Optional[Callable[[], None]] = None, channel: Optional[str] = None,
+            delay: float = 0.0) -> Future:
+        """Schedules `steps`, `cleanup` runs when the sequence is cancelled or fails."""
+        sequence = _Sequence(sorted(steps, key=lambda step: step[0]), cleanup, channel)
+        with self.condition:
+            if not self.running:
+                raise RuntimeError('actuator timeline is closed')
+            previous = self.channels.get(channel) if channel is not None else None
+            if channel is not None:
+                self.channels[channel] = sequence
+        if previous is not None:
+            previous.future.cancel()
+        sequence.future.add_done_callback(lambda future: self._finished(sequence))
+        if not sequence.steps:
+            self._complete(sequence)
+            return sequence.future
+        with self.condition:
+            # starts after the cleanup of the sequence it replaced
+            sequence.start = time.perf_counter() + delay
+            self._push(sequence)
+        return sequence.future
+
+    def pulse(self, pin: int, duration: float, times: int = 1, gap: float = 0.1, channel: Optional[str] = None) -> Future:
+        """Drives `pin` high for `duration` seconds, `times` times with `gap` in between."""
+        steps: List[Step] = []
+        for number in range(times):
+            start = number * (duration + gap)
+            steps.append((start, lambda: GPIO.output(pin, True)))
+            steps.append((start + duration, lambda: GPIO.output(pin, False)))
+        return self.run(steps, lambda: GPIO.output(pin, False), channel)
+
+    def melody(self, pwm: Any, notes: Sequence[Tuple[float, float]], gap: float = 0.05, duty_cycle: float = 50,
+               channel: Optional[str] = None) -> Future:
+        """Plays (frequency, seconds) notes on a started PWM, frequency 0 is a rest."""
+        def tone(frequency: float):
+            pwm.ChangeFrequency(frequency)
+            pwm.ChangeDutyCycle(duty_cycle)
+
+        steps: List[Step] = []
+        offset = 0.0
+        for frequency, duration in notes:
+            if frequency > 0:
+                steps.append((offset, lambda frequency=frequency: tone(frequency)))
+            steps.append((offset + duration, lambda: pwm.ChangeDutyCycle(0)))
+            offset += duration + gap
+        return self.run(steps, lambda: pwm.ChangeDutyCycle(0), channel)
+
+    def switch(self, pin: int, level: int, hold: Optional[float] = None, channel: Optional[str] = None) -> Future:
+        """Sets `pin` to `level`, and back to the opposite level after `hold` seconds."""
+        steps: List[Step] = [(0.0, lambda: GPIO.output(pin, level))]
+        cleanup = None
+        if hold is not None:
+            steps.append((hold, lambda: GPIO.output(pin, not level)))
+            cleanup = lambda: GPIO.output(pin, not level)
+        return self.run(steps, cleanup, channel)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.condition:
+            return {
+                'pending': len({id(sequence) for _, _, sequence in self.heap if not sequence.future.done()}),
+                'steps_run': self.steps_run,
+                'avg_late_ms': round(self.avg_late * 1000, 3),
+                'max_late_ms': round(self.max_late * 1000, 3),
+            }
+
+    def close(self):
+        """Cancels everything still playing, runs the cleanups and stops the thread."""
+        with self.condition:
+            sequences = [sequence for _, _, sequence in self.heap]
+        for sequence in sequences:
+            sequence.future.cancel()
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
+
+    def _push(self, sequence: _Sequence):
+        due = sequence.start + sequence.steps[sequence.index][0]
+        heapq.heappush(self.heap, (due, next(self.counter), sequence))
+        self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running and (not self.heap or self.heap[0][0] - time.perf_counter() > SPIN_SECONDS):
+                    self.condition.wait(self.heap[0][0] - time.perf_counter() - SPIN_SECONDS if self.heap else None)
+                if not self.running and not self.heap:
+                    return
+                due, _, sequence = heapq.heappop(self.heap)
+            if sequence.future.done():
+                self._cancelled(sequence)
+                continue
+            while time.perf_counter() < due:
+                pass
+            self._step(sequence, due)
+
+    def _cancelled(self, sequence: _Sequence):
+        if sequence.future.cancelled() and sequence.cleanup is not None and not sequence.cleaned:
+            sequence.cleaned = True
+            self._call(sequence.cleanup)
+
+    def _step(self, sequence: _Sequence, due: float):
+        if sequence.future.done():
+            # cancelled while waiting for the step
+            self._cancelled(sequence)
+            return
+
+        late = time.perf_counter() - due
+        _, action = sequence.steps[sequence.index]
+        try:
+            action()
+        except Exception as exc:  # pylint: disable=broad-except
+            log.error('actuator_step_failed', channel=sequence.channel, error=exc)
+            if sequence.cleanup is not None:
+                sequence.cleaned = True
+                self._call(sequence.cleanup)
+            if sequence.future.set_running_or_notify_cancel():
+                sequence.future.set_exception(exc)
+            return
+
+        with self.condition:
+            self.steps_run += 1
+            self.max_late = max(self.max_late, late)
+            self.avg_late += (late - self.avg_late) / min(self.steps_run, 100)
+            sequence.index += 1
+            if sequence.index < len(sequence.steps):
+                self._push(sequence)
+                return
+        self._complete(sequence)
+
+    def _complete(self, sequence: _Sequence):
+        # the future stays pending while playing, so cancel() works until the last step
+        if sequence.future.set_running_or_notify_cancel():
+            sequence.future.set_result(None)
+
+    def _finished(self, sequence: _Sequence):
+        with self.condition:
+            if sequence.channel is not None and self.channels.get(sequence.channel) is sequence:
+                del self.channels[sequence.channel]
+            if sequence.future.cancelled() and self.running:
+                # the cleanup runs on the timeline, after any step that is running right now
+                heapq.heappush(self.heap, (time.perf_counter(), next(self.counter), sequence))
+                self.condition.notify()
+
+    @staticmethod
+    def _call(action: Callable[[], None]):
+        try:
+            action()
+        except Exception as exc:  # pylint: disable=broad-except
+            log.error('actuator_cleanup_failed', error=exc)
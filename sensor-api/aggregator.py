@@ -0,0 +1,270 @@
+"""
+Fleet aggregator for sensor-api nodes.
+
+Subscribes to the sensor topics of every node, keeps the latest value per
+node and sensor and serves all of them as one /metrics with a `node` label,
+so a single Prometheus scrape covers the whole fleet.
+
+Nodes started with NODE_ID publish mondaymorning/sensors/<node>/<sensor>,
+nodes without it publish mondaymorning/sensors/<sensor> and are reported as
+DEFAULT_NODE.
+
+With AGGREGATOR_WORKERS > 1 the topics are consumed by that many worker
+processes through an MQTT shared subscription ($share/<group>/...): the
+broker spreads the messages over the workers, which parse them and hand the
+values back to the HTTP process in small batches.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from hardware import MqttClient
+from instrumentation import PROMETHEUS_CONTENT_TYPE, REGISTRY, Counter, Gauge, format_labels, format_value
+
+MQTT_BROKER_HOST = os.getenv('MQTT_BROKER_HOST', '192.168.1.129')
+MQTT_BROKER_PORT = int(os.getenv('MQTT_BROKER_PORT', '1883'))
+# 0 consumes in this process, 1 uses one worker process, more use a shared subscription
+AGGREGATOR_WORKERS = int(os.getenv('AGGREGATOR_WORKERS', '2'))
+AGGREGATOR_GROUP = os.getenv('AGGREGATOR_GROUP', 'sensor-aggregator')
+# nodes that were silent for longer than this disappear from /metrics
+AGGREGATOR_STALE_AFTER = float(os.getenv('AGGREGATOR_STALE_AFTER', '300'))
+
+SENSOR_PREFIX = 'mondaymorning/sensors/'
+DEFAULT_NODE = os.getenv('AGGREGATOR_DEFAULT_NODE', 'default')
+# how often a worker hands its parsed values to the HTTP process
+FLUSH_INTERVAL = 0.1
+
+NODE_PATTERN = re.compile(r'^[A-Za-z0-9_.-]+$')
+SENSOR_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+HELP = {
+    'light': 'measured light intensity in lux',
+    'distance': 'measured distance to obstacle in centimeters',
+    'air_temperature': 'measured temperature in celcius',
+    'air_humidity': 'measured humidity in percent',
+}
+
+host = '0.0.0.0'
+port = int(os.getenv('AGGREGATOR_PORT', '8090'))
+
+# node, sensor, value, unix time the message was received
+Update = Tuple[str, str, float, float]
+# worker, updates, rejected messages
+Batch = Tuple[int, List[Update], int]
+
+
+def parse_message(topic: str, payload: Any) -> Optional[Tuple[str, str, float]]:
+    if not topic.startswith(SENSOR_PREFIX):
+        return None
+    levels = topic[len(SENSOR_PREFIX):].split('/')
+    if len(levels) == 1:
+        node, sensor = DEFAULT_NODE, levels[0]
+    elif len(levels) == 2:
+        node, sensor = levels
+    else:
+        return None
+    if not NODE_PATTERN.match(node) or not SENSOR_PATTERN.match(sensor):
+        return None
+    try:
+        return node, sensor, float(payload)
+    except (TypeError, ValueError):
+        return None
+
+
+def subscription(workers: int, group: str = AGGREGATOR_GROUP) -> str:
+    if workers > 1:
+        return f'$share/{group}/{SENSOR_PREFIX}#'
+    return SENSOR_PREFIX + '#'
+
+
+def consume(worker: int, pattern: str, updates: Any, stop: Any = None):
+    """Worker loop: parses sensor messages and puts them on `updates` in batches.
+
+    `updates` and `stop` are either multiprocessing or threading objects,
+    depending on whether the worker runs as its own process.
+    """
+    pending: List[Update] = []
+    rejected = [0]
+    lock = threading.Lock()
+
+    def on_connect(client, userdata, flags, reason_code, properties=None):  # pylint: disable=unused-argument
+        # subscribing here renews the subscription after every reconnect
+        client.subscribe(pattern, qos=1)
+
+    def on_message(client, userdata, message):  # pylint: disable=unused-argument
+        parsed = parse_message(message.topic, message.payload)
+        with lock:
+            if parsed is None:
+                rejected[0] += 1
+            else:
+                pending.append(parsed + (time.time(),))
+
+    client = MqttClient()
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect_async(MQTT_BROKER_HOST, MQTT_BROKER_PORT, 60)
+    client.loop_start()
+
+    while stop is None or not stop.is_set():
+        time.sleep(FLUSH_INTERVAL)
+        with lock:
+            batch = list(pending)
+            pending.clear()
+            batch_rejected = rejected[0]
+            rejected[0] = 0
+        if batch or batch_rejected:
+            updates.put((worker, batch, batch_rejected))
+
+    client.loop_stop()
+    client.disconnect()
+
+
+class FleetTable():
+    """Latest value and receive time per (node, sensor)."""
+
+    def __init__(self, stale_after: float = AGGREGATOR_STALE_AFTER):
+        self.stale_after = stale_after
+        self.values: Dict[Tuple[str, str], Tuple[float, float]] = {}
+        self.received: Dict[int, int] = {}
+        self.rejected: Dict[int, int] = {}
+        self.expired = 0
+        self.lock = threading.Lock()
+
+    def apply(self, batch: Batch):
+        worker, updates, rejected = batch
+        with self.lock:
+            for node, sensor, value, received_at in updates:
+                current = self.values.get((node, sensor))
+                # with several workers an older message can arrive after a newer one
+                if current is not None and current[1] > received_at:
+                    continue
+                self.values[(node, sensor)] = (value, received_at)
+            self.received[worker] = self.received.get(worker, 0) + len(updates)
+            self.rejected[worker] = self.rejected.get(worker, 0) + rejected
+
+    def expire(self, now: Optional[float] = None):
+        deadline = (now if now is not None else time.time()) - self.stale_after
+        with self.lock:
+            stale = [key for key, (_, received_at) in self.values.items() if received_at < deadline]
+            for key in stale:
+                del self.values[key]
+            self.expired += len(stale)
+
+    def snapshot(self) -> Dict[Tuple[str, str], Tuple[float, float]]:
+        self.expire()
+        with self.lock:
+            return dict(self.values)
+
+    def nodes(self) -> Dict[str, Dict[str, Any]]:
+        nodes: Dict[str, Dict[str, Any]] = {}
+        for (node, sensor), (value, received_at) in sorted(self.snapshot().items()):
+            nodes.setdefault(node, {})[sensor] = value
+            nodes[node]['last_update'] = max(nodes[node].get('last_update', 0), received_at)
+        return nodes
+
+
+def render_metrics(values: Dict[Tuple[str, str], Tuple[float, float]]) -> bytes:
+    families: Dict[str, List[Tuple[str, float, float]]] = {}
+    for (node, sensor), (value, received_at) in sorted(values.items()):
+        families.setdefault(sensor, []).append((node, value, received_at))
+
+    lines: List[str] = []
+    for sensor, samples in families.items():
+        lines.append(f'# HELP {sensor} {HELP.get(sensor, sensor + " reported by the node")}')
+        lines.append(f'# TYPE {sensor} gauge')
+        lines.extend(f'{sensor}{format_labels(["node"], [node])} {format_value(value)}' for node, value, _ in samples)
+
+    if values:
+        lines.append('# HELP sensor_last_update_timestamp_seconds unix time the last value of a node arrived')
+        lines.append('# TYPE sensor_last_update_timestamp_seconds gauge')
+        lines.extend(
+            f'sensor_last_update_timestamp_seconds{format_labels(["node", "sensor"], [node, sensor])} {format_value(received_at)}'
+            for (node, sensor), (_, received_at) in sorted(values.items())
+        )
+    return ('\n'.join(lines) + '\n').encode() if lines else b''
+
+
+table = FleetTable()
+
+AGGREGATOR_MESSAGES = Counter('aggregator_messages_total', 'sensor messages consumed per worker', ['worker'])
+AGGREGATOR_REJECTED = Counter('aggregator_rejected_messages_total', 'messages with an unknown topic or payload', ['worker'])
+AGGREGATOR_NODES = Gauge('aggregator_nodes', 'nodes with at least one fresh value')
+AGGREGATOR_NODES.labels().set_function(lambda: len({node for node, _ in table.snapshot()}))
+
+
+def collect(updates: Any):
+    """Applies the batches of all workers to the table."""
+    while True:
+        batch = updates.get()
+        table.apply(batch)
+        worker = batch[0]
+        AGGREGATOR_MESSAGES.labels(worker).set_function(lambda worker=worker: table.received.get(worker, 0))
+        AGGREGATOR_REJECTED.labels(worker).set_function(lambda worker=worker: table.rejected.get(worker, 0))
+
+
+def start_workers(workers: int = AGGREGATOR_WORKERS) -> List[Any]:
+    pattern = subscription(workers)
+    if workers <= 0:
+        updates: Any = queue.Queue()
+        started: List[Any] = [threading.Thread(target=consume, args=(0, pattern, updates), name='aggregator-consumer', daemon=True)]
+    else:
+        updates = multiprocessing.Queue()
+        started = [
+            multiprocessing.Process(target=consume, args=(worker, pattern, updates), name=f'aggregator-{worker}', daemon=True)
+            for worker in range(workers)
+        ]
+    # the worker processes are forked before this process starts any thread
+    for worker in started:
+        worker.start()
+    threading.Thread(target=collect, args=(updates,), name='aggregator-collect', daemon=True).start()
+    return started
+
+
+class Server(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def send(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/metrics':
+            self.send(render_metrics(table.snapshot()) + REGISTRY.render(), PROMETHEUS_CONTENT_TYPE)
+        elif path == '/':
+            self.send(json.dumps(table.nodes()).encode(), 'application/json')
+        else:
+            self.send_error(404)
+
+
+def create_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), Server)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    start_workers()
+    server = create_server()
+    print(f'Aggregator started with {AGGREGATOR_WORKERS} workers and listen to {host}:{port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    print('Aggregator stopped.')
+
+
+if __name__ == '__main__':
+    main()
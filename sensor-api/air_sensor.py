@@ -1,34 +1,96 @@
-from time import sleep
-import RPi.GPIO as GPIO
+from time import monotonic, sleep, time
 import threading
-import dht11
+
+from hardware import DHT11, GPIO
+from structured_log import get_logger
+
+log = get_logger('air_sensor')
 
 # initialize GPIO
 GPIO.setwarnings(False)
 GPIO.setmode(GPIO.BOARD)
 GPIO.cleanup()
-    
+
 # read data using pin 14
 
+# the DHT11 needs at least one second between two readouts, two are safer
+MIN_INTERVAL = 2.0
+MAX_BACKOFF = 16.0
+
+
+class AirReadout():
+    """Last good DHT11 values together with how fresh they are."""
+
+    def __init__(self, result, last_good, last_good_monotonic, valid_count, invalid_count):
+        # result is None until the first readout was taken
+        self.error_code = result.error_code if result is not None else None
+        self.temperature = result.temperature if result is not None else None
+        self.humidity = result.humidity if result is not None else None
+        # wall clock time of the last valid readout, None until there was one
+        self.last_good = last_good
+        self.age = monotonic() - last_good_monotonic if last_good_monotonic is not None else None
+        self.valid_count = valid_count
+        self.invalid_count = invalid_count
+
+    def is_valid(self):
+        return self.last_good is not None
+
+    def is_fresh(self, max_age: float) -> bool:
+        return self.age is not None and self.age <= max_age
+
+
 class AirSensor():
     def update(self):
+        sleep(MIN_INTERVAL)
         while True:
-            readout = self.instance.read()
-            valid = readout.is_valid()
-            if valid:  # read until valid values
-                print(f'Temperature: {readout.temperature}°C Humidity: {readout.humidity}%')
-                self.result = readout
-            else:
-                sleep(2)
-
-    def __init__(self):
-        self.instance = dht11.DHT11(pin = 7)
-        self.result = self.instance.read()
-        print(self.result.__dict__)
-
-        threading.Thread(target=self.update, daemon=True).start()
-    
-    def readAir(self):
-        return self.result
+            sleep(self.sample())
+
+    def sample(self) -> float:
+        """Takes one readout and returns the delay until the next one."""
+        readout = self.instance.read()
+        if self._store(readout):
+            self.failures = 0
+            log.info('air_sample', celsius=readout.temperature, humidity=readout.humidity)
+            return self.interval
+
+        # back off on checksum errors instead of hammering the sensor
+        self.failures += 1
+        return min(MAX_BACKOFF, MIN_INTERVAL * 2 ** (self.failures - 1))
+
+    def _store(self, readout) -> bool:
+        if not readout.is_valid():
+            self.invalid_count += 1
+            return False
+
+        self.valid_count += 1
+        self.result = readout
+        self.last_good = time()
+        self.last_good_monotonic = monotonic()
+        if self.on_update is not None:
+            self.on_update(readout)
+        return True
 
- 
\ No newline at end of file
+    def __init__(self, on_update=None, interval: float = MIN_INTERVAL, start_thread: bool = True, initial_read: bool = True):
+        # called with every new valid readout
+        self.on_update = on_update
+        self.interval = max(interval, MIN_INTERVAL)
+        self.failures = 0
+        self.valid_count = 0
+        self.invalid_count = 0
+        self.last_good = None
+        self.last_good_monotonic = None
+
+        self.instance = DHT11(pin = 7)
+        self.result = None
+        # without the initial readout construction never blocks on the sensor
+        if initial_read:
+            self.result = self.instance.read()
+            log.info('air_initial_read', **self.result.__dict__)
+            self._store(self.result)
+
+        # without the thread sample() is driven by a SamplingScheduler
+        if start_thread:
+            threading.Thread(target=self.update, daemon=True).start()
+
+    def readAir(self):
+        return AirReadout(self.result, self.last_good, self.last_good_monotonic, self.valid_count, self.invalid_count)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+I2C traffic of the LCD and 7-segment updates, before and after display.py.
+
+Replays the update pattern of the Joy-Pi games (a prompt, a running timer,
+a result) against the simulated displays. `direct` does what the scripts
+did before (lcd.clear() plus the whole lcd.message, Seg7x4 with
+auto_write), `shadow` goes through LcdDisplay and SegmentDisplay:
+
+    python benchmark_display.py --updates 200
+"""
+
+import argparse
+import os
+import time
+from typing import Callable, Dict, List, Tuple
+
+os.environ['SENSOR_BACKEND'] = 'sim'
+
+import sim_hardware  # noqa: E402
+from display import LcdDisplay, SegmentDisplay  # noqa: E402
+
+
+def workload(updates: int) -> List[Tuple[str, float]]:
+    """LCD text and 7-segment number per update, like a round of game.py."""
+    frames = []
+    for index in range(updates):
+        elapsed = index * 0.05
+        if index % 50 == 0:
+            frames.append((f'Drücke Zahl:\n{index % 4}', 0))
+        else:
+            frames.append((f'Drücke Zahl:\n{index % 4}  {elapsed:5.2f}s', elapsed))
+    return frames
+
+
+def run_direct(frames: List[Tuple[str, float]], lcd, segments, interval: float) -> float:
+    blocked = 0.0
+    for text, number in frames:
+        started = time.perf_counter()
+        lcd.clear()
+        lcd.message = text
+        segments.fill(0)
+        for index, character in enumerate(str(int(number * 100)).rjust(4)):
+            segments[index] = character
+        segments.show()
+        blocked += time.perf_counter() - started
+        time.sleep(interval)
+    return blocked
+
+
+def run_shadow(frames: List[Tuple[str, float]], lcd, segments, interval: float) -> float:
+    lcd_display = LcdDisplay(lcd)
+    segment_display = SegmentDisplay(segments)
+    blocked = 0.0
+    for text, number in frames:
+        started = time.perf_counter()
+        lcd_display.message(text)
+        segment_display.number(number * 100)
+        blocked += time.perf_counter() - started
+        time.sleep(interval)
+    lcd_display.close()
+    segment_display.close()
+    return blocked
+
+
+def measure(name: str, runner: Callable, frames: List[Tuple[str, float]], interval: float) -> Dict[str, float]:
+    lcd = sim_hardware.SimCharacterLCD()
+    segments = sim_hardware.SimSeg7x4()
+    blocked = runner(frames, lcd, segments, interval)
+    transactions = lcd.i2c_transactions + segments.i2c_transactions
+    print(f'{name:7} updates={len(frames)} lcd_bytes={lcd.bytes_written:6} '
+          f'i2c_transactions={transactions:7} per_update={transactions / len(frames):7.1f} '
+          f'caller_blocked_per_update={blocked / len(frames) * 1000:7.3f}ms')
+    return {'transactions': transactions, 'text': lcd.text()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='I2C transactions per display update')
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--interval', type=float, default=0.01, help='seconds between two updates')
+    args = parser.parse_args()
+
+    frames = workload(args.updates)
+    direct = measure('direct', run_direct, frames, args.interval)
+    shadow = measure('shadow', run_shadow, frames, args.interval)
+    assert direct['text'] == shadow['text'], 'both paths must end with the same screen'
+
+
+if __name__ == '__main__':
+    main()
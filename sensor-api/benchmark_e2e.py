@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of webserver.py on the simulated hardware backend.
+
+Runs the real sampling loops, cache, HTTP server and MQTT publisher against
+sim_hardware.py and measures
+
+  sensor -> cache -> HTTP   time from the simulated BH1750 conversion until
+                            the value is first returned by GET /
+  sensor -> MQTT            time from the conversion until the value arrives
+                            at a subscriber of the in-process broker
+
+plus HTTP request latency and throughput. Runs on any Linux box:
+
+    python benchmark_e2e.py --duration 20 --clients 8
+"""
+
+import argparse
+import http.client
+import json
+import os
+import threading
+import time
+from typing import Dict, List
+
+os.environ['SENSOR_BACKEND'] = 'sim'
+# keep the benchmark output readable, the sample lines are of no interest here
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import sim_hardware  # noqa: E402
+from benchmark_webserver import percentile  # noqa: E402
+
+
+def summarize(name: str, samples: List[float], elapsed: float) -> str:
+    return (
+        f'{name:22} n={len(samples):6} rate={len(samples) / elapsed:8.1f}/s '
+        f'p50={percentile(samples, 50) * 1000:8.2f}ms p95={percentile(samples, 95) * 1000:8.2f}ms '
+        f'p99={percentile(samples, 99) * 1000:8.2f}ms'
+    )
+
+
+def poll_http(port: int, stop: threading.Event, request_latencies: List[float], value_latencies: List[float], seen: Dict[float, bool]):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    while not stop.is_set():
+        start = time.perf_counter()
+        connection.request('GET', '/')
+        response = connection.getresponse()
+        body = response.read()
+        now = time.perf_counter()
+        request_latencies.append(now - start)
+
+        light = json.loads(body).get('light')
+        if light is None or light in seen:
+            continue
+        seen[light] = True
+        captured_at = sim_hardware.captures.captured_at('light', light)
+        if captured_at is not None:
+            value_latencies.append(now - captured_at)
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end latency benchmark on simulated hardware')
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--light-delay', type=float, default=0.5, help='sampling cadence of the light sensor')
+    parser.add_argument('--distance-delay', type=float, default=0.3, help='sampling cadence of the distance sensor')
+    parser.add_argument('--latency-scale', type=float, default=1.0, help='multiplier for simulated device latencies')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='probability of a failed sensor read')
+    args = parser.parse_args()
+
+    sim_hardware.configure(
+        latency_scale=args.latency_scale,
+        failure_rate={'i2c': args.failure_rate, 'dht11': args.failure_rate, 'hcsr04': args.failure_rate},
+    )
+
+    mqtt_latencies: List[float] = []
+    mqtt_received = [0]
+
+    def on_message(client, userdata, message):
+        mqtt_received[0] += 1
+        if not message.topic.endswith('/light'):
+            return
+        captured_at = sim_hardware.captures.captured_at('light', float(message.payload))
+        if captured_at is not None:
+            mqtt_latencies.append(time.perf_counter() - captured_at)
+
+    subscriber = sim_hardware.SimMqttClient()
+    subscriber.on_message = on_message
+    subscriber.subscribe('mondaymorning/sensors/#')
+
+    request_latencies: List[float] = []
+    http_latencies: List[float] = []
+    seen: Dict[float, bool] = {}
+    stop = threading.Event()
+
+    import webserver
+    webserver.port = 0
+    server = webserver.create_server()
+    webserver.Server.log_message = lambda *args: None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    webserver.start_sampling()
+    webserver.start_mqtt()
+    webserver.scheduler.set_cadence('light', args.light_delay)
+    webserver.scheduler.set_cadence('distance', args.distance_delay)
+
+    port = server.server_address[1]
+    clients = [
+        threading.Thread(target=poll_http, args=(port, stop, request_latencies, http_latencies, seen), daemon=True)
+        for _ in range(args.clients)
+    ]
+    started = time.perf_counter()
+    for client in clients:
+        client.start()
+    time.sleep(args.duration)
+    stop.set()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    print(f'duration={elapsed:.1f}s clients={args.clients} latency_scale={args.latency_scale} failure_rate={args.failure_rate}')
+    print(summarize('http request', request_latencies, elapsed))
+    print(summarize('sensor->cache->http', http_latencies, elapsed))
+    print(summarize('sensor->mqtt', mqtt_latencies, elapsed))
+    print(f'mqtt messages received={mqtt_received[0]} publisher={webserver.publisher.stats()}')
+    for name, stats in webserver.scheduler.stats().items():
+        print(f"task {name:12} runs={stats['runs']} deadline_misses={stats['deadline_misses']} "
+              f"avg_jitter={stats['avg_jitter_ms']}ms max_jitter={stats['max_jitter_ms']}ms")
+
+
+if __name__ == '__main__':
+    main()
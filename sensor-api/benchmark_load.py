@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Load test with regression check for webserver.py.
+
+Starts webserver.py as a subprocess on the simulated hardware backend, so
+the sampling threads run as in production, and drives every path with
+concurrent clients (benchmark_webserver.benchmark). Per path it records
+req/s, p50/p95/p99 latency and the CPU time and peak RSS of the server
+process, read from /proc. Each path is measured `--repeat` times and the
+median of every metric is kept.
+
+    python benchmark_load.py --save baseline.json
+    # ... change something ...
+    python benchmark_load.py --compare baseline.json --threshold 0.2
+
+With --compare the exit code is 1 when a path got worse than the baseline
+by more than the threshold (relative); latencies also need to grow by more
+than --min-delta-ms, sub-millisecond noise is never a regression. The share
+of failed requests is compared in absolute terms: more than
+--max-error-rate-increase above the baseline (default 0.01, i.e. one
+percentage point) is a regression, however fast the rest was.
+
+A baseline only applies to the machine that recorded it. With --compare,
+the run parameters (--mode, --clients, --requests, --repeat,
+--latency-scale) default to the ones in the baseline's meta. If one is set
+explicitly to a different value, the comparison is refused (exit code 2).
+A different machine, CPU count or Python version only gives a warning,
+since the numbers then say little.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from benchmark_startup import free_port, get
+from benchmark_webserver import benchmark
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+# metric -> True when a higher value is better
+METRICS = {
+    'rps': True,
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'cpu_ms_per_request': False,
+    'rss_peak_mb': False,
+}
+LATENCY_METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+
+# meta entries that must match for a comparison, and their command line defaults
+RUN_PARAMETERS = {
+    'mode': 'threaded',
+    'clients': 16,
+    'requests': 200,
+    'repeat': 3,
+    'latency_scale': 1.0,
+}
+# meta entries describing the machine, a mismatch is only warned about
+ENVIRONMENT = ('machine', 'cpus', 'python')
+
+
+def cpu_seconds(pid: int) -> Optional[float]:
+    """utime + stime of a process, None where there is no /proc."""
+    try:
+        with open(f'/proc/{pid}/stat', encoding='ascii') as stat:
+            # the command name may contain spaces, the fields after it may not
+            fields = stat.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f'/proc/{pid}/status', encoding='ascii') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler():
+    """Peak RSS of a process while a load run is going on."""
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak: Optional[float] = None
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while self.running:
+            value = rss_mb(self.pid)
+            if value is not None:
+                self.peak = max(self.peak or 0.0, value)
+            time.sleep(self.interval)
+
+    def stop(self) -> Optional[float]:
+        self.running = False
+        self.thread.join()
+        return self.peak
+
+
+def start_server(environment: Dict[str, str], timeout: float) -> subprocess.Popen:
+    port = int(environment['WEBSERVER_PORT'])
+    process = subprocess.Popen([sys.executable, 'webserver.py'], env=environment,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        if get(port, '/readyz') == 200:
+            return process
+        if process.poll() is not None:
+            break
+        time.sleep(0.05)
+    process.terminate()
+    process.wait()
+    raise RuntimeError('webserver.py did not become ready')
+
+
+def measure_path(url: str, pid: int, path: str, clients: int, requests: int) -> Dict[str, Any]:
+    sampler = RssSampler(pid)
+    cpu_before = cpu_seconds(pid)
+    result = benchmark(url, path, clients, requests)
+    cpu_after = cpu_seconds(pid)
+    result['rss_peak_mb'] = sampler.stop()
+    attempts = result['requests'] + result['errors']
+    result['error_rate'] = result['errors'] / attempts if attempts else 1.0
+    if cpu_before is not None and cpu_after is not None and result['requests']:
+        result['cpu_ms_per_request'] = (cpu_after - cpu_before) * 1000 / result['requests']
+        result['cpu_percent'] = (cpu_after - cpu_before) / result['elapsed_s'] * 100
+    return {key: round(value, 4) if isinstance(value, float) else value for key, value in result.items()}
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    port = free_port()
+    environment = dict(os.environ, SENSOR_BACKEND='sim', WEBSERVER_PORT=str(port),
+                       WEBSERVER_MODE=args.mode, SIM_LATENCY_SCALE=str(args.latency_scale))
+    url = f'http://127.0.0.1:{port}'
+    process = start_server(environment, args.timeout)
+    results: Dict[str, Any] = {}
+    try:
+        for path in args.paths:
+            benchmark(url, path, args.clients, max(1, args.requests // 10))  # warm up
+            runs = [measure_path(url, process.pid, path, args.clients, args.requests) for _ in range(args.repeat)]
+            # median per metric, a single noisy run moves none of them
+            results[path] = {key: statistics.median_low([run[key] for run in runs])
+                             if all(isinstance(run.get(key), (int, float)) for run in runs) else runs[0].get(key)
+                             for key in runs[0]}
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'mode': args.mode,
+            'clients': args.clients,
+            'requests': args.requests,
+            'repeat': args.repeat,
+            'latency_scale': args.latency_scale,
+        },
+        'results': results,
+    }
+
+
+def mismatches(baseline_meta: Dict[str, Any], current_meta: Dict[str, Any], keys: Sequence[str]) -> List[str]:
+    return [f'{key}: baseline {baseline_meta.get(key)!r}, this run {current_meta.get(key)!r}'
+            for key in keys if baseline_meta.get(key) != current_meta.get(key)]
+
+
+def apply_baseline_parameters(args: argparse.Namespace, baseline_meta: Dict[str, Any]) -> List[str]:
+    """Fills the run parameters left unset from the baseline, returns those set to something else."""
+    conflicts = []
+    for key, default in RUN_PARAMETERS.items():
+        value = getattr(args, key)
+        recorded = baseline_meta.get(key, default)
+        if value is None:
+            setattr(args, key, recorded)
+        elif value != recorded:
+            conflicts.append(f'--{key.replace("_", "-")} {value} but the baseline used {recorded}')
+    return conflicts
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float, min_delta_ms: float,
+            max_error_rate_increase: float = 0.01) -> List[str]:
+    regressions = []
+    for path, result in current['results'].items():
+        before = baseline.get('results', {}).get(path)
+        if before is None:
+            continue
+        # baselines written before the error rate was recorded had no failed requests to speak of
+        old_rate, new_rate = before.get('error_rate', 0.0), result.get('error_rate', 0.0)
+        if new_rate - old_rate > max_error_rate_increase:
+            regressions.append(f'{path} error_rate: {old_rate:.2%} -> {new_rate:.2%}')
+        for metric, higher_is_better in METRICS.items():
+            old, new = before.get(metric), result.get(metric)
+            if not isinstance(old, (int, float)) or not isinstance(new, (int, float)) or old <= 0:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            if metric in LATENCY_METRICS and new - old <= min_delta_ms:
+                continue
+            if worse > threshold:
+                regressions.append(f'{path} {metric}: {old} -> {new} ({change:+.0%})')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test webserver.py on simulated sensors')
+    parser.add_argument('--paths', nargs='+', default=['/', '/metrics'])
+    # None: taken from the --compare baseline, else RUN_PARAMETERS
+    parser.add_argument('--clients', type=int, help=f"default {RUN_PARAMETERS['clients']}")
+    parser.add_argument('--requests', type=int, help=f"requests per client, default {RUN_PARAMETERS['requests']}")
+    parser.add_argument('--repeat', type=int, help=f"default {RUN_PARAMETERS['repeat']}")
+    parser.add_argument('--mode', help=f"WEBSERVER_MODE of the server, default {RUN_PARAMETERS['mode']}")
+    parser.add_argument('--latency-scale', type=float,
+                        help=f"multiplier for simulated device latencies, default {RUN_PARAMETERS['latency_scale']}")
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--save', help='write the results as JSON baseline to this file')
+    parser.add_argument('--compare', help='baseline JSON to check the results against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative regression')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='latency changes below this never count')
+    parser.add_argument('--max-error-rate-increase', type=float, default=0.01,
+                        help='allowed absolute increase of the failed request share')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        conflicts = apply_baseline_parameters(args, baseline.get('meta', {}))
+        if conflicts:
+            for conflict in conflicts:
+                print(f'Not comparable: {conflict}')
+            sys.exit(2)
+    for key, default in RUN_PARAMETERS.items():
+        if getattr(args, key) is None:
+            setattr(args, key, default)
+
+    current = run(args)
+    for path, result in current['results'].items():
+        print(f"{path:10} rps={result['rps']:8.1f} p50={result['p50_ms']:6.2f}ms p95={result['p95_ms']:6.2f}ms "
+              f"p99={result['p99_ms']:6.2f}ms errors={result['errors']} ({result['error_rate']:.1%}) "
+              f"cpu={result.get('cpu_ms_per_request', float('nan')):.3f}ms/req "
+              f"rss_peak={result.get('rss_peak_mb') or float('nan'):.1f}MB")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as baseline_file:
+            json.dump(current, baseline_file, indent=2, sort_keys=True)
+        print(f'Baseline written to {args.save}')
+
+    if baseline is not None:
+        for mismatch in mismatches(baseline.get('meta', {}), current['meta'], ENVIRONMENT):
+            print(f'WARNING baseline from another environment, {mismatch}')
+        regressions = compare(baseline, current, args.threshold, args.min_delta_ms, args.max_error_rate_increase)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print(f'No regression beyond {args.threshold:.0%} against {args.compare}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Frame cost of the LED matrix text, before and after matrix_renderer.py.
+
+`legacy` rasterizes the whole text from the font for every frame, like
+luma's show_message does, and blocks the caller for the full scroll.
+`renderer` goes through MatrixRenderer on its background thread. Both run
+against the simulated MAX7219:
+
+    python benchmark_matrix.py --fps 50 --seconds 3
+"""
+
+import argparse
+import os
+import time
+
+os.environ['SENSOR_BACKEND'] = 'sim'
+
+import sim_hardware  # noqa: E402
+from matrix_renderer import MatrixRenderer  # noqa: E402
+
+TEXT = 'Licht: 1234 lx  Abstand: 56 cm'
+
+
+def run_legacy(device, font, fps: float) -> None:
+    interval = 1.0 / fps
+    render_seconds = 0.0
+    frames = 0
+    started = time.perf_counter()
+    width = device.width
+    length = sum(len(font[ord(character)]) for character in TEXT)
+    for offset in range(length + width):
+        frame_started = time.perf_counter()
+        frame = bytearray(width)
+        x = width - offset
+        for character in TEXT:
+            for column in font[ord(character)]:
+                if 0 <= x < width:
+                    frame[x] = column & 0xFF
+                x += 1
+        device.display_columns(bytes(frame))
+        render_seconds += time.perf_counter() - frame_started
+        frames += 1
+        time.sleep(interval)
+    blocked = time.perf_counter() - started
+    print(f'legacy   frames={frames:5} avg_frame={render_seconds / frames * 1000:7.3f}ms '
+          f'spi_bytes={device.spi_bytes:7} caller_blocked={blocked * 1000:8.1f}ms')
+
+
+def run_renderer(device, font, fps: float, seconds: float) -> None:
+    renderer = MatrixRenderer(device, font, fps=fps)
+    started = time.perf_counter()
+    renderer.set_text(TEXT, restart=True)
+    blocked = time.perf_counter() - started
+    # live value changes while scrolling
+    for value in range(int(seconds * 4)):
+        time.sleep(0.25)
+        started = time.perf_counter()
+        renderer.set_text(f'Licht: {1234 + value} lx  Abstand: 56 cm')
+        blocked += time.perf_counter() - started
+    renderer.close(clear=False)
+    stats = renderer.stats()
+    print(f'renderer frames={stats["frames"]:5} avg_frame={stats["avg_frame_ms"]:7.3f}ms '
+          f'spi_bytes={device.spi_bytes:7} caller_blocked={blocked * 1000:8.1f}ms '
+          f'late={stats["frames_late"]} spi_rate={stats["spi_bytes_per_second"]}B/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LED matrix frame cost')
+    parser.add_argument('--fps', type=float, default=50)
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--cascaded', type=int, default=4)
+    args = parser.parse_args()
+
+    font = sim_hardware.SimMatrixFont()
+    run_legacy(sim_hardware.SimMax7219(args.cascaded), font, args.fps)
+    run_renderer(sim_hardware.SimMax7219(args.cascaded), font, args.fps, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
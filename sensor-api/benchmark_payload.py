@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Encode/decode cost and size of the MQTT payload formats.
+
+Compares the bare text payload the dashboard reads, a JSON object carrying
+the same fields as a binary reading, and the struct frames of
+wire_format.py, each for single readings and for batches:
+
+    python benchmark_payload.py --batch 16 --rounds 20000
+
+CBOR is included when cbor2 is installed.
+"""
+
+import argparse
+import json
+import random
+import time
+from typing import Any, Callable, Dict, List
+
+import wire_format
+from wire_format import Reading
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+def make_readings(count: int) -> List[Reading]:
+    sequencer = wire_format.Sequencer()
+    sensors = list(wire_format.SENSOR_IDS)
+    return [sequencer.reading(sensors[index % len(sensors)], round(random.uniform(0, 1000), 2)) for index in range(count)]
+
+
+def text_codec():
+    # one message per reading, the topic carries the sensor
+    def encode(readings: List[Reading]) -> bytes:
+        return str(readings[0].value).encode()
+
+    def decode(payload: bytes) -> float:
+        return float(payload)
+    return encode, decode
+
+
+def json_codec():
+    def encode(readings: List[Reading]) -> bytes:
+        objects = [reading._asdict() for reading in readings]
+        return json.dumps(objects[0] if len(objects) == 1 else objects, separators=(',', ':')).encode()
+
+    def decode(payload: bytes) -> Any:
+        return json.loads(payload)
+    return encode, decode
+
+
+def cbor_codec():
+    def encode(readings: List[Reading]) -> bytes:
+        return cbor2.dumps([[wire_format.SENSOR_IDS[r.sensor], r.seq, r.time_ns, r.value] for r in readings])
+
+    def decode(payload: bytes) -> Any:
+        return cbor2.loads(payload)
+    return encode, decode
+
+
+def struct_codec():
+    return wire_format.encode, wire_format.decode
+
+
+def measure(function: Callable[[], Any], rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        function()
+    return (time.perf_counter() - started) / rounds
+
+
+def run(codec: Callable, readings: List[Reading], rounds: int) -> Dict[str, float]:
+    encode, decode = codec()
+    payload = encode(readings)
+    return {
+        'bytes_per_reading': len(payload) / len(readings),
+        'encode_us_per_reading': measure(lambda: encode(readings), rounds) / len(readings) * 1e6,
+        'decode_us_per_reading': measure(lambda: decode(payload), rounds) / len(readings) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the MQTT payload formats')
+    parser.add_argument('--batch', type=int, default=16, help='readings per batched frame')
+    parser.add_argument('--rounds', type=int, default=20000)
+    args = parser.parse_args()
+
+    codecs = [('text', text_codec), ('json', json_codec), ('struct', struct_codec)]
+    if cbor2 is not None:
+        codecs.append(('cbor', cbor_codec))
+
+    print(f'{"format":8} {"readings":>8} {"bytes/reading":>14} {"encode us":>10} {"decode us":>10}')
+    for count in (1, args.batch):
+        readings = make_readings(count)
+        for name, codec in codecs:
+            if name == 'text' and count > 1:
+                # the text format has no batch frame
+                continue
+            result = run(codec, readings, args.rounds)
+            print(f'{name:8} {count:8} {result["bytes_per_reading"]:14.1f} '
+                  f'{result["encode_us_per_reading"]:10.2f} {result["decode_us_per_reading"]:10.2f}')
+
+
+if __name__ == '__main__':
+    main()
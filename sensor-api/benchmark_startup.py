@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Time-to-first-response of webserver.py.
+
+Starts webserver.py as a subprocess on the simulated hardware backend and
+measures how long it takes until the first HTTP request is answered and
+until GET /readyz reports every sensor ready:
+
+    python benchmark_startup.py --runs 5 --latency-scale 5
+
+Builds without /readyz can be measured with --ready-path /.
+"""
+
+import argparse
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+from benchmark_webserver import percentile
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def get(port: int, path: str) -> Optional[int]:
+    try:
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+        connection.request('GET', path)
+        status = connection.getresponse().status
+        connection.close()
+        return status
+    except OSError:
+        return None
+
+
+def measure(latency_scale: float, ready_path: str, timeout: float) -> List[float]:
+    port = free_port()
+    environment = dict(os.environ, SENSOR_BACKEND='sim', SIM_LATENCY_SCALE=str(latency_scale), WEBSERVER_PORT=str(port))
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'webserver.py'], env=environment,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    first_response = ready = float('nan')
+    try:
+        while time.perf_counter() - started < timeout:
+            if first_response != first_response:
+                if get(port, '/') is None:
+                    time.sleep(0.005)
+                    continue
+                first_response = time.perf_counter() - started
+            if get(port, ready_path) == 200:
+                ready = time.perf_counter() - started
+                break
+            time.sleep(0.005)
+    finally:
+        process.terminate()
+        process.wait()
+    return [first_response, ready]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time until webserver.py answers and is ready')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--latency-scale', type=float, default=1.0, help='multiplier for simulated device latencies')
+    parser.add_argument('--ready-path', default='/readyz')
+    parser.add_argument('--timeout', type=float, default=30)
+    args = parser.parse_args()
+
+    first_responses, readies = [], []
+    for _ in range(args.runs):
+        first_response, ready = measure(args.latency_scale, args.ready_path, args.timeout)
+        first_responses.append(first_response)
+        readies.append(ready)
+
+    for name, samples in (('first response', first_responses), ('ready', readies)):
+        print(f'{name:15} runs={len(samples)} p50={percentile(samples, 50) * 1000:8.1f}ms '
+              f'max={max(samples) * 1000:8.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Latency benchmark for webserver.py.
+
+Starts a number of concurrent clients against a running sensor-api and
+reports throughput and latency percentiles per path. Run it once against the
+old single-threaded server and once against the threaded one:
+
+    WEBSERVER_MODE=single python -u webserver.py
+    python benchmark_webserver.py --url http://localhost:8080 --clients 32
+
+    WEBSERVER_MODE=threaded python -u webserver.py
+    python benchmark_webserver.py --url http://localhost:8080 --clients 32
+
+benchmarks/webserver-single.json and benchmarks/webserver-threaded.json
+hold both modes measured with benchmark_load.py (32 clients x 50 requests,
+median of 5 runs, sim backend, 1 CPU, listen backlog 64 in both modes). The server speaks
+HTTP/1.0 and closes the connection after every response. For these short,
+in-memory responses, threading adds nothing: single got 1670 req/s (p99
+28 ms) on GET /, threaded 1146 req/s (p99 37 ms). What threading buys is
+isolation. One client that sends half a request blocks the single-threaded
+server completely, and every other client times out. The threaded server
+keeps answering in a few ms. Compare a change against them with
+
+    python benchmark_load.py --compare benchmarks/webserver-threaded.json
+
+They were recorded on one machine; on any other, save a new baseline first.
+"""
+
+import argparse
+import http.client
+import threading
+import time
+from typing import Dict, List
+from urllib.parse import urlparse
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return float('nan')
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_client(netloc: str, path: str, requests: int, latencies: List[float], errors: List[str]):
+    connection = http.client.HTTPConnection(netloc, timeout=10)
+    for _ in range(requests):
+        start = time.perf_counter()
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            if response.will_close:
+                connection.close()
+        except Exception as exc:  # pylint: disable=broad-except
+            errors.append(str(exc))
+            connection.close()
+            continue
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+
+
+def benchmark(url: str, path: str, clients: int, requests: int) -> Dict[str, float]:
+    netloc = urlparse(url).netloc
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    threads = [
+        threading.Thread(target=run_client, args=(netloc, path, requests, latencies, errors), daemon=True)
+        for _ in range(clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies, default=float('nan')) * 1000,
+        'elapsed_s': elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent latency benchmark for the sensor-api')
+    parser.add_argument('--url', default='http://localhost:8080')
+    parser.add_argument('--paths', nargs='+', default=['/', '/metrics'])
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=50, help='requests per client')
+    args = parser.parse_args()
+
+    for path in args.paths:
+        result = benchmark(args.url, path, args.clients, args.requests)
+        print(
+            f"{path:10} clients={args.clients} requests={result['requests']} errors={result['errors']} "
+            f"rps={result['rps']:.1f} p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms "
+            f"p99={result['p99_ms']:.2f}ms max={result['max_ms']:.2f}ms"
+        )
+
+
+if __name__ == '__main__':
+    main()
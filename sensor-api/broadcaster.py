@@ -0,0 +1,113 @@
+from collections import deque
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class Subscriber():
+    """Bounded outgoing queue of one streaming client.
+
+    policy 'drop-oldest' keeps the newest `max_queue` frames, 'latest' only
+    keeps the newest frame (fine when every frame is a full snapshot).
+    A client that dropped more than `max_dropped` frames within
+    `drop_window` seconds is closed. Counting per window instead of per run
+    between two reads also catches a client that reads now and then but
+    keeps falling behind.
+    """
+
+    def __init__(self, max_queue: int, policy: str, max_dropped: int, drop_window: float = 60.0):
+        self.frames: deque = deque(maxlen=1 if policy == 'latest' else max_queue)
+        self.max_dropped = max_dropped
+        self.drop_window = drop_window
+        self.dropped = 0
+        self.dropped_in_window = 0
+        self.window_start = time.monotonic()
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def push(self, frame: bytes):
+        with self.condition:
+            if self.closed:
+                return
+            if len(self.frames) == self.frames.maxlen:
+                now = time.monotonic()
+                if now - self.window_start > self.drop_window:
+                    self.window_start = now
+                    self.dropped_in_window = 0
+                self.dropped += 1
+                self.dropped_in_window += 1
+                if self.dropped_in_window > self.max_dropped:
+                    self.closed = True
+            self.frames.append(frame)
+            self.condition.notify()
+
+    def next(self, timeout: float) -> List[bytes]:
+        """Waits up to `timeout` seconds and returns all queued frames."""
+        with self.condition:
+            if not self.frames and not self.closed:
+                self.condition.wait(timeout)
+            frames = list(self.frames)
+            self.frames.clear()
+            return frames
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+
+class Broadcaster():
+    """Fans out frames that were serialized once to every subscriber."""
+
+    def __init__(self, max_subscribers: int = 64, max_queue: int = 16, policy: str = 'latest', max_dropped: int = 64,
+                 drop_window: float = 60.0):
+        self.max_subscribers = max_subscribers
+        self.max_queue = max_queue
+        self.policy = policy
+        self.max_dropped = max_dropped
+        self.drop_window = drop_window
+        self.subscribers: List[Subscriber] = []
+        self.published = 0
+        self.disconnected = 0
+        self.lock = threading.Lock()
+
+    def subscribe(self) -> Optional[Subscriber]:
+        with self.lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                return None
+            subscriber = Subscriber(self.max_queue, self.policy, self.max_dropped, self.drop_window)
+            self.subscribers.append(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscriber.close()
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    def has_subscribers(self) -> bool:
+        return bool(self.subscribers)
+
+    def publish(self, frame: bytes):
+        with self.lock:
+            self.published += 1
+            subscribers = list(self.subscribers)
+
+        for subscriber in subscribers:
+            subscriber.push(frame)
+            if subscriber.closed:
+                # too slow to keep up, the streaming handler notices and ends the response
+                with self.lock:
+                    if subscriber in self.subscribers:
+                        self.subscribers.remove(subscriber)
+                        self.disconnected += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'subscribers': len(self.subscribers),
+                'published': self.published,
+                'dropped': sum(subscriber.dropped for subscriber in self.subscribers),
+                'disconnected_slow': self.disconnected,
+                'policy': self.policy,
+            }
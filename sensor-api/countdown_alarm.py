@@ -1,7 +1,7 @@
 import time
-import RPi.GPIO as GPIO
-import board, busio
-import adafruit_character_lcd.character_lcd_i2c as character_lcd
+
+from display import LcdDisplay
+from hardware import GPIO, CharacterLCD
 
 # --- GPIO Setup ---
 GPIO.setmode(GPIO.BCM)
@@ -11,19 +11,17 @@ GPIO.setup(light_pin, GPIO.IN)
 # --- LCD Setup ---
 lcd_columns = 16
 lcd_rows = 2
-i2c = board.I2C()
-lcd = character_lcd.Character_LCD_I2C(i2c, lcd_columns, lcd_rows, address=0x21)
-lcd.clear()
+# schreibt nur geänderte Zeichen, im Hintergrund
+lcd = LcdDisplay(CharacterLCD(lcd_columns, lcd_rows, address=0x21), lcd_columns, lcd_rows)
 
 try:
     while True:
         light = GPIO.input(light_pin)  # 1 = hell, 0 = dunkel
-        
-        lcd.clear()
+
         if light:  # hell
-            lcd.message = "Modus: HELL\nBitte schatten!"
+            lcd.message("Modus: HELL\nBitte schatten!")
         else:  # dunkel
-            lcd.message = "Modus: DUNKEL\nAlles OK"
+            lcd.message("Modus: DUNKEL\nAlles OK")
         
         time.sleep(2)
 
@@ -32,3 +30,4 @@ except KeyboardInterrupt:
 finally:
     GPIO.cleanup()
     lcd.clear()
+    lcd.close()
@@ -0,0 +1,209 @@
+"""
+Shadow framebuffers for the Joy-Pi displays.
+
+Callers only change the wanted content, which never touches the bus. A
+background thread compares it with what the display currently shows and
+sends only the difference, at most `max_rate` times per second; content
+that changes faster is coalesced and only the newest frame is written.
+"""
+
+from abc import ABC, abstractmethod
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from structured_log import get_logger
+
+log = get_logger('display')
+
+
+class ShadowDisplay(ABC):
+    """Rate limited background writer shared by the display types."""
+
+    def __init__(self, max_rate: float = 20.0, start_thread: bool = True):
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.condition = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.dirty = False
+        self.closed = False
+        self.last_flush = 0.0
+        self.updates = 0
+        self.flushes = 0
+        self.thread: Optional[threading.Thread] = None
+        if start_thread:
+            self.thread = threading.Thread(target=self._run, name=f'display-{type(self).__name__}', daemon=True)
+            self.thread.start()
+
+    def _changed(self):
+        """Called with the condition held after the wanted content changed."""
+        self.updates += 1
+        self.dirty = True
+        self.condition.notify()
+
+    def flush(self):
+        """Writes the pending difference right away on the calling thread."""
+        # keeps frames in order when flush() is also called by the owner
+        with self.write_lock:
+            with self.condition:
+                frame = self._take_frame()
+                self.dirty = False
+            if frame is not None:
+                self._write(frame)
+                self.flushes += 1
+            self.last_flush = time.monotonic()
+
+    def close(self):
+        """Writes what is still pending and stops the background thread."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {'updates': self.updates, 'flushes': self.flushes}
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.dirty and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+            wait = self.last_flush + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                self.flush()
+            except Exception as exc:  # pylint: disable=broad-except
+                log.warning('display_update_failed', display=type(self).__name__, error=exc)
+
+    @abstractmethod
+    def _take_frame(self) -> Any:
+        """Called with the condition held: the difference to write, None when there is none."""
+
+    @abstractmethod
+    def _write(self, frame: Any):
+        """Sends a frame returned by `_take_frame` to the device."""
+
+
+class LcdDisplay(ShadowDisplay):
+    """Character LCD (adafruit Character_LCD API) that only rewrites changed cells.
+
+    Changed cells of a row are written as runs, each starting with one
+    cursor move. Runs that are only one unchanged cell apart are merged,
+    since rewriting that cell costs no more than another cursor move.
+    """
+
+    def __init__(self, lcd: Any, columns: int = 16, rows: int = 2, max_rate: float = 20.0, start_thread: bool = True):
+        self.lcd = lcd
+        self.columns = columns
+        self.rows = rows
+        self.wanted = [[' '] * columns for _ in range(rows)]
+        # what the display shows, known once the initial clear went out
+        self.shown: Optional[List[List[str]]] = None
+        self.cells_written = 0
+        self.cursor_moves = 0
+        self.clear_pending = True
+        super().__init__(max_rate, start_thread)
+
+    def message(self, text: str):
+        """Replaces the whole screen, lines are separated by '\\n'."""
+        lines = text.split('\n')
+        with self.condition:
+            for row in range(self.rows):
+                line = lines[row] if row < len(lines) else ''
+                self.wanted[row] = list(line[:self.columns].ljust(self.columns))
+            self._changed()
+
+    def write(self, column: int, row: int, text: str):
+        """Changes part of one row and keeps the rest of the screen."""
+        with self.condition:
+            for offset, character in enumerate(text[:max(self.columns - column, 0)]):
+                self.wanted[row][column + offset] = character
+            self._changed()
+
+    def clear(self):
+        self.message('')
+
+    def stats(self) -> Dict[str, int]:
+        stats = super().stats()
+        stats.update({'cells_written': self.cells_written, 'cursor_moves': self.cursor_moves})
+        return stats
+
+    def _take_frame(self) -> Optional[List[Tuple[int, int, str]]]:
+        if self.clear_pending:
+            self.clear_pending = False
+            self.shown = [[' '] * self.columns for _ in range(self.rows)]
+            runs: List[Tuple[int, int, str]] = [(-1, -1, '')]
+        else:
+            runs = []
+        for row in range(self.rows):
+            runs.extend(self._row_runs(row))
+        for column, row, text in runs:
+            if row >= 0:
+                self.shown[row][column:column + len(text)] = list(text)
+        return runs or None
+
+    def _row_runs(self, row: int) -> List[Tuple[int, int, str]]:
+        wanted, shown = self.wanted[row], self.shown[row]
+        changed = [column for column in range(self.columns) if wanted[column] != shown[column]]
+        runs: List[Tuple[int, int, str]] = []
+        start = end = None
+        for column in changed:
+            if start is not None and column - end <= 2:
+                end = column
+                continue
+            if start is not None:
+                runs.append((start, row, ''.join(wanted[start:end + 1])))
+            start = end = column
+        if start is not None:
+            runs.append((start, row, ''.join(wanted[start:end + 1])))
+        return runs
+
+    def _write(self, frame: List[Tuple[int, int, str]]):
+        for column, row, text in frame:
+            if row < 0:
+                # one clear on first use, the display content is unknown before
+                self.lcd.clear()
+                continue
+            self.lcd.cursor_position(column, row)
+            self.lcd.message = text
+            self.cursor_moves += 1
+            self.cells_written += len(text)
+
+
+class SegmentDisplay(ShadowDisplay):
+    """Four digit 7-segment display (adafruit Seg7x4) written in one go when it changed."""
+
+    def __init__(self, segments: Any, digits: int = 4, max_rate: float = 20.0, start_thread: bool = True):
+        self.segments = segments
+        self.segments.auto_write = False
+        self.digits = digits
+        self.wanted = ' ' * digits
+        self.shown: Optional[str] = None
+        super().__init__(max_rate, start_thread)
+
+    def text(self, text: str):
+        with self.condition:
+            self.wanted = text[-self.digits:].rjust(self.digits)
+            self._changed()
+
+    def number(self, number: float):
+        self.text(str(int(number)))
+
+    def clear(self):
+        self.text('')
+
+    def _take_frame(self) -> Optional[List[Tuple[int, str]]]:
+        shown = self.shown if self.shown is not None else ' ' * self.digits
+        changed = [(index, character) for index, character in enumerate(self.wanted)
+                   if self.shown is None or character != shown[index]]
+        self.shown = self.wanted
+        return changed or None
+
+    def _write(self, frame: List[Tuple[int, str]]):
+        for index, character in frame:
+            self.segments[index] = character
+        self.segments.show()
@@ -3,14 +3,24 @@
 # Author : www.modmypi.com
 # Link: https://www.modmypi.com/blog/hc-sr04-ultrasonic-range-sensor-on-the-raspberry-pi
 
-import RPi.GPIO as GPIO
+import statistics
+import threading
 import time
 
+from hardware import GPIO
+from structured_log import get_logger
+
+log = get_logger('distance_sensor')
+
 class DistanceSensor():
-    def __init__(self):
+    SPEED_OF_SOUND = 34300 / 2  # cm pro Sekunde, halbiert für Hin- und Rückweg
+    MIN_DISTANCE = 2            # Messbereich des HC-SR04 in cm
+    MAX_DISTANCE = 400
+
+    def __init__(self, timeout: float = 0.03, samples: int = 3, interval: float = 0.06, use_events: bool = True):
         GPIO.setmode(GPIO.BOARD) # Setze die GPIO Boardkonfiguration ein.
 
-        self.TRIG = 36    # Variablendeklaration 
+        self.TRIG = 36    # Variablendeklaration
         self.ECHO = 32    # Variablendeklaration
 
         GPIO.setup(self.TRIG,GPIO.OUT) # Variable TRIG als Output festlegen.
@@ -18,18 +28,104 @@ class DistanceSensor():
 
         GPIO.output(self.TRIG, False)
 
-    def read(self):
+        self.timeout = timeout    # maximale Wartezeit auf ein Echo in Sekunden
+        self.samples = samples    # Anzahl Messungen pro read()
+        self.interval = interval  # Abstand zwischen zwei Messungen (Datenblatt: >= 60ms)
+
+        self.lock = threading.Lock()
+        self.echo_done = threading.Event()
+        self.pulse_start = None
+        self.pulse_end = None
+
+        # Flanken per Interrupt erfassen statt in einer Schleife zu warten
+        self.use_events = use_events
+        if self.use_events:
+            try:
+                GPIO.add_event_detect(self.ECHO, GPIO.BOTH, callback=self._on_echo_edge)
+            except RuntimeError as exc:
+                log.warning('edge_detection_unavailable', pin=self.ECHO, error=exc)
+                self.use_events = False
+
+    @property
+    def read_budget(self) -> float:
+        """Upper bound in seconds for a single read() call."""
+        return self.samples * max(self.timeout, self.interval)
+
+    def _on_echo_edge(self, channel):
+        now = time.perf_counter_ns()
+        # erste Flanke nach dem Trigger ist die steigende, zweite die fallende
+        if self.pulse_start is None:
+            self.pulse_start = now
+        elif self.pulse_end is None:
+            self.pulse_end = now
+            self.echo_done.set()
+
+    def _trigger(self):
         GPIO.output(self.TRIG, True)  # Sendet ein Ultraschallsignal
         time.sleep(0.00001)      # Wartet 0,00001 Sekunden
         GPIO.output(self.TRIG, False) # Beendet das senden des Ultraschallsignals
 
+    def _measure_with_events(self) -> int:
+        self.pulse_start = None
+        self.pulse_end = None
+        self.echo_done.clear()
+
+        self._trigger()
+
+        if not self.echo_done.wait(self.timeout):
+            raise TimeoutError('no echo received')
+        return self.pulse_end - self.pulse_start
+
+    def _measure_with_polling(self) -> int:
+        self._trigger()
+
+        deadline = time.perf_counter_ns() + int(self.timeout * 1e9)
+        pulse_start = pulse_end = time.perf_counter_ns()
         while GPIO.input(self.ECHO)==0:
-            pulse_start = time.time()
+            pulse_start = time.perf_counter_ns()
+            if pulse_start > deadline:
+                raise TimeoutError('no echo received')
 
         while GPIO.input(self.ECHO)==1:
-            pulse_end = time.time()
+            pulse_end = time.perf_counter_ns()
+            if pulse_end > deadline:
+                raise TimeoutError('echo did not end')
+
+        return pulse_end - pulse_start
+
+    def measure(self) -> float:
+        """Single measurement in cm, raises TimeoutError when the echo is lost."""
+        if self.use_events:
+            pulse_duration = self._measure_with_events()
+        else:
+            pulse_duration = self._measure_with_polling()
+
+        return pulse_duration / 1e9 * self.SPEED_OF_SOUND  # Berechnung zur Bestimmung der Entfernung.
+
+    def read(self):
+        """Median of a burst of measurements with outliers removed."""
+        with self.lock:
+            distances = []
+            for i in range(self.samples):
+                started = time.perf_counter()
+                try:
+                    distance = self.measure()
+                    if self.MIN_DISTANCE <= distance <= self.MAX_DISTANCE:
+                        distances.append(distance)
+                except TimeoutError:
+                    pass
+                if i < self.samples - 1:
+                    # Restzeit bis zur nächsten Messung schlafen statt warten
+                    time.sleep(max(0, self.interval - (time.perf_counter() - started)))
+
+        if not distances:
+            raise TimeoutError(f'no valid echo in {self.samples} measurements')
+
+        median = statistics.median(distances)
+        # Ausreisser verwerfen: mehr als 3 mittlere absolute Abweichungen vom Median
+        deviation = statistics.median([abs(d - median) for d in distances])
+        kept = [d for d in distances if abs(d - median) <= max(3 * deviation, 1)]
 
-        pulse_duration = pulse_end - pulse_start # Berechnung für die Dauer Des Pulses
-        distance = pulse_duration * 17150  # Berechnung zur Bestimmung der Entfernung.
+        distance = statistics.median(kept)
         distance = round(distance, 2)      # Ergebnis wird auf 2 Nachkommastellen gerundet.
-        return distance
\ No newline at end of file
+        return distance
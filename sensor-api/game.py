@@ -3,21 +3,20 @@
 
 import time
 import random
-import RPi.GPIO as GPIO
-import board, busio
-import adafruit_character_lcd.character_lcd_i2c as character_lcd
-from adafruit_ht16k33.segments import Seg7x4
+
+from actuators import ActuatorTimeline
+from display import LcdDisplay, SegmentDisplay
+from hardware import GPIO, CharacterLCD, Seg7x4
+from input_events import Buttons, EventQueue
 
 # --- I2C Setup ---
-i2c = board.I2C()
+# beide Anzeigen schreiben im Hintergrund nur Änderungen, die Spielschleife wartet nie auf den Bus
 # 7-Segment Display
-seg_display = Seg7x4(i2c, address=0x70)
-seg_display.fill(0)
+seg_display = SegmentDisplay(Seg7x4(address=0x70))
 # LCD Display
 lcd_columns = 16
 lcd_rows = 2
-lcd = character_lcd.Character_LCD_I2C(i2c, lcd_columns, lcd_rows, address=0x21)
-lcd.clear()
+lcd = LcdDisplay(CharacterLCD(lcd_columns, lcd_rows, address=0x21), lcd_columns, lcd_rows)
 
 # --- GPIO Setup ---
 buzzer_pin = 18
@@ -26,32 +25,24 @@ button_pins = [5, 6, 13, 19]  # Taster für Zahlen 0-3
 
 GPIO.setup(buzzer_pin, GPIO.OUT)
 GPIO.setup(vibration_pin, GPIO.OUT)
-for pin in button_pins:
-    GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+# Buzzer und Vibration laufen im Hintergrund, die Spielschleife wartet nicht darauf
+actuators = ActuatorTimeline()
+# Flankenerkennung statt Dauerabfrage, jeder Druck kommt mit Zeitstempel in die Queue
+events = EventQueue()
+buttons = Buttons(button_pins, events)
 
 # --- Funktionen ---
 def buzzer_beep(times=1, duration=0.2):
-    for _ in range(times):
-        GPIO.output(buzzer_pin, True)
-        time.sleep(duration)
-        GPIO.output(buzzer_pin, False)
-        time.sleep(0.1)
+    return actuators.pulse(buzzer_pin, duration, times, gap=0.1, channel='buzzer')
 
 def vibrate(duration=0.5):
-    GPIO.output(vibration_pin, True)
-    time.sleep(duration)
-    GPIO.output(vibration_pin, False)
+    return actuators.pulse(vibration_pin, duration, channel='vibration')
 
 def show_number_7seg(number):
-    seg_display.fill(0)
-    str_num = str(int(number)).rjust(4)
-    for i, char in enumerate(str_num):
-        seg_display[i] = char if char != ' ' else ' '
-    seg_display.show()
+    seg_display.number(number)
 
 def show_lcd_message(message):
-    lcd.clear()
-    lcd.message = message
+    lcd.message(message)
 
 # --- Spiel-Logik ---
 try:
@@ -62,32 +53,33 @@ try:
         # Zufällige Zahl auswählen
         number = random.randint(0, 3)
         show_lcd_message(f"Drücke Zahl:\n{number}")
-        start_time = time.time()
+        # Zeit erst starten, wenn die Zahl wirklich auf dem LCD steht
+        lcd.flush()
+        events.clear()
+        start_ns = time.perf_counter_ns()
 
-        pressed = False
-        while not pressed:
-            for i, pin in enumerate(button_pins):
-                if GPIO.input(pin):
-                    reaction_time = time.time() - start_time
-                    if i == number:
-                        # richtig gedrückt
-                        show_lcd_message(f"Richtig!\n{reaction_time:.2f}s")
-                        show_number_7seg(reaction_time)
-                    else:
-                        # falsch gedrückt
-                        show_lcd_message("FALSCH!")
-                        buzzer_beep(2, 0.2)
-                        vibrate(0.5)
-                        show_number_7seg(0)
-                    pressed = True
-                    time.sleep(1)
-                    break
+        # blockiert ohne CPU-Last bis zum nächsten Tastendruck
+        event = events.next_press()
+        reaction_time = (event.time_ns - start_ns) / 1e9
+        if button_pins.index(event.source) == number:
+            # richtig gedrückt
+            show_lcd_message(f"Richtig!\n{reaction_time:.2f}s")
+            show_number_7seg(reaction_time)
+        else:
+            # falsch gedrückt
+            show_lcd_message("FALSCH!")
+            buzzer_beep(2, 0.2)
+            vibrate(0.5)
+            show_number_7seg(0)
+        time.sleep(1)
 
 except KeyboardInterrupt:
-    lcd.clear()
-    lcd.message = "Spiel beendet"
+    lcd.message("Spiel beendet")
 finally:
+    buttons.close()
+    actuators.close()
     GPIO.cleanup()
-    seg_display.fill(0)
-    seg_display.show()
+    seg_display.clear()
+    seg_display.close()
     lcd.clear()
+    lcd.close()
@@ -0,0 +1,90 @@
+"""
+Hardware access for the sensor modules.
+
+SENSOR_BACKEND=pi (default) uses RPi.GPIO, smbus/smbus2, dht11, adafruit_dht,
+adafruit_character_lcd, adafruit_ht16k33, luma.led_matrix and paho-mqtt.
+SENSOR_BACKEND=sim swaps all of them for the simulated devices in
+sim_hardware.py, so the modules can run on any Linux box.
+"""
+
+import os
+from typing import Any
+
+BACKEND = os.getenv('SENSOR_BACKEND', 'pi')
+
+if BACKEND == 'sim':
+    import sim_hardware
+    GPIO: Any = sim_hardware.GPIO
+else:
+    import RPi.GPIO as GPIO
+
+
+def SMBus(bus: int = 1):
+    if BACKEND == 'sim':
+        return sim_hardware.SimSMBus(bus)
+    try:
+        import smbus2
+        return smbus2.SMBus(bus)
+    except ImportError:
+        import smbus
+        return smbus.SMBus(bus)
+
+
+def DHT11(pin: int):
+    """Sensor object of the `dht11` package (BOARD pin numbering)."""
+    if BACKEND == 'sim':
+        return sim_hardware.SimDHT11(pin)
+    import dht11
+    return dht11.DHT11(pin=pin)
+
+
+def AdafruitDHT11(bcm_pin: int):
+    """Sensor object of the `adafruit_dht` package (BCM pin numbering)."""
+    if BACKEND == 'sim':
+        return sim_hardware.SimAdafruitDHT11(bcm_pin)
+    import adafruit_dht
+    import board
+    return adafruit_dht.DHT11(getattr(board, f'D{bcm_pin}'), use_pulseio=False)
+
+
+def CharacterLCD(columns: int = 16, rows: int = 2, address: int = 0x21):
+    """Character LCD of the Joy-Pi on the I2C backpack (adafruit_character_lcd)."""
+    if BACKEND == 'sim':
+        return sim_hardware.SimCharacterLCD(columns, rows)
+    import adafruit_character_lcd.character_lcd_i2c as character_lcd
+    import board
+    return character_lcd.Character_LCD_I2C(board.I2C(), columns, rows, address=address)
+
+
+def Seg7x4(address: int = 0x70):
+    """Four digit 7-segment display on the HT16K33 (adafruit_ht16k33)."""
+    if BACKEND == 'sim':
+        return sim_hardware.SimSeg7x4()
+    from adafruit_ht16k33.segments import Seg7x4 as HT16K33Seg7x4
+    import board
+    return HT16K33Seg7x4(board.I2C(), address=address)
+
+
+def LedMatrix(cascaded: int = 1, block_orientation: int = 0, rotate: int = 0):
+    """MAX7219 LED matrix on SPI 0.0 (luma.led_matrix)."""
+    if BACKEND == 'sim':
+        return sim_hardware.SimMax7219(cascaded)
+    from luma.core.interface.serial import noop, spi
+    from luma.led_matrix.device import max7219
+    serial = spi(port=0, device=0, gpio=noop())
+    return max7219(serial, cascaded=cascaded, block_orientation=block_orientation, rotate=rotate)
+
+
+def MatrixFont():
+    """Proportional CP437 font of luma, as used by `show_message`."""
+    if BACKEND == 'sim':
+        return sim_hardware.SimMatrixFont()
+    from luma.core.legacy.font import CP437_FONT, proportional
+    return proportional(CP437_FONT)
+
+
+def MqttClient():
+    if BACKEND == 'sim':
+        return sim_hardware.SimMqttClient()
+    import paho.mqtt.client as mqtt
+    return mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
@@ -0,0 +1,106 @@
+from array import array
+from bisect import bisect_left
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class RingBuffer():
+    """Fixed size history of (timestamp, value) samples.
+
+    Both columns are preallocated `array('d')` instances, so the memory use
+    is 16 bytes per slot no matter how long the process runs.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.start = 0
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def append(self, value: float, timestamp: Optional[float] = None):
+        if timestamp is None:
+            timestamp = time.time()
+        with self.lock:
+            index = (self.start + self.size) % self.capacity
+            self.timestamps[index] = timestamp
+            self.values[index] = value
+            if self.size < self.capacity:
+                self.size += 1
+            else:
+                self.start = (self.start + 1) % self.capacity
+
+    def since(self, since: float):
+        """Returns copies of the timestamp and value columns newer than `since`."""
+        with self.lock:
+            if self.start + self.size <= self.capacity:
+                timestamps = self.timestamps[self.start:self.start + self.size]
+                values = self.values[self.start:self.start + self.size]
+            else:
+                timestamps = self.timestamps[self.start:] + self.timestamps[:self.start + self.size - self.capacity]
+                values = self.values[self.start:] + self.values[:self.start + self.size - self.capacity]
+
+        first = bisect_left(timestamps, since)
+        return timestamps[first:], values[first:]
+
+    def buckets(self, since: float, step: float) -> List[Dict[str, Any]]:
+        timestamps, values = self.since(since)
+
+        result: List[Dict[str, Any]] = []
+        bucket_index = -1
+        for timestamp, value in zip(timestamps, values):
+            index = int((timestamp - since) // step)
+            if index != bucket_index:
+                bucket_index = index
+                bucket = {'t': since + index * step, 'min': value, 'max': value, 'sum': value, 'count': 1}
+                result.append(bucket)
+                continue
+            if value < bucket['min']:
+                bucket['min'] = value
+            if value > bucket['max']:
+                bucket['max'] = value
+            bucket['sum'] += value
+            bucket['count'] += 1
+
+        for bucket in result:
+            bucket['avg'] = round(bucket.pop('sum') / bucket['count'], 2)
+        return result
+
+
+class SensorHistory():
+    """One ring buffer per sensor name."""
+
+    MAX_BUCKETS = 1000
+
+    def __init__(self, sensors: List[str], capacity: int):
+        self.buffers = {sensor: RingBuffer(capacity) for sensor in sensors}
+
+    def record(self, sensor: str, value: Any, timestamp: Optional[float] = None):
+        buffer = self.buffers.get(sensor)
+        if buffer is None or not isinstance(value, (int, float)):
+            return
+        buffer.append(float(value), timestamp)
+
+    def query(self, sensor: str, since: float, step: float) -> Dict[str, Any]:
+        if sensor not in self.buffers:
+            raise KeyError(f'unknown sensor {sensor!r}')
+        if step <= 0:
+            raise ValueError('step must be positive')
+
+        now = time.time()
+        if since <= 0:
+            # negative values are relative to now, e.g. since=-3600
+            since = now + since
+        # keep the response small even for long ranges with a tiny step
+        step = max(step, (now - since) / self.MAX_BUCKETS)
+        # align the buckets so repeated queries return stable bucket starts
+        since -= since % step
+
+        return {
+            'sensor': sensor,
+            'since': since,
+            'step': step,
+            'buckets': self.buffers[sensor].buckets(since, step),
+        }
@@ -0,0 +1,140 @@
+from concurrent.futures import Future
+import contextlib
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from hardware import SMBus
+
+
+class DeviceStats():
+    def __init__(self):
+        self.transactions = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.total_wait = 0.0
+        self.last_error: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        average = self.total_latency / self.transactions if self.transactions else 0.0
+        average_wait = self.total_wait / self.transactions if self.transactions else 0.0
+        return {
+            'transactions': self.transactions,
+            'errors': self.errors,
+            'avg_latency_ms': round(average * 1000, 3),
+            'max_latency_ms': round(self.max_latency * 1000, 3),
+            'avg_queue_wait_ms': round(average_wait * 1000, 3),
+            'last_error': self.last_error,
+        }
+
+
+class I2CBus():
+    """Serializes every transaction on one I2C bus through a single worker.
+
+    Callers get a Future back (submit) or block until their transaction ran
+    (transaction and the smbus style helpers). Latency and errors are
+    counted per device address.
+    """
+
+    def __init__(self, number: int, bus: Any = None):
+        self.number = number
+        self.bus = bus if bus is not None else SMBus(number)
+        self.queue: 'queue.Queue[tuple]' = queue.Queue()
+        self.devices: Dict[int, DeviceStats] = {}
+        self.lock = threading.Lock()
+        threading.Thread(target=self._work, name=f'i2c-{number}', daemon=True).start()
+
+    def submit(self, address: int, operation: Callable[[Any], Any]) -> Future:
+        future: Future = Future()
+        self.queue.put((address, operation, future, time.perf_counter()))
+        return future
+
+    def transaction(self, address: int, operation: Callable[[Any], Any], timeout: Optional[float] = None) -> Any:
+        return self.submit(address, operation).result(timeout)
+
+    def read_i2c_block_data(self, address: int, register: int, length: int = 32) -> List[int]:
+        return self.transaction(address, lambda bus: bus.read_i2c_block_data(address, register, length))
+
+    def write_byte(self, address: int, value: int):
+        return self.transaction(address, lambda bus: bus.write_byte(address, value))
+
+    def read_bytes(self, address: int, length: int) -> List[int]:
+        """Plain read of `length` bytes, without sending a command or register byte first."""
+        return self.transaction(address, lambda bus: _read_bytes(bus, address, length))
+
+    @contextlib.contextmanager
+    def exclusive(self, address: int = -1) -> Iterator[Any]:
+        """Holds the bus for drivers that talk to it directly (e.g. board.I2C())."""
+        acquired = threading.Event()
+        release = threading.Event()
+
+        def hold(bus):
+            acquired.set()
+            release.wait()
+
+        future = self.submit(address, hold)
+        acquired.wait()
+        try:
+            yield self.bus
+        finally:
+            release.set()
+            future.result()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            return {hex(address): device.as_dict() for address, device in self.devices.items() if address >= 0}
+
+    def _work(self):
+        while True:
+            address, operation, future, queued = self.queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            started = time.perf_counter()
+            try:
+                result = operation(self.bus)
+                error = None
+            except Exception as exc:  # pylint: disable=broad-except
+                result = None
+                error = exc
+            finished = time.perf_counter()
+
+            with self.lock:
+                device = self.devices.setdefault(address, DeviceStats())
+                device.transactions += 1
+                device.total_latency += finished - started
+                device.max_latency = max(device.max_latency, finished - started)
+                device.total_wait += started - queued
+                if error is not None:
+                    device.errors += 1
+                    device.last_error = str(error)
+
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+def _read_bytes(bus: Any, address: int, length: int) -> List[int]:
+    read_bytes = getattr(bus, 'read_bytes', None)
+    if read_bytes is not None:
+        return read_bytes(address, length)
+    # smbus2, python-smbus has no plain multi byte read
+    from smbus2 import i2c_msg  # pylint: disable=import-outside-toplevel
+    message = i2c_msg.read(address, length)
+    bus.i2c_rdwr(message)
+    return list(message)
+
+
+buses: Dict[int, I2CBus] = {}
+buses_lock = threading.Lock()
+
+
+def get_bus(number: int = 1) -> I2CBus:
+    """Returns the process wide manager for an I2C bus, opening it on first use."""
+    with buses_lock:
+        if number not in buses:
+            buses[number] = I2CBus(number)
+        return buses[number]
@@ -0,0 +1,206 @@
+"""
+Debounced, timestamped input events for the Joy-Pi buttons.
+
+Buttons on their own GPIO pin use edge detection, the 4x4 button matrix is
+scanned by a background thread. Both put InputEvents into an EventQueue;
+every event carries the `time.perf_counter_ns()` of the first edge (or
+scan) that showed the change, so debouncing never delays the timestamp.
+"""
+
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+from hardware import GPIO
+from structured_log import get_logger
+
+log = get_logger('input_events')
+
+
+class InputEvent(NamedTuple):
+    source: Any       # GPIO pin or matrix button id
+    pressed: bool     # False for a release
+    time_ns: int      # time.perf_counter_ns() of the change
+
+
+class EventQueue():
+    """Bounded queue of input events; when full the oldest event is dropped."""
+
+    def __init__(self, maxsize: int = 256):
+        self.events: 'queue.Queue[InputEvent]' = queue.Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, event: InputEvent):
+        while True:
+            try:
+                self.events.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.events.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: Optional[float] = None) -> Optional[InputEvent]:
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def next_press(self, timeout: Optional[float] = None, sources: Optional[Iterable[Any]] = None) -> Optional[InputEvent]:
+        """Waits for the next press (of one of `sources`), releases are skipped."""
+        sources = set(sources) if sources is not None else None
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            remaining = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+            event = self.get(remaining)
+            if event is None:
+                return None
+            if event.pressed and (sources is None or event.source in sources):
+                return event
+
+    def clear(self):
+        """Drops everything that was pressed before, e.g. before a new round."""
+        while True:
+            try:
+                self.events.get_nowait()
+            except queue.Empty:
+                return
+
+
+class Buttons():
+    """Buttons on single GPIO pins, reported through edge detection.
+
+    The first edge that changes the state is reported right away; edges in
+    the following `debounce` seconds are ignored and the level is checked
+    again once the window is over, so a bounce can never hide a release.
+    """
+
+    def __init__(self, pins: Sequence[int], events: EventQueue, active_high: bool = True, debounce: float = 0.02):
+        self.pins = list(pins)
+        self.events = events
+        self.active_high = active_high
+        self.debounce_ns = int(debounce * 1e9)
+        self.lock = threading.Lock()
+        self.pressed: Dict[int, bool] = {}
+        self.changed_ns: Dict[int, int] = {}
+        self.polling = False
+
+        pull = GPIO.PUD_DOWN if active_high else GPIO.PUD_UP
+        for pin in self.pins:
+            GPIO.setup(pin, GPIO.IN, pull_up_down=pull)
+            self.pressed[pin] = self._is_pressed(pin)
+            self.changed_ns[pin] = 0
+            try:
+                GPIO.add_event_detect(pin, GPIO.BOTH, callback=self._on_edge)
+            except RuntimeError as exc:
+                # e.g. edge detection is not available, poll in the background instead
+                log.warning('edge_detect_failed', pin=pin, error=exc, fallback='polling')
+                self.polling = True
+        if self.polling:
+            threading.Thread(target=self._poll, name='buttons-poll', daemon=True).start()
+
+    def close(self):
+        self.polling = False
+        for pin in self.pins:
+            GPIO.remove_event_detect(pin)
+
+    def _is_pressed(self, pin: int) -> bool:
+        return bool(GPIO.input(pin)) == self.active_high
+
+    def _on_edge(self, pin: int):
+        now = time.perf_counter_ns()
+        with self.lock:
+            if now - self.changed_ns[pin] < self.debounce_ns:
+                return
+            pressed = self._is_pressed(pin)
+            if pressed == self.pressed[pin]:
+                return
+            self.pressed[pin] = pressed
+            self.changed_ns[pin] = now
+        self.events.put(InputEvent(pin, pressed, now))
+        settle = threading.Timer(self.debounce_ns / 1e9, self._settle, args=(pin,))
+        settle.daemon = True
+        settle.start()
+
+    def _settle(self, pin: int):
+        # the level after the bounce window wins, edges inside it were ignored
+        self._on_edge(pin)
+
+    def _poll(self):
+        while self.polling:
+            for pin in self.pins:
+                if self._is_pressed(pin) != self.pressed[pin]:
+                    self._on_edge(pin)
+            time.sleep(0.001)
+
+
+class MatrixScanner():
+    """Scans a button matrix on a background thread.
+
+    Columns are driven low one after another and the rows (pulled up) are
+    read. A button changes state after `debounce_scans` identical scans,
+    the event keeps the time of the first of them.
+    """
+
+    def __init__(self, row_pins: Sequence[int], column_pins: Sequence[int], button_ids: Sequence[Sequence[Any]],
+                 events: EventQueue, interval: float = 0.001, debounce_scans: int = 3):
+        self.row_pins = list(row_pins)
+        self.column_pins = list(column_pins)
+        self.button_ids = [list(row) for row in button_ids]
+        self.events = events
+        self.interval = interval
+        self.debounce_scans = debounce_scans
+        self.running = True
+        self.scans = 0
+
+        for pin in self.row_pins:
+            GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        for pin in self.column_pins:
+            GPIO.setup(pin, GPIO.OUT)
+            GPIO.output(pin, 1)
+
+        buttons = [button for row in self.button_ids for button in row]
+        self.pressed = {button: False for button in buttons}
+        # candidate state, how many scans it was seen and when it was first seen
+        self.candidate = {button: False for button in buttons}
+        self.seen = {button: 0 for button in buttons}
+        self.first_ns = {button: 0 for button in buttons}
+
+        self.thread = threading.Thread(target=self._run, name='matrix-scanner', daemon=True)
+        self.thread.start()
+
+    @property
+    def buttons(self) -> List[Any]:
+        return list(self.pressed)
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+
+    def scan(self) -> Dict[Any, bool]:
+        levels = {}
+        for column, column_pin in enumerate(self.column_pins):
+            GPIO.output(column_pin, 0)
+            for row, row_pin in enumerate(self.row_pins):
+                levels[self.button_ids[row][column]] = GPIO.input(row_pin) == 0
+            GPIO.output(column_pin, 1)
+        return levels
+
+    def _run(self):
+        while self.running:
+            now = time.perf_counter_ns()
+            for button, pressed in self.scan().items():
+                if pressed != self.candidate[button]:
+                    self.candidate[button] = pressed
+                    self.seen[button] = 1
+                    self.first_ns[button] = now
+                elif self.seen[button] < self.debounce_scans:
+                    self.seen[button] += 1
+                if self.seen[button] >= self.debounce_scans and pressed != self.pressed[button]:
+                    self.pressed[button] = pressed
+                    self.events.put(InputEvent(button, pressed, self.first_ns[button]))
+            self.scans += 1
+            time.sleep(self.interval)
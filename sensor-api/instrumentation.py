@@ -0,0 +1,190 @@
+"""
+Minimal Prometheus / OpenMetrics instrumentation.
+
+Every labelled child is updated without a lock: each child is written by a
+single thread (the sampling scheduler, the MQTT publisher tick) and plain
+attribute updates are safe under the GIL in that case. Values that already
+exist elsewhere (e.g. the DHT11 invalid count) are read through functions at
+scrape time instead of being mirrored on every update.
+"""
+
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def format_value(value: float) -> str:
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class CounterChild():
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def set_function(self, function: Callable[[], float]):
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class GaugeChild(CounterChild):
+    def set(self, value: float):
+        self.value = value
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+
+class Timer():
+    def __init__(self, child: 'HistogramChild'):
+        self.child = child
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.started)
+
+
+class HistogramChild():
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> Timer:
+        return Timer(self)
+
+
+class Metric(ABC):
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: Optional['Registry'] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children: Dict[Tuple[str, ...], object] = {}
+        self.lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    @abstractmethod
+    def _new_child(self):
+        """A child holding the value of one label combination."""
+
+    def labels(self, *values: str):
+        key = tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            # only creating a child takes the lock, updates never do
+            with self.lock:
+                child = self.children.setdefault(key, self._new_child())
+        return child
+
+    @abstractmethod
+    def samples(self, openmetrics: bool) -> List[str]:
+        """The sample lines of every child."""
+
+    def render(self, openmetrics: bool) -> List[str]:
+        name = self.name
+        if openmetrics and self.kind == 'counter' and name.endswith('_total'):
+            name = name[:-len('_total')]
+        return [f'# HELP {name} {self.documentation}', f'# TYPE {name} {self.kind}'] + self.samples(openmetrics)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return CounterChild()
+
+    def samples(self, openmetrics: bool) -> List[str]:
+        return [f'{self.name}{format_labels(self.labelnames, key)} {format_value(child.get())}'
+                for key, child in list(self.children.items())]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return GaugeChild()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional['Registry'] = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+
+    def samples(self, openmetrics: bool) -> List[str]:
+        lines = []
+        for key, child in list(self.children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += count
+                le = 'le="%s"' % format_value(bound)
+                lines.append(f'{self.name}_bucket{format_labels(self.labelnames, key, le)} {cumulative}')
+            lines.append(f'{self.name}_count{format_labels(self.labelnames, key)} {child.count}')
+            lines.append(f'{self.name}_sum{format_labels(self.labelnames, key)} {format_value(child.sum)}')
+        return lines
+
+
+class Registry():
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric):
+        self.metrics.append(metric)
+
+    def render(self, openmetrics: bool = False) -> bytes:
+        """All metrics with at least one child; OpenMetrics output ends with '# EOF'."""
+        lines: List[str] = []
+        for metric in self.metrics:
+            if metric.children:
+                lines.extend(metric.render(openmetrics))
+        if openmetrics:
+            lines.append('# EOF')
+        return ('\n'.join(lines) + '\n').encode() if lines else b''
+
+
+REGISTRY = Registry()
+
+
+def wants_openmetrics(accept: Optional[str]) -> bool:
+    return accept is not None and 'application/openmetrics-text' in accept
@@ -0,0 +1,77 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from structured_log import get_logger
+
+log = get_logger('lazy_device')
+
+
+class LazyDevice():
+    """Creates a device on a background thread so startup never waits for hardware.
+
+    A failing `factory` is retried with exponential backoff from `retry` up to
+    `max_retry` seconds. Until the device is ready `get()` returns None.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any], retry: float = 1.0, max_retry: float = 30.0):
+        self.name = name
+        self.factory = factory
+        self.retry = retry
+        self.max_retry = max_retry
+        self.instance: Any = None
+        self.state = 'pending'
+        self.attempts = 0
+        self.error: Optional[str] = None
+        self.init_seconds: Optional[float] = None
+        self.ready_since: Optional[float] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._initialize, name=f'init-{self.name}', daemon=True)
+            self.thread.start()
+
+    def get(self) -> Any:
+        return self.instance
+
+    @property
+    def ready(self) -> bool:
+        return self.instance is not None
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        if self.thread is not None:
+            self.thread.join(timeout)
+        return self.ready
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'attempts': self.attempts,
+            'error': self.error,
+            'init_ms': round(self.init_seconds * 1000, 1) if self.init_seconds is not None else None,
+            'ready_since': self.ready_since,
+        }
+
+    def _initialize(self):
+        delay = self.retry
+        while True:
+            self.state = 'initializing'
+            self.attempts += 1
+            started = time.perf_counter()
+            try:
+                instance = self.factory()
+            except Exception as exc:  # pylint: disable=broad-except
+                self.state = 'failed'
+                self.error = str(exc)
+                log.warning('device_init_failed', device=self.name, error=exc, retry_in=delay)
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_retry)
+                continue
+
+            self.init_seconds = time.perf_counter() - started
+            self.error = None
+            self.ready_since = time.time()
+            self.instance = instance
+            self.state = 'ready'
+            return
@@ -3,23 +3,74 @@
 # Copyright (c) 2017-18 Richard Hull and contributors
 # License: https://github.com/rm-hull/luma.led_matrix/blob/master/LICENSE.rst
 
+import os
 import time
-from luma.led_matrix.device import max7219
-from luma.core.interface.serial import spi, noop
-from luma.core.legacy import show_message
-from luma.core.legacy.font import proportional, CP437_FONT
+
+from hardware import LedMatrix, MatrixFont, MqttClient
+from matrix_renderer import MatrixRenderer
+
+MQTT_BROKER_HOST = os.getenv('MQTT_BROKER_HOST', '192.168.1.129')
+MQTT_BROKER_PORT = int(os.getenv('MQTT_BROKER_PORT', '1883'))
+NODE_ID = os.getenv('NODE_ID') or None
+# light oder distance: zeigt den Live-Wert vom webserver.py statt der festen Nachricht
+MATRIX_SENSOR = os.getenv('MATRIX_SENSOR') or None
+MATRIX_FPS = float(os.getenv('MATRIX_FPS', '10'))
+
+UNITS = {'light': 'lx', 'distance': 'cm'}
+
+
+def follow_sensor(renderer, sensor):
+    """Abonniert den MQTT-Topic des Sensors, jeder neue Wert ersetzt den Text sofort."""
+    topic = 'mondaymorning/sensors/' + (f'{NODE_ID}/' if NODE_ID else '') + sensor
+
+    def on_connect(client, userdata, flags, reason_code, properties=None):  # pylint: disable=unused-argument
+        client.subscribe(topic, qos=0)
+
+    def on_message(client, userdata, message):  # pylint: disable=unused-argument
+        try:
+            value = float(message.payload)
+        except ValueError:
+            return
+        renderer.set_text(f"{value:.0f} {UNITS.get(sensor, '')}".strip())
+
+    client = MqttClient()
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect_async(MQTT_BROKER_HOST, MQTT_BROKER_PORT, 60)
+    client.loop_start()
+    return client
+
 
 def main(cascaded=1, block_orientation=0, rotate=0):
-    # Matrix-Gerät erstellen
-    serial = spi(port=0, device=0, gpio=noop())  # Achte auf 'device=0' statt 1
-    device = max7219(serial, cascaded=cascaded, block_orientation=block_orientation, rotate=rotate)
+    # Matrix-Gerät erstellen (SPI port 0, device 0)
+    device = LedMatrix(cascaded=cascaded, block_orientation=block_orientation, rotate=rotate)
+    # Glyphen werden einmal gerastert, die Frames schreibt ein Hintergrund-Thread
+    renderer = MatrixRenderer(device, MatrixFont(), fps=MATRIX_FPS)
 
     print("[-] Matrix initialized")
 
     msg = "Hallo Welt"
     print("[-] Printing: %s" % msg)
+    renderer.set_text(msg, restart=True)
+
+    try:
+        if MATRIX_SENSOR is None:
+            # einmal durchlaufen lassen, wie früher show_message
+            time.sleep(renderer.pass_seconds())
+        else:
+            client = follow_sensor(renderer, MATRIX_SENSOR)
+            try:
+                while True:
+                    time.sleep(60)
+                    print("[-] Matrix: %s" % renderer.stats())
+            finally:
+                client.loop_stop()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        renderer.close()
+        print("[-] Matrix: %s" % renderer.stats())
 
-    show_message(device, msg, fill="white", font=proportional(CP437_FONT), scroll_delay=0.1)
 
 if __name__ == "__main__":
     main()
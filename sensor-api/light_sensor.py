@@ -1,13 +1,18 @@
-import RPi.GPIO as GPIO
-import smbus
+import time
+
+from hardware import GPIO
+from i2c_bus import get_bus
 
 if(GPIO.RPI_REVISION == 1):
-    bus = smbus.SMBus(0)
+    bus = get_bus(0)
 else:
-    bus = smbus.SMBus(1)
+    bus = get_bus(1)
+
+# Messzeit einer Wandlung im High-Res Modus laut Datenblatt (max. 180ms)
+CONVERSION_TIME = 0.18
 
 class LightSensor():
-    def __init__(self):
+    def __init__(self, mode=None):
         # Definiere Konstante vom Datenblatt
 
         self.DEVICE = 0x5c # Standart I2C Geräteadresse
@@ -32,6 +37,15 @@ class LightSensor():
         # Nach messung wird Gerät in einen inaktiven Zustand gesetzt.
         self.ONE_TIME_LOW_RES_MODE = 0x23
 
+        # Im Dauermodus misst der Sensor selbstständig weiter, ein read
+        # liefert sofort die letzte fertige Messung statt 120-180ms zu warten.
+        self.mode = mode if mode is not None else self.CONTINUOUS_HIGH_RES_MODE_1
+        self.ready_at = 0.0
+        self.continuous = self.mode in (self.CONTINUOUS_LOW_RES_MODE, self.CONTINUOUS_HIGH_RES_MODE_1, self.CONTINUOUS_HIGH_RES_MODE_2)
+        if self.continuous:
+            bus.write_byte(self.DEVICE, self.POWER_ON)
+            bus.write_byte(self.DEVICE, self.mode)
+            self.ready_at = time.monotonic() + CONVERSION_TIME
 
     def convertToNumber(self, data):
         # Einfache Funktion um 2 Bytes Daten
@@ -39,5 +53,20 @@ class LightSensor():
         return ((data[1] + (256 * data[0])) / 1.2)
 
     def readLight(self):
-        data = bus.read_i2c_block_data(self.DEVICE, self.ONE_TIME_HIGH_RES_MODE_1)
-        return self.convertToNumber(data)
\ No newline at end of file
+        # erste Messung im Dauermodus abwarten
+        wait = self.ready_at - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+        if self.continuous:
+            # Dauermodus: nur die 2 Ergebnis-Bytes lesen. Ein erneutes Senden
+            # des Modus-Befehls würde die laufende Wandlung neu starten.
+            data = bus.read_bytes(self.DEVICE, 2)
+        else:
+            # Einzelmessung: der Befehl startet die Messung
+            data = bus.read_i2c_block_data(self.DEVICE, self.mode, 2)
+        lux = self.convertToNumber(data)
+        if self.mode in (self.CONTINUOUS_HIGH_RES_MODE_2, self.ONE_TIME_HIGH_RES_MODE_2):
+            # Modus 2 zählt in halben Lux-Schritten
+            lux = lux / 2
+        return lux
@@ -0,0 +1,182 @@
+"""
+Frame based text renderer for the MAX7219 LED matrix.
+
+Glyphs are looked up in the font once and kept as column bytes (bit 0 is
+the top row, like the luma legacy fonts). Setting a text composes the
+whole scroll strip in one go, so every frame is only a slice of it. A
+background thread pushes the frames at `fps` and skips frames that did
+not change; the text can be swapped at any time without waiting.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from structured_log import get_logger
+
+log = get_logger('matrix_renderer')
+
+# bit order of a byte reversed, PIL packs '1' images most significant bit first
+_REVERSED_BITS = bytes(int(f'{value:08b}'[::-1], 2) for value in range(256))
+
+
+def columns_to_image(frame: bytes) -> Any:
+    """PIL image (width x 8) of one frame of column bytes, as luma devices expect it."""
+    from PIL import Image
+    image = Image.frombytes('1', (8, len(frame)), frame.translate(_REVERSED_BITS))
+    return image.transpose(getattr(Image, 'Transpose', Image).TRANSPOSE)
+
+
+class GlyphCache():
+    """Column bytes per character, read from `font` only on first use."""
+
+    def __init__(self, font: Any, fallback: str = '?'):
+        self.font = font
+        self.fallback = fallback
+        self.glyphs: Dict[str, bytes] = {}
+        self.misses = 0
+
+    def glyph(self, character: str) -> bytes:
+        glyph = self.glyphs.get(character)
+        if glyph is None:
+            self.misses += 1
+            try:
+                columns = self.font[ord(character)]
+            except (IndexError, KeyError):
+                columns = self.font[ord(self.fallback)]
+            glyph = bytes(column & 0xFF for column in columns)
+            self.glyphs[character] = glyph
+        return glyph
+
+    def columns(self, text: str) -> bytes:
+        return b''.join(self.glyph(character) for character in text)
+
+
+class MatrixRenderer():
+    """Shows a text on a luma style device (`width`, `display(image)`).
+
+    Text that fits is centered and written once; longer text scrolls one
+    column per frame in an endless loop with one display width of gap.
+    Devices with a `display_columns(frame)` method (the simulated matrix)
+    get the column bytes without the detour through an image.
+    """
+
+    def __init__(self, device: Any, font: Any, fps: float = 10.0, start_thread: bool = True):
+        self.device = device
+        self.width = device.width
+        self.glyphs = GlyphCache(font)
+        self.interval = 1.0 / fps
+        self.lock = threading.Lock()
+        self.text = ''
+        self.strip = bytes(self.width)
+        self.period = 0
+        self.offset = 0
+        self.shown: Optional[bytes] = None
+        self.running = True
+
+        # a MAX7219 frame writes all 8 digit registers of every chip, 2 bytes each
+        self.bytes_per_frame = 2 * 8 * max(1, self.width * device.height // 64)
+        self.frames = 0
+        self.frames_written = 0
+        self.frames_late = 0
+        self.frame_seconds = 0.0
+        self.max_frame_seconds = 0.0
+        self.started = time.monotonic()
+
+        self.thread: Optional[threading.Thread] = None
+        if start_thread:
+            self.thread = threading.Thread(target=self._run, name='matrix-renderer', daemon=True)
+            self.thread.start()
+
+    def set_text(self, text: str, restart: bool = False):
+        """Swaps the text; a scrolling text keeps its position unless `restart` is set."""
+        columns = self.glyphs.columns(text)
+        if len(columns) <= self.width:
+            padding = (self.width - len(columns)) // 2
+            strip = (bytes(padding) + columns).ljust(self.width, b'\0')
+            period = 0
+        else:
+            # text plus a blank display width, with its start repeated so every offset is one slice
+            loop = columns + bytes(self.width)
+            strip = loop + loop[:self.width]
+            period = len(loop)
+        with self.lock:
+            scrolling = self.period > 0
+            self.text = text
+            self.strip = strip
+            self.period = period
+            if not period:
+                self.offset = 0
+            elif restart or not scrolling:
+                # start blank, the text comes in from the right
+                self.offset = len(columns)
+            else:
+                self.offset %= period
+
+    def pass_seconds(self) -> float:
+        """How long one full scroll of the current text takes."""
+        with self.lock:
+            return self.period * self.interval
+
+    def frame(self) -> bytes:
+        """Next frame of column bytes, advances the scroll position."""
+        with self.lock:
+            frame = self.strip[self.offset:self.offset + self.width]
+            if self.period:
+                self.offset = (self.offset + 1) % self.period
+            return frame
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        spi_bytes = self.frames_written * self.bytes_per_frame
+        return {
+            'text': self.text,
+            'frames': self.frames,
+            'frames_written': self.frames_written,
+            'frames_late': self.frames_late,
+            'fps': round(self.frames / elapsed, 2),
+            'avg_frame_ms': round(self.frame_seconds / self.frames_written * 1000, 3) if self.frames_written else None,
+            'max_frame_ms': round(self.max_frame_seconds * 1000, 3),
+            'spi_bytes': spi_bytes,
+            'spi_bytes_per_second': round(spi_bytes / elapsed, 1),
+            'glyphs_cached': len(self.glyphs.glyphs),
+        }
+
+    def close(self, clear: bool = True):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        if clear:
+            self.write(bytes(self.width))
+
+    def write(self, frame: bytes):
+        """Pushes one frame unless the display already shows it."""
+        if frame == self.shown:
+            return
+        started = time.perf_counter()
+        display_columns = getattr(self.device, 'display_columns', None)
+        if display_columns is not None:
+            display_columns(frame)
+        else:
+            self.device.display(columns_to_image(frame))
+        duration = time.perf_counter() - started
+        self.shown = frame
+        self.frames_written += 1
+        self.frame_seconds += duration
+        self.max_frame_seconds = max(self.max_frame_seconds, duration)
+
+    def _run(self):
+        due = time.perf_counter()
+        while self.running:
+            try:
+                self.write(self.frame())
+            except Exception as exc:  # pylint: disable=broad-except
+                log.warning('matrix_update_failed', error=exc)
+            self.frames += 1
+            due += self.interval
+            now = time.perf_counter()
+            if due < now:
+                # fell behind, continue from now instead of rushing the missed frames
+                self.frames_late += 1
+                due = now
+            time.sleep(due - now)
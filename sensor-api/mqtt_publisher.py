@@ -0,0 +1,278 @@
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from instrumentation import Histogram
+from mqtt_spool import MqttSpool
+from structured_log import get_logger
+from wire_format import MAX_READINGS, Reading, Sequencer, encode
+
+log = get_logger('mqtt_publisher')
+
+# paho.mqtt.client.MQTT_ERR_NO_CONN, not imported so the sim backend works without paho
+MQTT_ERR_NO_CONN = 4
+
+
+PUBLISH_SECONDS = Histogram(
+    'mqtt_publish_duration_seconds', 'time spent handing a message to the MQTT client', ['qos'],
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05),
+)
+
+
+class TopicPolicy():
+    """Publish settings for a single topic.
+
+    qos           MQTT quality of service used for this topic
+    deadband      numeric values are only published when they moved more than this
+    min_interval  values arriving faster than this are coalesced, the newest wins
+    max_interval  republish an unchanged value after this many seconds (heartbeat)
+    batch         collect the value into the batch topic instead of its own topic
+    sensor        also send numeric values as binary readings of this sensor
+                  (see wire_format.py) on the publisher's binary topic
+    """
+
+    def __init__(
+        self,
+        qos: int = 0,
+        deadband: Optional[float] = None,
+        min_interval: float = 0,
+        max_interval: Optional[float] = None,
+        retain: bool = False,
+        batch: bool = False,
+        sensor: Optional[str] = None,
+    ):
+        self.qos = qos
+        self.deadband = deadband
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.retain = retain
+        self.batch = batch
+        self.sensor = sensor
+
+
+class TopicState():
+    def __init__(self):
+        self.last_value: Any = None
+        self.last_sent = 0.0
+        self.pending: Any = None
+        self.pending_captured_ns: Optional[int] = None
+        self.has_pending = False
+
+
+class MqttPublisher():
+    """Single place through which all outgoing sensor messages go."""
+
+    def __init__(
+        self,
+        client,
+        policies: Optional[Dict[str, TopicPolicy]] = None,
+        default_policy: Optional[TopicPolicy] = None,
+        batch_topic: Optional[str] = None,
+        batch_interval: float = 5,
+        spool: Optional[MqttSpool] = None,
+        replay_batch: int = 50,
+        replay_interval: float = 1,
+        binary_topic: Optional[str] = None,
+    ):
+        self.client = client
+        self.policies = policies or {}
+        self.default_policy = default_policy or TopicPolicy()
+        self.batch_topic = batch_topic
+        self.batch_interval = batch_interval
+        self.batch: Dict[str, Any] = {}
+        self.batch_sent = time.monotonic()
+        self.states: Dict[str, TopicState] = {}
+        # binary readings go out on binary_topic, one frame per value or,
+        # for batched topics, one frame per batch
+        self.binary_topic = binary_topic
+        self.binary_batch: List[Reading] = []
+        self.sequencer = Sequencer()
+        # messages are written to the spool while the broker is unreachable
+        # and replayed in batches of replay_batch every replay_interval
+        self.spool = spool
+        self.replay_batch = replay_batch
+        self.replay_interval = replay_interval
+        self.replay_sent = 0.0
+        self.lock = threading.Lock()
+        self.counters = {
+            'published': 0,
+            'published_bytes': 0,
+            'suppressed_deadband': 0,
+            'coalesced': 0,
+            'batched': 0,
+            'saved_messages': 0,
+            'saved_bytes': 0,
+            'spooled': 0,
+            'binary_readings': 0,
+        }
+
+    def policy(self, topic: str) -> TopicPolicy:
+        return self.policies.get(topic, self.default_policy)
+
+    def publish(self, topic: str, value: Any, captured_ns: Optional[int] = None) -> bool:
+        """Queues `value` for `topic`, returns True when it went out right away.
+
+        `captured_ns` is the unix time in ns the value was read, it is carried
+        by the binary readings and defaults to now.
+        """
+        if captured_ns is None:
+            captured_ns = time.time_ns()
+        policy = self.policy(topic)
+        now = time.monotonic()
+
+        with self.lock:
+            state = self.states.setdefault(topic, TopicState())
+
+            if self._inside_deadband(policy, state, value, now):
+                self.counters['suppressed_deadband'] += 1
+                self._count_saved(topic, value)
+                if state.has_pending:
+                    # the value went back to what was sent last, drop the pending one
+                    self._count_saved(topic, state.pending)
+                    state.pending = None
+                    state.pending_captured_ns = None
+                    state.has_pending = False
+                return False
+
+            if now - state.last_sent < policy.min_interval:
+                if state.has_pending:
+                    # the older pending value is replaced and never sent
+                    self.counters['coalesced'] += 1
+                    self._count_saved(topic, state.pending)
+                state.pending = value
+                state.pending_captured_ns = captured_ns
+                state.has_pending = True
+                return False
+
+            self._send(topic, value, policy, state, now, captured_ns)
+            return True
+
+    def flush(self, force: bool = False):
+        """Sends coalesced values whose interval passed and a due batch."""
+        now = time.monotonic()
+        with self.lock:
+            for topic, state in self.states.items():
+                if not state.has_pending:
+                    continue
+                policy = self.policy(topic)
+                if force or now - state.last_sent >= policy.min_interval:
+                    self._send(topic, state.pending, policy, state, now, state.pending_captured_ns)
+
+            if (self.batch or self.binary_batch) and (force or now - self.batch_sent >= self.batch_interval):
+                if self.batch:
+                    payload = json.dumps(self.batch)
+                    self._transmit(self.batch_topic, payload, self.default_policy.qos, False)
+                    self.counters['published'] += 1
+                    self.counters['published_bytes'] += len(self.batch_topic) + len(payload)
+                    # one batch message replaces one message per entry
+                    self.counters['saved_messages'] += len(self.batch) - 1
+                    self.batch = {}
+                self._send_binary_batch()
+                self.batch_sent = now
+
+            if self.spool is not None and now - self.replay_sent >= self.replay_interval and self._connected():
+                self.replay_sent = now
+                self._replay()
+
+    def start(self, tick: float = 0.1):
+        def run():
+            while True:
+                time.sleep(tick)
+                try:
+                    self.flush()
+                except Exception as exc:  # pylint: disable=broad-except
+                    log.warning('mqtt_flush_failed', error=exc)
+
+        threading.Thread(target=run, name='mqtt-publisher', daemon=True).start()
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            stats = dict(self.counters)
+        if self.spool is not None:
+            stats.update({f'spool_{name}': value for name, value in self.spool.stats().items()})
+        return stats
+
+    def _inside_deadband(self, policy: TopicPolicy, state: TopicState, value: Any, now: float) -> bool:
+        if policy.deadband is None or state.last_value is None:
+            return False
+        if not isinstance(value, (int, float)) or not isinstance(state.last_value, (int, float)):
+            return False
+        if policy.max_interval is not None and now - state.last_sent >= policy.max_interval:
+            return False
+        return abs(value - state.last_value) <= policy.deadband
+
+    def _send(self, topic: str, value: Any, policy: TopicPolicy, state: TopicState, now: float, captured_ns: Optional[int]):
+        state.last_value = value
+        state.last_sent = now
+        state.pending = None
+        state.pending_captured_ns = None
+        state.has_pending = False
+
+        batched = policy.batch and self.batch_topic is not None
+        if self.binary_topic and policy.sensor and isinstance(value, (int, float)):
+            reading = self.sequencer.reading(policy.sensor, value, captured_ns)
+            self.counters['binary_readings'] += 1
+            if batched:
+                self.binary_batch.append(reading)
+                if len(self.binary_batch) >= MAX_READINGS:
+                    self._send_binary_batch()
+            else:
+                self._send_binary([reading], policy.qos)
+
+        if batched:
+            self.batch[topic] = value
+            self.counters['batched'] += 1
+            return
+
+        payload = str(value)
+        self._transmit(topic, payload, policy.qos, policy.retain)
+        self.counters['published'] += 1
+        self.counters['published_bytes'] += len(topic) + len(payload)
+
+    def _send_binary(self, readings: List[Reading], qos: int):
+        payload = encode(readings)
+        self._transmit(self.binary_topic, payload, qos, False)
+        self.counters['published'] += 1
+        self.counters['published_bytes'] += len(self.binary_topic) + len(payload)
+
+    def _send_binary_batch(self):
+        if self.binary_batch:
+            self._send_binary(self.binary_batch, self.default_policy.qos)
+            self.binary_batch = []
+
+    def pending(self) -> int:
+        return sum(1 for state in list(self.states.values()) if state.has_pending) + len(self.batch) + len(self.binary_batch)
+
+    def _connected(self) -> bool:
+        is_connected = getattr(self.client, 'is_connected', None)
+        return is_connected() if is_connected is not None else True
+
+    def _transmit(self, topic: str, payload: Any, qos: int, retain: bool):
+        if self.spool is not None and not self._connected():
+            if self.spool.append(topic, payload, qos, retain):
+                self.counters['spooled'] += 1
+            return
+        # always called with self.lock held, so the histogram has a single writer
+        with PUBLISH_SECONDS.labels(qos).time():
+            self.client.publish(topic, payload, qos=qos, retain=retain)
+
+    def _replay(self):
+        # records stay at the head of the spool until paho has taken them
+        batch = self.spool.peek_batch(self.replay_batch)
+        accepted = 0
+        for topic, payload, qos, retain in batch:
+            info = self.client.publish(topic, payload, qos=qos, retain=retain)
+            rc = getattr(info, 'rc', 0)
+            # paho keeps QoS>0 messages published while disconnected and sends them on reconnect
+            if rc != 0 and not (qos > 0 and rc == MQTT_ERR_NO_CONN):
+                break
+            accepted += 1
+            if rc != 0:
+                # connection dropped again, the rest waits for the next attempt
+                break
+        self.spool.commit(accepted)
+
+    def _count_saved(self, topic: str, value: Any):
+        self.counters['saved_messages'] += 1
+        self.counters['saved_bytes'] += len(topic) + len(str(value))
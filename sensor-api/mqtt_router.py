@@ -0,0 +1,168 @@
+"""
+Subscription side MQTT topic router.
+
+Handlers are registered per topic filter (`+` and `#` wildcards allowed)
+and kept in a trie of topic levels, so matching a topic costs one lookup
+per level no matter how many filters exist. Matched messages go onto the
+bounded queue of one of a few worker threads; the paho network loop only
+enqueues and never waits for a handler. Each topic always goes to the
+same worker, so the commands of one topic (relay 'on' then 'off') run in
+the order they arrived. When the queue is full the message is dropped
+and counted.
+"""
+
+import queue
+import threading
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from structured_log import get_logger
+
+log = get_logger('mqtt_router')
+
+Handler = Callable[[str, bytes], Any]
+
+
+def validate_filter(pattern: str):
+    levels = pattern.split('/')
+    for index, level in enumerate(levels):
+        if '#' in level and (level != '#' or index != len(levels) - 1):
+            raise ValueError(f"'#' must be the last level on its own in {pattern!r}")
+        if '+' in level and level != '+':
+            raise ValueError(f"'+' must be a level on its own in {pattern!r}")
+
+
+class _Node():
+    __slots__ = ('children', 'handlers')
+
+    def __init__(self):
+        self.children: Dict[str, '_Node'] = {}
+        self.handlers: List[Tuple[str, Handler]] = []
+
+
+class TopicRouter():
+    """Dispatches messages to the handlers of every matching filter on a worker pool."""
+
+    def __init__(self, workers: int = 2, max_pending: int = 32):
+        """`max_pending` is the queue size of each worker."""
+        self.root = _Node()
+        self.filters: Dict[str, List[Handler]] = {}
+        self.lock = threading.Lock()
+        self.workers = max(1, workers)
+        self.queues: 'List[queue.Queue[Optional[Tuple[str, str, bytes, Handler]]]]' = [
+            queue.Queue(max_pending) for _ in range(self.workers)]
+        self.threads: List[threading.Thread] = []
+        self.counters = {'received': 0, 'unmatched': 0, 'dispatched': 0, 'dropped': 0, 'handled': 0, 'failed': 0}
+
+    def add(self, pattern: str, handler: Handler):
+        validate_filter(pattern)
+        with self.lock:
+            node = self.root
+            for level in pattern.split('/'):
+                node = node.children.setdefault(level, _Node())
+            node.handlers.append((pattern, handler))
+            self.filters.setdefault(pattern, []).append(handler)
+
+    def route(self, pattern: str) -> Callable[[Handler], Handler]:
+        """Decorator form of `add`."""
+        def register(handler: Handler) -> Handler:
+            self.add(pattern, handler)
+            return handler
+        return register
+
+    def patterns(self) -> List[str]:
+        with self.lock:
+            return list(self.filters)
+
+    def match(self, topic: str) -> List[Tuple[str, Handler]]:
+        levels = topic.split('/')
+        matches: List[Tuple[str, Handler]] = []
+        # topics starting with '$' are never matched by a leading wildcard
+        system = topic.startswith('$')
+        with self.lock:
+            nodes = [self.root]
+            for depth, level in enumerate(levels):
+                next_nodes = []
+                for node in nodes:
+                    if not (system and depth == 0):
+                        multi = node.children.get('#')
+                        if multi is not None:
+                            matches.extend(multi.handlers)
+                        single = node.children.get('+')
+                        if single is not None:
+                            next_nodes.append(single)
+                    exact = node.children.get(level)
+                    if exact is not None:
+                        next_nodes.append(exact)
+                nodes = next_nodes
+                if not nodes:
+                    break
+            for node in nodes:
+                matches.extend(node.handlers)
+                # 'a/#' also matches 'a'
+                multi = node.children.get('#')
+                if multi is not None:
+                    matches.extend(multi.handlers)
+        return matches
+
+    def dispatch(self, topic: str, payload: bytes) -> int:
+        """Queues the message for every matching handler, returns how many were queued."""
+        self.counters['received'] += 1
+        matches = self.match(topic)
+        if not matches:
+            self.counters['unmatched'] += 1
+            return 0
+        queued = 0
+        # crc32 instead of hash(), which is salted per process
+        worker_queue = self.queues[zlib.crc32(topic.encode()) % self.workers]
+        for pattern, handler in matches:
+            try:
+                worker_queue.put_nowait((pattern, topic, payload, handler))
+                queued += 1
+            except queue.Full:
+                self.counters['dropped'] += 1
+        self.counters['dispatched'] += queued
+        return queued
+
+    def on_message(self, client, userdata, message):  # pylint: disable=unused-argument
+        """paho `on_message` callback."""
+        self.dispatch(message.topic, message.payload)
+
+    def subscribe(self, client: Any, qos: int = 1):
+        """Subscribes every filter, call it from `on_connect` so reconnects renew them."""
+        for pattern in self.patterns():
+            client.subscribe(pattern, qos=qos)
+
+    def start(self):
+        for number, worker_queue in enumerate(self.queues):
+            thread = threading.Thread(target=self._work, args=(worker_queue,), name=f'mqtt-router-{number}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        for worker_queue in self.queues[:len(self.threads)]:
+            worker_queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def pending(self) -> int:
+        return sum(worker_queue.qsize() for worker_queue in self.queues)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.counters, pending=self.pending(), filters=self.patterns())
+
+    def _work(self, worker_queue: 'queue.Queue[Optional[Tuple[str, str, bytes, Handler]]]'):
+        while True:
+            item = worker_queue.get()
+            if item is None:
+                return
+            pattern, topic, payload, handler = item
+            try:
+                handler(topic, payload)
+                outcome = 'handled'
+            except Exception as exc:  # pylint: disable=broad-except
+                outcome = 'failed'
+                log.warning('mqtt_handler_failed', pattern=pattern, topic=topic, error=exc)
+            with self.lock:
+                self.counters[outcome] += 1
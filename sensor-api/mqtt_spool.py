@@ -0,0 +1,211 @@
+import mmap
+import os
+import struct
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# topic length, payload length, qos, retain; a zero topic length marks the end
+RECORD_HEADER = struct.Struct('<HIBB')
+# written over the qos byte once a record was replayed, so a restart skips it
+REPLAYED = 0xFF
+
+Record = Tuple[str, bytes, int, bool]
+
+
+class Segment():
+    """One preallocated, memory-mapped log file."""
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        existing = os.path.exists(path)
+        self.file = open(path, 'r+b' if existing else 'w+b')
+        if not existing:
+            self.file.truncate(size)
+        self.size = os.path.getsize(path)
+        self.map = mmap.mmap(self.file.fileno(), self.size)
+        self.write_offset = 0
+        self.records = 0
+        if existing:
+            self._recover()
+
+    def _recover(self):
+        offset = 0
+        while True:
+            record, next_offset = self.read(offset)
+            if record is None:
+                break
+            offset = next_offset
+            if record[2] != REPLAYED:
+                self.records += 1
+        self.write_offset = offset
+
+    def append(self, topic: bytes, payload: bytes, qos: int, retain: bool) -> bool:
+        length = RECORD_HEADER.size + len(topic) + len(payload)
+        # always leave room for the end marker
+        if self.write_offset + length + RECORD_HEADER.size > self.size:
+            return False
+        offset = self.write_offset
+        self.map[offset:offset + RECORD_HEADER.size] = RECORD_HEADER.pack(len(topic), len(payload), qos, int(retain))
+        offset += RECORD_HEADER.size
+        self.map[offset:offset + len(topic)] = topic
+        offset += len(topic)
+        self.map[offset:offset + len(payload)] = payload
+        self.write_offset = offset + len(payload)
+        self.records += 1
+        return True
+
+    def read(self, offset: int) -> Tuple[Optional[Record], int]:
+        if offset + RECORD_HEADER.size > self.size:
+            return None, offset
+        topic_length, payload_length, qos, retain = RECORD_HEADER.unpack_from(self.map, offset)
+        if topic_length == 0:
+            return None, offset
+        offset += RECORD_HEADER.size
+        topic = self.map[offset:offset + topic_length].decode()
+        offset += topic_length
+        payload = self.map[offset:offset + payload_length]
+        return (topic, payload, qos, bool(retain)), offset + payload_length
+
+    def mark_replayed(self, offset: int):
+        self.map[offset + RECORD_HEADER.size - 2] = REPLAYED
+
+    def close(self, remove: bool = False):
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+        if remove:
+            os.remove(self.path)
+
+
+class MqttSpool():
+    """Bounded append-only log of MQTT messages that could not be sent.
+
+    Messages go into memory-mapped segment files of `segment_size` bytes in
+    `directory`. When more than `max_segments` exist the oldest is evicted.
+    Segments left over from a previous run are replayed as well; records
+    are flagged once replayed so they are not sent twice after a restart.
+    """
+
+    def __init__(self, directory: str, segment_size: int = 1 << 20, max_segments: int = 16):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+        self.segments: List[Segment] = []
+        self.next_number = 0
+        for name in sorted(os.listdir(directory)):
+            if name.startswith('segment-') and name.endswith('.log'):
+                self.segments.append(Segment(os.path.join(directory, name), segment_size))
+                self.next_number = int(name[8:-4]) + 1
+        # position inside the oldest segment
+        self.read_offset = 0
+        self.read_records = 0
+
+        self.spooled = 0
+        self.replayed = 0
+        self.evicted = 0
+        self.dropped = 0
+
+    def _new_segment(self) -> Segment:
+        path = os.path.join(self.directory, f'segment-{self.next_number:010d}.log')
+        self.next_number += 1
+        segment = Segment(path, self.segment_size)
+        self.segments.append(segment)
+        if len(self.segments) > self.max_segments:
+            self._drop_oldest()
+        return segment
+
+    def _drop_oldest(self):
+        oldest = self.segments.pop(0)
+        self.evicted += oldest.records - self.read_records
+        self.read_offset = 0
+        self.read_records = 0
+        oldest.close(remove=True)
+
+    def append(self, topic: str, payload: Any, qos: int = 0, retain: bool = False) -> bool:
+        """Spools one message; False when it is too large for a segment and was dropped."""
+        if not isinstance(payload, (bytes, bytearray)):
+            payload = str(payload).encode()
+        encoded_topic = topic.encode()
+        with self.lock:
+            # record and end marker have to fit into an empty segment
+            if 2 * RECORD_HEADER.size + len(encoded_topic) + len(payload) > self.segment_size:
+                self.dropped += 1
+                return False
+            segment = self.segments[-1] if self.segments else self._new_segment()
+            if not segment.append(encoded_topic, bytes(payload), qos, retain):
+                segment.map.flush()
+                segment = self._new_segment()
+                segment.append(encoded_topic, bytes(payload), qos, retain)
+            self.spooled += 1
+            return True
+
+    def peek_batch(self, limit: int) -> List[Record]:
+        """Returns up to `limit` of the oldest records without removing them, see `commit`."""
+        batch: List[Record] = []
+        with self.lock:
+            offset = self.read_offset
+            for segment in self.segments:
+                while len(batch) < limit:
+                    record, offset = segment.read(offset)
+                    if record is None:
+                        break
+                    if record[2] != REPLAYED:
+                        batch.append(record)
+                if len(batch) >= limit:
+                    break
+                offset = 0
+        return batch
+
+    def commit(self, count: int) -> int:
+        """Removes the `count` oldest records, e.g. the part of a `peek_batch` that was sent."""
+        removed = 0
+        with self.lock:
+            while self.segments and removed < count:
+                segment = self.segments[0]
+                record, offset = segment.read(self.read_offset)
+                if record is not None:
+                    if record[2] != REPLAYED:
+                        segment.mark_replayed(self.read_offset)
+                        removed += 1
+                        self.read_records += 1
+                    self.read_offset = offset
+                    continue
+                # segment fully replayed, the next append starts a fresh file
+                self.segments.pop(0).close(remove=True)
+                self.read_offset = 0
+                self.read_records = 0
+            self.replayed += removed
+        return removed
+
+    def pop_batch(self, limit: int) -> List[Record]:
+        """Removes and returns up to `limit` of the oldest records."""
+        with self.lock:
+            batch = self.peek_batch(limit)
+            self.commit(len(batch))
+        return batch
+
+    def depth(self) -> int:
+        with self.lock:
+            return sum(segment.records for segment in self.segments) - self.read_records
+
+    def stats(self) -> Dict[str, int]:
+        depth = self.depth()
+        with self.lock:
+            return {
+                'depth': depth,
+                'segments': len(self.segments),
+                'spooled': self.spooled,
+                'replayed': self.replayed,
+                'evicted': self.evicted,
+                'dropped': self.dropped,
+            }
+
+    def close(self):
+        with self.lock:
+            for segment in self.segments:
+                segment.close()
+            self.segments = []
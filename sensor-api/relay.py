@@ -1,16 +1,16 @@
 #!/usr/bin/python
-import RPI.GPIO as GPIO
-import time
+from actuators import ActuatorTimeline
+from hardware import GPIO
 #definiere Relais Pin
 relay_pin = 40
 #Board Modus GPIO.BOARD
 GPIO.setmode(GPIO.BOARD)
 #relay_pin als Ausgang
 GPIO.setup(relay_pin, GPIO.OUT)
-#Oeffne Relais
-GPIO.output(relay_pin, GPIO.LOW)
-#warte eine halbe Sekunde
-time.sleep(0.5)
-#schliesse Relais
-GPIO.output(relay_pin, GPIO.HIGH)
+#Oeffne Relais und schliesse es nach einer halben Sekunde wieder, im Hintergrund
+actuators = ActuatorTimeline()
+toggle = actuators.switch(relay_pin, GPIO.LOW, hold=0.5)
+#hier koennte anderes laufen, wir warten nur auf das Ende
+toggle.result()
+actuators.close()
 GPIO.cleanup()
\ No newline at end of file
@@ -0,0 +1,57 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Tuple
+
+
+Snapshot = Tuple[int, Dict[str, Any]]
+
+
+class CachedResponse():
+    def __init__(self, generation: int, body: bytes, etag: str):
+        self.generation = generation
+        self.body = body
+        self.etag = etag
+
+
+class ResponseCache():
+    """Keeps pre-rendered response bodies per generation of the sensor values.
+
+    `generation` returns the current generation counter, `snapshot` returns
+    the generation together with a copy of the values. A body is only
+    re-rendered when the generation moved since the last render, every
+    other request is answered with the cached bytes.
+    """
+
+    def __init__(self, generation: Callable[[], int], snapshot: Callable[[], Snapshot]):
+        self.generation = generation
+        self.snapshot = snapshot
+        self.renderers: Dict[str, Callable[[Dict[str, Any]], bytes]] = {}
+        self.responses: Dict[str, CachedResponse] = {}
+        self.renders = 0
+        self.hits = 0
+        self.lock = threading.Lock()
+        # keeps ETags from a previous process from matching after a restart
+        self.epoch = format(time.time_ns() & 0xFFFFFFFF, 'x')
+
+    def register(self, name: str, renderer: Callable[[Dict[str, Any]], bytes]):
+        self.renderers[name] = renderer
+
+    def get(self, name: str) -> CachedResponse:
+        cached = self.responses.get(name)
+        if cached is not None and cached.generation == self.generation():
+            self.hits += 1
+            return cached
+
+        with self.lock:
+            generation, values = self.snapshot()
+            # another request may have rendered this generation meanwhile
+            cached = self.responses.get(name)
+            if cached is not None and cached.generation == generation:
+                self.hits += 1
+                return cached
+
+            body = self.renderers[name](values)
+            cached = CachedResponse(generation, body, f'"{name}-{self.epoch}-{generation}"')
+            self.responses[name] = cached
+            self.renders += 1
+            return cached
@@ -0,0 +1,229 @@
+import math
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from structured_log import get_logger
+
+log = get_logger('scheduler')
+
+# below this the scheduler thread would do nothing but sample
+MIN_CADENCE = 0.01
+
+
+class SamplingTask():
+    """A periodic sensor read registered with the SamplingScheduler.
+
+    `func` may return a number to override the delay until its next run,
+    e.g. to back off after a failed readout. It returns None otherwise, so
+    the cadence (which `set_cadence` may change at runtime) applies.
+    """
+
+    def __init__(self, name: str, func: Callable[[], Optional[float]], cadence: float, priority: int,
+                 deadline: float, bus: Optional[str], due: float, min_cadence: float = MIN_CADENCE):
+        self.name = name
+        self.func = func
+        self.cadence = cadence
+        self.min_cadence = max(MIN_CADENCE, min_cadence)
+        self.priority = priority
+        self.deadline = deadline
+        self.bus = bus
+        self.due = due
+        self.paused = False
+        # handed to its bus worker and not finished yet
+        self.running = False
+
+        self.runs = 0
+        self.errors = 0
+        self.deadline_misses = 0
+        self.skipped = 0
+        self.late_starts = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.last_jitter = 0.0
+        self.max_jitter = 0.0
+        self.avg_jitter = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'cadence': self.cadence,
+            'min_cadence': self.min_cadence,
+            'priority': self.priority,
+            'deadline': self.deadline,
+            'bus': self.bus,
+            'paused': self.paused,
+            'runs': self.runs,
+            'errors': self.errors,
+            'deadline_misses': self.deadline_misses,
+            'skipped': self.skipped,
+            'late_starts': self.late_starts,
+            'last_duration_ms': round(self.last_duration * 1000, 3),
+            'max_duration_ms': round(self.max_duration * 1000, 3),
+            'last_jitter_ms': round(self.last_jitter * 1000, 3),
+            'avg_jitter_ms': round(self.avg_jitter * 1000, 3),
+            'max_jitter_ms': round(self.max_jitter * 1000, 3),
+        }
+
+
+class SamplingScheduler():
+    """Runs periodic sensor reads, one worker thread per bus.
+
+    A single tick thread decides what is due: tasks run in order of their
+    due time, ties are broken by priority (lower runs first). Tasks on the
+    same bus are kept at least `stagger` seconds apart so I2C and GPIO work
+    never piles up at the same instant. The reads themselves run on the
+    worker of their bus, so a slow read (the distance burst) only delays
+    tasks on its own bus. A start more than `late_after` seconds after the
+    due time counts as a late start.
+    """
+
+    def __init__(self, stagger: float = 0.05, late_after: float = 0.02):
+        self.stagger = stagger
+        self.late_after = late_after
+        self.tasks: Dict[str, SamplingTask] = {}
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+        self.workers: Dict[Optional[str], 'queue.Queue[Optional[SamplingTask]]'] = {}
+
+    def register(self, name: str, func: Callable[[], Optional[float]], cadence: float, priority: int = 10,
+                 deadline: Optional[float] = None, bus: Optional[str] = None, start_in: float = 0,
+                 min_cadence: float = MIN_CADENCE) -> SamplingTask:
+        """`min_cadence` is the shortest cadence `set_cadence` accepts, e.g. the conversion time of the sensor."""
+        with self.condition:
+            now = time.monotonic() + start_in
+            # spread the first runs of tasks sharing a bus
+            offset = self.stagger * sum(1 for task in self.tasks.values() if bus is not None and task.bus == bus)
+            task = SamplingTask(name, func, cadence, priority, deadline if deadline is not None else cadence, bus,
+                                now + offset, min_cadence)
+            self.tasks[name] = task
+            self.condition.notify()
+            return task
+
+    def unregister(self, name: str):
+        with self.condition:
+            self.tasks.pop(name, None)
+            self.condition.notify()
+
+    def set_cadence(self, name: str, cadence: float, deadline: Optional[float] = None):
+        with self.condition:
+            task = self.tasks[name]
+            # nan compares False with everything, so check for it explicitly
+            if not (math.isfinite(cadence) and cadence >= task.min_cadence):
+                raise ValueError(f'cadence of {name} must be a finite number >= {task.min_cadence}')
+            if deadline is None and task.deadline == task.cadence:
+                deadline = cadence
+            task.cadence = cadence
+            if deadline is not None:
+                task.deadline = deadline
+            task.due = min(task.due, time.monotonic() + cadence)
+            self.condition.notify()
+
+    def pause(self, name: str):
+        with self.condition:
+            self.tasks[name].paused = True
+
+    def resume(self, name: str):
+        with self.condition:
+            task = self.tasks[name]
+            task.paused = False
+            task.due = time.monotonic()
+            self.condition.notify()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self.condition:
+            return {name: task.stats() for name, task in self.tasks.items()}
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='sampling-scheduler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+            for worker in self.workers.values():
+                worker.put(None)
+            self.workers = {}
+
+    def run(self):
+        self.running = True
+        while True:
+            with self.condition:
+                task = self._next_due()
+                while self.running and (task is None or task.due > time.monotonic()):
+                    self.condition.wait(None if task is None else task.due - time.monotonic())
+                    task = self._next_due()
+                if not self.running:
+                    return
+                task.running = True
+                self._worker(task.bus).put(task)
+
+    def _worker(self, bus: Optional[str]) -> 'queue.Queue[Optional[SamplingTask]]':
+        worker = self.workers.get(bus)
+        if worker is None:
+            worker = self.workers[bus] = queue.Queue()
+            threading.Thread(target=self._work, args=(worker,), name=f'sampling-{bus or "default"}', daemon=True).start()
+        return worker
+
+    def _work(self, worker: 'queue.Queue[Optional[SamplingTask]]'):
+        while True:
+            task = worker.get()
+            if task is None:
+                return
+            try:
+                self._run_task(task)
+            finally:
+                with self.condition:
+                    task.running = False
+                    self.condition.notify()
+
+    def _next_due(self) -> Optional[SamplingTask]:
+        candidates = [task for task in self.tasks.values() if not task.paused and not task.running]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda task: (task.due, task.priority))
+
+    def _run_task(self, task: SamplingTask):
+        started = time.monotonic()
+        jitter = started - task.due
+        next_delay = None
+        try:
+            next_delay = task.func()
+        except Exception as exc:  # pylint: disable=broad-except
+            task.errors += 1
+            log.warning('sampling_task_failed', task=task.name, error=exc)
+        finished = time.monotonic()
+
+        task.runs += 1
+        task.last_duration = finished - started
+        task.max_duration = max(task.max_duration, task.last_duration)
+        task.last_jitter = jitter
+        task.max_jitter = max(task.max_jitter, jitter)
+        task.avg_jitter += (jitter - task.avg_jitter) / min(task.runs, 100)
+        if jitter > self.late_after:
+            task.late_starts += 1
+        if finished - task.due > task.deadline:
+            task.deadline_misses += 1
+
+        with self.condition:
+            delay = next_delay if isinstance(next_delay, (int, float)) else task.cadence
+            due = task.due + delay
+            if due < finished:
+                # fell behind, drop the missed runs instead of running them back to back
+                if delay > 0:
+                    task.skipped += int((finished - due) // delay)
+                due = finished
+            task.due = self._staggered(task, due)
+
+    def _staggered(self, task: SamplingTask, due: float) -> float:
+        if task.bus is None:
+            return due
+        others: List[float] = sorted(other.due for other in self.tasks.values()
+                                     if other is not task and other.bus == task.bus and not other.paused)
+        for other_due in others:
+            if abs(other_due - due) < self.stagger:
+                due = other_due + self.stagger
+        return due
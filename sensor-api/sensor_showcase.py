@@ -8,19 +8,22 @@ Erfasst Temperatur, Luftfeuchtigkeit, Helligkeit und Bewegung
 vom Joy-Pi-Board und gibt die Werte in der Konsole aus.
 """
 
-import RPi.GPIO as GPIO
-import smbus2
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import itertools
+import math
+import threading
 import time
-import random
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import datetime
-import adafruit_dht
-import board
+
+from hardware import GPIO, AdafruitDHT11
+from light_sensor import LightSensor
+from scheduler import SamplingScheduler
+from stream_stats import StreamAnalytics, worst_severity
 
 
 # --- Sensor-Definitionen ---
-BH1750_ADDR = 0x5C       # BH1750 Lichtsensor (Joy-Pi)
-DHT_PIN = board.D4        # GPIO 4 für DHT11
+DHT_PIN = 4               # GPIO 4 für DHT11
 MOTION_PIN = 16           # GPIO 16 für PIR-Sensor
 
 
@@ -29,8 +32,8 @@ GPIO.setwarnings(False)
 GPIO.setmode(GPIO.BCM)
 GPIO.setup(MOTION_PIN, GPIO.IN)
 
-bus = smbus2.SMBus(1)
-dhtDevice = adafruit_dht.DHT11(DHT_PIN, use_pulseio=False)
+lightSensor = LightSensor()  # BH1750 (0x5C) im Dauermodus über den gemeinsamen I2C-Bus
+dhtDevice = AdafruitDHT11(DHT_PIN)
 
 
 @dataclass
@@ -40,6 +43,7 @@ class SensorReading:
     unit: str
     message: str
     severity: str = "info"
+    stale: bool = False
 
     def render(self):
         icons = {
@@ -52,95 +56,190 @@ class SensorReading:
         return f"{icon} {self.sensor}: {self.value:.1f} {self.unit} – {self.message}"
 
 
-class SensorShowcase:
-    """Erfasst reale Sensordaten vom Joy-Pi, mit stabiler Abfrage."""
+# Zeitbudget pro Sensor in Sekunden; eine Runde dauert höchstens so lange wie das größte
+SENSOR_TIMEOUTS = {
+    "Temperatur": 2.5,
+    "Luftfeuchtigkeit": 2.5,
+    "Helligkeit": 0.5,
+    "Bewegung": 0.1,
+}
+
+SENSOR_UNITS = {
+    "Temperatur": "°C",
+    "Luftfeuchtigkeit": "%",
+    "Helligkeit": "Lux",
+    "Bewegung": "%",
+}
 
-    def __init__(self):
-        self._sensors = [
-            self._temperature_sensor,
-            self._humidity_sensor,
-            self._light_sensor,
-            self._motion_sensor,
-        ]
+
+class SensorShowcase:
+    """Erfasst reale Sensordaten vom Joy-Pi, mit stabiler Abfrage.
+
+    Im parallelen Modus (Standard) werden alle Sensoren gleichzeitig gelesen,
+    jeder mit eigenem Zeitbudget. Liefert ein Sensor nicht rechtzeitig oder
+    mit Fehler, wird der letzte gute Wert als veraltet angezeigt.
+    """
+
+    def __init__(self, concurrent=True, timeouts=None):
+        # Sprünge und hängende Sensoren erkennen, zusätzlich zu den festen Schwellwerten
+        self.analytics = StreamAnalytics({
+            "Temperatur": {"min_jump": 1.5, "stuck_after": None, "warmup": 3},
+            "Luftfeuchtigkeit": {"min_jump": 5.0, "stuck_after": None, "warmup": 3},
+            "Helligkeit": {"min_jump": 20.0, "stuck_after": 10, "warmup": 3},
+        })
+        self._sensors = {
+            "Temperatur": self._temperature_sensor,
+            "Luftfeuchtigkeit": self._humidity_sensor,
+            "Helligkeit": self._light_sensor,
+            "Bewegung": self._motion_sensor,
+        }
+        self.concurrent = concurrent
+        self.timeouts = dict(SENSOR_TIMEOUTS, **(timeouts or {}))
+        self._executor = ThreadPoolExecutor(max_workers=len(self._sensors), thread_name_prefix="showcase")
+        # noch laufende Messungen, die ihr Budget überschritten haben
+        self._pending = {}
+        self._last_good = {}
+        # Temperatur und Feuchte kommen vom selben DHT11
+        self._dht_lock = threading.Lock()
 
     def poll(self):
-        for sensor in self._sensors:
-            yield sensor()
+        if not self.concurrent:
+            for name, sensor in self._sensors.items():
+                try:
+                    yield self._rate(self._remember(sensor()))
+                except Exception as e:
+                    yield self._fallback(name, e)
+            return
+
+        started = time.monotonic()
+        futures = {}
+        for name, sensor in self._sensors.items():
+            # hängt eine Messung noch aus der letzten Runde, wird nicht neu gestartet
+            future = self._pending.get(name)
+            if future is None or future.done():
+                future = self._executor.submit(sensor)
+            futures[name] = future
+
+        for name, future in futures.items():
+            remaining = max(0.0, started + self.timeouts[name] - time.monotonic())
+            try:
+                reading = future.result(timeout=remaining)
+            except FutureTimeout:
+                self._pending[name] = future
+                yield self._fallback(name, "Zeitüberschreitung")
+                continue
+            except Exception as e:
+                self._pending.pop(name, None)
+                yield self._fallback(name, e)
+                continue
+            self._pending.pop(name, None)
+            yield self._rate(self._remember(reading))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def _remember(self, reading):
+        self._last_good[reading.sensor] = (reading, time.monotonic())
+        return reading
+
+    def _fallback(self, name, error):
+        """Letzter guter Wert, als veraltet markiert – nie ein erfundener."""
+        last = self._last_good.get(name)
+        if last is None:
+            return SensorReading(name, math.nan, SENSOR_UNITS[name], f"{error} – noch kein Messwert", "warn", stale=True)
+        reading, measured_at = last
+        age = time.monotonic() - measured_at
+        return replace(reading, message=f"veraltet ({age:.0f}s alt) – {error}", severity="warn", stale=True)
+
+    def _rate(self, reading):
+        if reading.sensor not in self.analytics.sensors:
+            return reading
+        anomalies = self.analytics.record(reading.sensor, reading.value)
+        if "jump" in anomalies:
+            reading.message += " (Sprung erkannt!)"
+        elif "stuck" in anomalies:
+            reading.message += " (Sensor hängt?)"
+        reading.severity = worst_severity(reading.severity, self.analytics.severity(reading.sensor))
+        return reading
 
     # Temperatur
     def _temperature_sensor(self):
-        try:
+        with self._dht_lock:
             temp = dhtDevice.temperature
-            if temp is None:
-                raise ValueError("Keine Messung erhalten.")
-            if temp > 29.5:
-                msg, sev = "Lüftung einschalten!", "alert"
-            elif temp > 26.0:
-                msg, sev = "Ganz schön warm hier.", "warn"
-            else:
-                msg, sev = "Temperatur im Wohlfühlbereich.", "ok"
-            return SensorReading("Temperatur", temp, "°C", msg, sev)
-        except Exception as e:
-            temp = random.uniform(20, 28)
-            return SensorReading("Temperatur", temp, "°C", f"Fehler: {e}", "warn")
+        if temp is None:
+            raise ValueError("Keine Messung erhalten.")
+        if temp > 29.5:
+            msg, sev = "Lüftung einschalten!", "alert"
+        elif temp > 26.0:
+            msg, sev = "Ganz schön warm hier.", "warn"
+        else:
+            msg, sev = "Temperatur im Wohlfühlbereich.", "ok"
+        return SensorReading("Temperatur", temp, "°C", msg, sev)
 
     # Luftfeuchtigkeit
     def _humidity_sensor(self):
-        try:
+        with self._dht_lock:
             hum = dhtDevice.humidity
-            if hum is None:
-                raise ValueError("Keine Messung erhalten.")
-            if hum < 30:
-                msg, sev = "Luft zu trocken – ggf. befeuchten.", "warn"
-            elif hum > 70:
-                msg, sev = "Sehr feucht – lüften empfohlen.", "warn"
-            else:
-                msg, sev = "Feuchtigkeit im optimalen Bereich.", "ok"
-            return SensorReading("Luftfeuchtigkeit", hum, "%", msg, sev)
-        except Exception as e:
-            hum = random.uniform(40, 60)
-            return SensorReading("Luftfeuchtigkeit", hum, "%", f"Fehler: {e}", "warn")
+        if hum is None:
+            raise ValueError("Keine Messung erhalten.")
+        if hum < 30:
+            msg, sev = "Luft zu trocken – ggf. befeuchten.", "warn"
+        elif hum > 70:
+            msg, sev = "Sehr feucht – lüften empfohlen.", "warn"
+        else:
+            msg, sev = "Feuchtigkeit im optimalen Bereich.", "ok"
+        return SensorReading("Luftfeuchtigkeit", hum, "%", msg, sev)
 
     # Helligkeit (BH1750)
     def _light_sensor(self):
         try:
-            data = bus.read_i2c_block_data(BH1750_ADDR, 0x20, 2)
-            lux = (data[0] << 8 | data[1]) / 1.2
-            if lux < 60:
-                msg, sev = "Licht an? Es ist ziemlich dunkel.", "warn"
-            elif lux > 600:
-                msg, sev = "Sehr hell – eventuell Blendgefahr.", "warn"
-            else:
-                msg, sev = "Helligkeit ist angenehm.", "ok"
-            return SensorReading("Helligkeit", lux, "Lux", msg, sev)
+            lux = lightSensor.readLight()
         except Exception as e:
-            lux = random.uniform(10, 400)
-            return SensorReading("Helligkeit", lux, "Lux", f"I2C-Fehler: {e}", "warn")
+            raise IOError(f"I2C-Fehler: {e}") from e
+        if lux < 60:
+            msg, sev = "Licht an? Es ist ziemlich dunkel.", "warn"
+        elif lux > 600:
+            msg, sev = "Sehr hell – eventuell Blendgefahr.", "warn"
+        else:
+            msg, sev = "Helligkeit ist angenehm.", "ok"
+        return SensorReading("Helligkeit", lux, "Lux", msg, sev)
 
     # Bewegung (PIR)
     def _motion_sensor(self):
         try:
             motion = GPIO.input(MOTION_PIN)
-            if motion:
-                return SensorReading("Bewegung", 100, "%", "Bewegung erkannt!", "alert")
-            else:
-                return SensorReading("Bewegung", 0, "%", "Alles ruhig.", "ok")
         except Exception as e:
-            return SensorReading("Bewegung", 0, "%", f"GPIO Fehler: {e}", "warn")
+            raise IOError(f"GPIO Fehler: {e}") from e
+        if motion:
+            return SensorReading("Bewegung", 100, "%", "Bewegung erkannt!", "alert")
+        else:
+            return SensorReading("Bewegung", 0, "%", "Alles ruhig.", "ok")
 
 
 def run_showcase(iterations=10, delay=2.5):
     showcase = SensorShowcase()
+    scheduler = SamplingScheduler()
+    rounds = itertools.count(1)
+
+    def sensor_round():
+        i = next(rounds)
+        ts = datetime.now().strftime("%H:%M:%S")
+        print(f"\n[{ts}] Sensorrunde {i}")
+        started = time.monotonic()
+        for reading in showcase.poll():
+            print("  " + reading.render())
+        print(f"  (Runde in {time.monotonic() - started:.2f}s)")
+        if i >= iterations:
+            scheduler.stop()
+
+    # Runden werden vom Scheduler im festen Takt gestartet
+    scheduler.register("showcase", sensor_round, cadence=delay)
     try:
-        for i in range(iterations):
-            ts = datetime.now().strftime("%H:%M:%S")
-            print(f"\n[{ts}] Sensorrunde {i+1}")
-            for reading in showcase.poll():
-                print("  " + reading.render())
-            time.sleep(delay)
+        scheduler.run()
     except KeyboardInterrupt:
         print("\nBeendet durch Benutzer.")
     finally:
+        showcase.close()
         GPIO.cleanup()
 
 
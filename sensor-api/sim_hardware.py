@@ -0,0 +1,698 @@
+"""
+Deterministic stand-ins for the Joy-Pi hardware and the MQTT broker.
+
+Used by hardware.py when SENSOR_BACKEND=sim. Every device draws from one
+seeded random generator (SIM_SEED) and sleeps for a configurable latency
+(scaled by SIM_LATENCY_SCALE) before it answers. SIM_FAILURE_RATE sets the
+default probability that a read fails; `configure()` overrides latencies
+and failure rates per device at runtime.
+"""
+
+from collections import OrderedDict
+import math
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class SimConfig():
+    def __init__(self):
+        self.seed = int(os.getenv('SIM_SEED', '321'))
+        self.latency_scale = float(os.getenv('SIM_LATENCY_SCALE', '1.0'))
+        default_failure_rate = float(os.getenv('SIM_FAILURE_RATE', '0.0'))
+        # seconds per operation before the latency scale is applied
+        self.latency: Dict[str, float] = {
+            'gpio': 0.0,
+            'i2c': 0.0005,
+            'bh1750_one_time': 0.18,
+            'bh1750_low_res': 0.024,
+            'dht11': 0.02,
+            'hcsr04_start': 0.0004,
+            'mqtt': 0.001,
+            'spi': 0.0,
+        }
+        self.failure_rate: Dict[str, float] = {
+            'i2c': default_failure_rate,
+            'dht11': default_failure_rate,
+            'hcsr04': default_failure_rate,
+        }
+        self.random = random.Random(self.seed)
+        self.lock = threading.Lock()
+
+    def delay(self, name: str):
+        seconds = self.latency.get(name, 0) * self.latency_scale
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def fails(self, name: str) -> bool:
+        with self.lock:
+            return self.random.random() < self.failure_rate.get(name, 0)
+
+    def gauss(self, sigma: float) -> float:
+        with self.lock:
+            return self.random.gauss(0, sigma)
+
+
+config = SimConfig()
+
+
+def configure(latency: Optional[Dict[str, float]] = None, failure_rate: Optional[Dict[str, float]] = None,
+              latency_scale: Optional[float] = None, seed: Optional[int] = None):
+    if latency:
+        config.latency.update(latency)
+    if failure_rate:
+        config.failure_rate.update(failure_rate)
+    if latency_scale is not None:
+        config.latency_scale = latency_scale
+    if seed is not None:
+        config.seed = seed
+        config.random.seed(seed)
+
+
+class Signal():
+    """Slow sine wave with gaussian noise, used as the physical quantity."""
+
+    def __init__(self, base: float, amplitude: float, period: float, noise: float):
+        self.base = base
+        self.amplitude = amplitude
+        self.period = period
+        self.noise = noise
+        self.started = time.monotonic()
+
+    def value(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.base + self.amplitude * math.sin(2 * math.pi * elapsed / self.period) + config.gauss(self.noise)
+
+
+signals = {
+    'light': Signal(base=250, amplitude=200, period=600, noise=2),
+    'distance': Signal(base=80, amplitude=60, period=120, noise=0.5),
+    'temperature': Signal(base=23, amplitude=3, period=1800, noise=0.3),
+    'humidity': Signal(base=45, amplitude=10, period=2400, noise=1),
+}
+
+
+class CaptureLog():
+    """Remembers when a value was produced, so benchmarks can measure how long
+    it takes until the same value shows up over HTTP or MQTT."""
+
+    def __init__(self, size: int = 4096):
+        self.size = size
+        self.entries: Dict[str, 'OrderedDict[Any, float]'] = {}
+        self.lock = threading.Lock()
+
+    def record(self, device: str, value: Any):
+        with self.lock:
+            entries = self.entries.setdefault(device, OrderedDict())
+            entries[value] = time.perf_counter()
+            entries.move_to_end(value)
+            if len(entries) > self.size:
+                entries.popitem(last=False)
+
+    def captured_at(self, device: str, value: Any) -> Optional[float]:
+        with self.lock:
+            return self.entries.get(device, {}).get(value)
+
+
+captures = CaptureLog()
+
+
+# --- GPIO ---
+
+class SimPWM():
+    def __init__(self, channel: int, frequency: float):
+        self.channel = channel
+        self.frequency = frequency
+        self.duty_cycle = 0.0
+        self.running = False
+
+    def start(self, duty_cycle: float):
+        self.duty_cycle = duty_cycle
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def ChangeFrequency(self, frequency: float):
+        self.frequency = frequency
+
+    def ChangeDutyCycle(self, duty_cycle: float):
+        self.duty_cycle = duty_cycle
+
+
+class SimGPIO():
+    """Subset of the RPi.GPIO module API."""
+
+    BOARD = 10
+    BCM = 11
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+    RPI_REVISION = 3
+    VERSION = 'sim'
+
+    PWM = SimPWM
+
+    def __init__(self):
+        self.mode: Optional[int] = None
+        self.levels: Dict[int, int] = {}
+        self.directions: Dict[int, int] = {}
+        self.edge_callbacks: Dict[int, List[Callable[[int], None]]] = {}
+        self.edges: Dict[int, int] = {}
+        self.detected: Dict[int, bool] = {}
+        # devices that drive an input pin or listen to an output pin
+        self.input_sources: Dict[int, Callable[[], int]] = {}
+        self.output_listeners: Dict[int, Callable[[int, int], None]] = {}
+        self.lock = threading.Lock()
+
+    def setwarnings(self, flag: bool):
+        pass
+
+    def setmode(self, mode: int):
+        self.mode = mode
+
+    def getmode(self) -> Optional[int]:
+        return self.mode
+
+    def setup(self, channel, direction: int, pull_up_down: int = PUD_OFF, initial: Optional[int] = None):
+        for pin in channel if isinstance(channel, (list, tuple)) else [channel]:
+            self.directions[pin] = direction
+            if direction == self.OUT:
+                self.levels[pin] = int(initial or 0)
+            else:
+                self.levels.setdefault(pin, 1 if pull_up_down == self.PUD_UP else 0)
+
+    def output(self, channel, value):
+        for pin in channel if isinstance(channel, (list, tuple)) else [channel]:
+            config.delay('gpio')
+            previous = self.levels.get(pin, 0)
+            self.levels[pin] = int(bool(value))
+            listener = self.output_listeners.get(pin)
+            if listener is not None:
+                listener(previous, self.levels[pin])
+
+    def input(self, channel: int) -> int:
+        config.delay('gpio')
+        source = self.input_sources.get(channel)
+        if source is not None:
+            return source()
+        return self.levels.get(channel, 0)
+
+    def add_event_detect(self, channel: int, edge: int, callback: Optional[Callable[[int], None]] = None, bouncetime: Optional[int] = None):
+        with self.lock:
+            if channel in self.edges:
+                raise RuntimeError('Conflicting edge detection already enabled for this GPIO channel')
+            self.edges[channel] = edge
+            self.edge_callbacks[channel] = [callback] if callback else []
+            self.detected[channel] = False
+
+    def add_event_callback(self, channel: int, callback: Callable[[int], None]):
+        with self.lock:
+            self.edge_callbacks.setdefault(channel, []).append(callback)
+
+    def remove_event_detect(self, channel: int):
+        with self.lock:
+            self.edges.pop(channel, None)
+            self.edge_callbacks.pop(channel, None)
+            self.detected.pop(channel, None)
+
+    def event_detected(self, channel: int) -> bool:
+        with self.lock:
+            detected = self.detected.get(channel, False)
+            self.detected[channel] = False
+            return detected
+
+    def drive(self, channel: int, level: int):
+        """Sets an input level from the device side and fires edge callbacks."""
+        previous = self.levels.get(channel, 0)
+        self.levels[channel] = level
+        if previous == level:
+            return
+        with self.lock:
+            edge = self.edges.get(channel)
+            if edge is None or (edge == self.RISING and not level) or (edge == self.FALLING and level):
+                return
+            self.detected[channel] = True
+            callbacks = list(self.edge_callbacks.get(channel, []))
+        for callback in callbacks:
+            callback(channel)
+
+    def cleanup(self, channel=None):
+        with self.lock:
+            pins = list(self.levels) if channel is None else (channel if isinstance(channel, (list, tuple)) else [channel])
+            for pin in pins:
+                self.levels.pop(pin, None)
+                self.directions.pop(pin, None)
+                self.edges.pop(pin, None)
+                self.edge_callbacks.pop(pin, None)
+                self.detected.pop(pin, None)
+
+
+class SimHCSR04():
+    """Answers a trigger pulse with an echo pulse as long as the signal distance."""
+
+    def __init__(self, gpio: SimGPIO, trig: int, echo: int, signal: Signal):
+        self.gpio = gpio
+        self.trig = trig
+        self.echo = echo
+        self.signal = signal
+        self.window = (0.0, 0.0)
+        gpio.output_listeners[trig] = self._on_trigger
+        gpio.input_sources[echo] = self._echo_level
+
+    def _echo_level(self) -> int:
+        start, end = self.window
+        return int(start <= time.perf_counter() < end)
+
+    def _on_trigger(self, previous: int, level: int):
+        # the module sends its burst on the falling edge of the trigger pulse
+        if not (previous and not level):
+            return
+        if config.fails('hcsr04'):
+            return
+
+        distance = max(2.0, self.signal.value())
+        start = time.perf_counter() + config.latency['hcsr04_start'] * config.latency_scale
+        end = start + distance / 17150
+        self.window = (start, end)
+        captures.record('distance', round(distance, 2))
+
+        if self.echo in self.gpio.edges:
+            threading.Thread(target=self._fire_edges, args=(start, end), daemon=True).start()
+
+    def _fire_edges(self, start: float, end: float):
+        for at, level in ((start, 1), (end, 0)):
+            remaining = at - time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+            self.gpio.drive(self.echo, level)
+
+
+GPIO = SimGPIO()
+# pins as wired on the Joy-Pi (BOARD numbering for the HC-SR04, BCM for the PIR)
+hcsr04 = SimHCSR04(GPIO, trig=36, echo=32, signal=signals['distance'])
+GPIO.input_sources[16] = lambda: int(config.random.random() < 0.1)
+
+
+# --- I2C ---
+
+class SimSMBus():
+    """smbus/smbus2 compatible bus with a BH1750 at 0x5c (and 0x23)."""
+
+    BH1750_ADDRESSES = (0x23, 0x5C)
+    CONTINUOUS_MODES = (0x10, 0x11, 0x13)
+    ONE_TIME_MODES = (0x20, 0x21, 0x23)
+
+    def __init__(self, bus: int = 1):
+        self.bus = bus
+        self.modes: Dict[int, int] = {}
+        self.mode_started: Dict[int, float] = {}
+        self.plain_reads = 0
+        self.lock = threading.Lock()
+
+    def _check(self, address: int):
+        config.delay('i2c')
+        if address not in self.BH1750_ADDRESSES or config.fails('i2c'):
+            raise OSError(121, 'Remote I/O error')
+
+    def _set_mode(self, address: int, mode: int):
+        if self.modes.get(address) != mode:
+            self.modes[address] = mode
+            self.mode_started[address] = time.monotonic()
+
+    def _measurement(self, address: int, mode: int) -> List[int]:
+        if mode in self.ONE_TIME_MODES:
+            config.delay('bh1750_low_res' if mode == 0x23 else 'bh1750_one_time')
+        elif mode in self.CONTINUOUS_MODES:
+            self._set_mode(address, mode)
+            # the first conversion is not ready before the conversion time passed
+            ready_in = self.mode_started[address] + config.latency['bh1750_one_time'] * config.latency_scale - time.monotonic()
+            if ready_in > 0:
+                return [0, 0]
+
+        raw = max(0, min(0xFFFF, int(signals['light'].value() * 1.2)))
+        captures.record('light', round(raw / 1.2, 2))
+        return [raw >> 8, raw & 0xFF]
+
+    def read_i2c_block_data(self, address: int, register: int, length: int = 32) -> List[int]:
+        with self.lock:
+            self._check(address)
+            data = self._measurement(address, register)
+        return (data + [0] * length)[:length]
+
+    def write_byte(self, address: int, value: int):
+        with self.lock:
+            self._check(address)
+            if value in self.CONTINUOUS_MODES:
+                self._set_mode(address, value)
+
+    def read_byte(self, address: int) -> int:
+        with self.lock:
+            self._check(address)
+            return self._measurement(address, self.modes.get(address, 0x10))[0]
+
+    def read_bytes(self, address: int, length: int) -> List[int]:
+        """Plain read (smbus2 i2c_rdwr), returns the last conversion without restarting it."""
+        with self.lock:
+            self._check(address)
+            self.plain_reads += 1
+            data = self._measurement(address, self.modes.get(address, 0x10))
+        return (data + [0] * length)[:length]
+
+    def close(self):
+        pass
+
+
+# --- DHT11 ---
+
+class SimDHT11Result():
+    ERR_NO_ERROR = 0
+    ERR_MISSING_DATA = 1
+    ERR_CRC = 2
+
+    def __init__(self, error_code: int, temperature: float = -1, humidity: float = -1):
+        self.error_code = error_code
+        self.temperature = temperature
+        self.humidity = humidity
+
+    def is_valid(self) -> bool:
+        return self.error_code == SimDHT11Result.ERR_NO_ERROR
+
+
+class SimDHT11():
+    """Same interface as the `dht11` package."""
+
+    def __init__(self, pin: int):
+        self.pin = pin
+
+    def read(self) -> SimDHT11Result:
+        config.delay('dht11')
+        if config.fails('dht11'):
+            return SimDHT11Result(SimDHT11Result.ERR_CRC, 0, 0)
+        temperature = round(signals['temperature'].value())
+        humidity = round(signals['humidity'].value())
+        captures.record('temperature', temperature)
+        captures.record('humidity', humidity)
+        return SimDHT11Result(SimDHT11Result.ERR_NO_ERROR, temperature, humidity)
+
+
+class SimAdafruitDHT11():
+    """Same interface as `adafruit_dht.DHT11`."""
+
+    def __init__(self, pin: Any, use_pulseio: bool = True):
+        self.sensor = SimDHT11(pin)
+
+    def _read(self) -> SimDHT11Result:
+        result = self.sensor.read()
+        if not result.is_valid():
+            raise RuntimeError('Checksum did not validate. Try again.')
+        return result
+
+    @property
+    def temperature(self) -> float:
+        return self._read().temperature
+
+    @property
+    def humidity(self) -> float:
+        return self._read().humidity
+
+    def exit(self):
+        pass
+
+
+# --- Displays ---
+
+class SimCharacterLCD():
+    """Subset of adafruit `Character_LCD_I2C` that counts the bus traffic.
+
+    On the MCP23008 backpack every byte sent to the HD44780 (command or
+    character) is two nibbles of four data pin writes plus an enable pulse,
+    I2C_WRITES_PER_BYTE register writes in total.
+    """
+
+    I2C_WRITES_PER_BYTE = 15
+
+    def __init__(self, columns: int = 16, rows: int = 2):
+        self.columns = columns
+        self.rows = rows
+        self.cells = [[' '] * columns for _ in range(rows)]
+        self.column = 0
+        self.row = 0
+        self._message: Optional[str] = None
+        self.bytes_written = 0
+        self.i2c_transactions = 0
+        self.cursor = (0, 0)
+
+    def _write8(self, value: int, char_mode: bool = False):
+        config.delay('i2c')
+        self.bytes_written += 1
+        self.i2c_transactions += self.I2C_WRITES_PER_BYTE
+        if char_mode:
+            column, row = self.cursor
+            if column < self.columns:
+                self.cells[row][column] = chr(value)
+            self.cursor = (column + 1, row)
+
+    def clear(self):
+        self._write8(0x01)
+        self.cells = [[' '] * self.columns for _ in range(self.rows)]
+        self.cursor = (0, 0)
+        # the HD44780 needs up to 1.5ms for a clear
+        time.sleep(0.003)
+
+    def cursor_position(self, column: int, row: int):
+        row = min(row, self.rows - 1)
+        column = min(column, self.columns - 1)
+        self._write8(0x80 | (column + row * 0x40))
+        self.cursor = (column, row)
+        self.row = row
+        self.column = column
+
+    @property
+    def message(self) -> Optional[str]:
+        return self._message
+
+    @message.setter
+    def message(self, message: str):
+        self._message = message
+        line = self.row
+        self.cursor_position(self.column, line)
+        for character in message:
+            if character == '\n':
+                line += 1
+                self.cursor_position(self.column, line)
+            else:
+                self._write8(ord(character), True)
+        self.column, self.row = 0, 0
+
+    def text(self) -> str:
+        return '\n'.join(''.join(row) for row in self.cells)
+
+
+class SimSeg7x4():
+    """Subset of adafruit `Seg7x4`; with auto_write every change is sent at once."""
+
+    def __init__(self, digits: int = 4):
+        self.digits = [' '] * digits
+        self.auto_write = True
+        self.i2c_transactions = 0
+
+    def fill(self, color: int):
+        self.digits = [' '] * len(self.digits)
+        if self.auto_write:
+            self.show()
+
+    def __setitem__(self, index: int, value: str):
+        self.digits[index] = value
+        if self.auto_write:
+            self.show()
+
+    def show(self):
+        # the whole display RAM goes out in one write
+        config.delay('i2c')
+        self.i2c_transactions += 1
+
+    def text(self) -> str:
+        return ''.join(self.digits)
+
+
+class SimMax7219():
+    """Subset of the luma `max7219` device that counts the SPI traffic.
+
+    Takes frames as column bytes (`display_columns`), luma devices need a
+    PIL image which is not available everywhere the simulation runs.
+    """
+
+    def __init__(self, cascaded: int = 1):
+        self.cascaded = cascaded
+        self.width = 8 * cascaded
+        self.height = 8
+        self.columns = bytes(self.width)
+        self.frames = 0
+        self.spi_bytes = 0
+
+    def display_columns(self, columns: bytes):
+        # every digit register of every chip is rewritten, 2 bytes each
+        config.delay('spi')
+        self.columns = bytes(columns)
+        self.frames += 1
+        self.spi_bytes += 2 * 8 * self.cascaded
+
+    def clear(self):
+        self.display_columns(bytes(self.width))
+
+
+class SimMatrixFont():
+    """Proportional font with made up glyphs, indexed by character code like the luma fonts."""
+
+    def __getitem__(self, code: int) -> List[int]:
+        if code == 32:
+            return [0, 0, 0]
+        return [0x3C | (code >> shift & 0x43) for shift in range(4)] + [0]
+
+
+# --- MQTT ---
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    pattern_levels = pattern.split('/')
+    topic_levels = topic.split('/')
+    for index, level in enumerate(pattern_levels):
+        if level == '#':
+            return True
+        if index >= len(topic_levels) or (level != '+' and level != topic_levels[index]):
+            return False
+    return len(pattern_levels) == len(topic_levels)
+
+
+class SimMessage():
+    def __init__(self, topic: str, payload: bytes, qos: int, retain: bool):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.published_at = time.perf_counter()
+
+
+class SimMessageInfo():
+    def __init__(self, mid: int):
+        self.mid = mid
+        self.rc = 0
+
+    def is_published(self) -> bool:
+        return True
+
+    def wait_for_publish(self, timeout: Optional[float] = None):
+        pass
+
+
+class SimBroker():
+    """In-process broker: delivers published messages on its own thread."""
+
+    def __init__(self):
+        self.subscriptions: List[tuple] = []
+        self.retained: Dict[str, SimMessage] = {}
+        self.messages: 'queue.Queue[SimMessage]' = queue.Queue()
+        self.published = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self._deliver, name='sim-broker', daemon=True).start()
+
+    def subscribe(self, client: 'SimMqttClient', pattern: str):
+        with self.lock:
+            self.subscriptions.append((pattern, client))
+            retained = [m for topic, m in self.retained.items() if topic_matches(pattern, topic)]
+        for message in retained:
+            client.deliver(message)
+
+    def unsubscribe(self, client: 'SimMqttClient', pattern: str):
+        with self.lock:
+            self.subscriptions = [s for s in self.subscriptions if s != (pattern, client)]
+
+    def publish(self, message: SimMessage):
+        with self.lock:
+            self.published += 1
+            if message.retain:
+                self.retained[message.topic] = message
+        self.messages.put(message)
+
+    def _deliver(self):
+        while True:
+            message = self.messages.get()
+            config.delay('mqtt')
+            with self.lock:
+                receivers = {client for pattern, client in self.subscriptions if topic_matches(pattern, message.topic)}
+            for client in receivers:
+                client.deliver(message)
+
+
+broker = SimBroker()
+
+
+class SimMqttClient():
+    """Subset of `paho.mqtt.client.Client` talking to the in-process broker."""
+
+    def __init__(self, *args, **kwargs):
+        self.on_connect: Optional[Callable] = None
+        self.on_disconnect: Optional[Callable] = None
+        self.on_message: Optional[Callable] = None
+        self.on_publish: Optional[Callable] = None
+        self.connected = False
+        self.mid = 0
+
+    def connect(self, host: str, port: int = 1883, keepalive: int = 60):
+        self.connected = True
+        if self.on_connect is not None:
+            self.on_connect(self, None, {}, 0, None)
+        return 0
+
+    def connect_async(self, host: str, port: int = 1883, keepalive: int = 60):
+        return self.connect(host, port, keepalive)
+
+    def reconnect(self):
+        return self.connect('sim')
+
+    def disconnect(self):
+        self.connected = False
+        if self.on_disconnect is not None:
+            self.on_disconnect(self, None, 0, None)
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def subscribe(self, topic: str, qos: int = 0):
+        broker.subscribe(self, topic)
+        return 0, self.mid
+
+    def unsubscribe(self, topic: str):
+        broker.unsubscribe(self, topic)
+        return 0, self.mid
+
+    def publish(self, topic: str, payload: Any = None, qos: int = 0, retain: bool = False) -> SimMessageInfo:
+        if payload is None:
+            payload = b''
+        elif not isinstance(payload, (bytes, bytearray)):
+            payload = str(payload).encode()
+        self.mid += 1
+        broker.publish(SimMessage(topic, bytes(payload), qos, retain))
+        if self.on_publish is not None:
+            self.on_publish(self, None, self.mid, 0, None)
+        return SimMessageInfo(self.mid)
+
+    def deliver(self, message: SimMessage):
+        if self.on_message is not None:
+            self.on_message(self, None, message)
@@ -0,0 +1,169 @@
+from bisect import bisect_left, insort
+from collections import deque
+import math
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+SEVERITIES = ('ok', 'warn', 'alert')
+
+
+def worst_severity(*severities: str) -> str:
+    """Returns the most severe of `severities`, unknown ones (e.g. 'info') rank lowest."""
+    return max(severities, key=lambda severity: SEVERITIES.index(severity) if severity in SEVERITIES else -1)
+
+
+class RollingStats():
+    """Streaming statistics and anomaly flags of one sensor.
+
+    Mean and variance over the last `window` samples are updated in O(1) per
+    sample (Welford with removal), EWMA mean/variance use `alpha`. The
+    window is also kept sorted for the median, which costs one insort and
+    one removal per sample. Only the window is kept, never the full stream.
+
+    jump   the sample is further than `jump_sigma` EWMA standard deviations
+           (and at least `min_jump`) away from the EWMA before it
+    stuck  the last `stuck_after` samples were all identical (None disables
+           it for sensors that legitimately report the same value for long)
+    """
+
+    def __init__(self, window: int = 60, alpha: float = 0.1, jump_sigma: float = 4.0, min_jump: float = 0.0,
+                 stuck_after: Optional[int] = 30, warmup: int = 10):
+        self.window: deque = deque(maxlen=window)
+        self.sorted: List[float] = []
+        self.alpha = alpha
+        self.jump_sigma = jump_sigma
+        self.min_jump = min_jump
+        self.stuck_after = stuck_after
+        self.warmup = warmup
+
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ewma: Optional[float] = None
+        self.ewm_var = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.last: Optional[float] = None
+        self.last_time: Optional[float] = None
+        self.repeats = 0
+
+        self.jumps = 0
+        self.stuck = False
+        self.stuck_episodes = 0
+        self.last_anomaly: Optional[Dict[str, Any]] = None
+
+    def update(self, value: float, timestamp: Optional[float] = None) -> List[str]:
+        """Adds a sample and returns the anomalies it raised."""
+        timestamp = timestamp if timestamp is not None else time.time()
+        anomalies = []
+
+        if self.ewma is not None and self.count >= self.warmup:
+            threshold = max(self.jump_sigma * math.sqrt(self.ewm_var), self.min_jump)
+            if abs(value - self.ewma) > threshold:
+                anomalies.append('jump')
+                self.jumps += 1
+
+        self.repeats = self.repeats + 1 if value == self.last else 1
+        was_stuck = self.stuck
+        self.stuck = self.stuck_after is not None and self.repeats >= self.stuck_after
+        if self.stuck and not was_stuck:
+            anomalies.append('stuck')
+            self.stuck_episodes += 1
+
+        self._slide(value)
+        if self.ewma is None:
+            self.ewma = value
+        else:
+            delta = value - self.ewma
+            self.ewma += self.alpha * delta
+            self.ewm_var = (1 - self.alpha) * (self.ewm_var + self.alpha * delta * delta)
+
+        self.count += 1
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+        self.last = value
+        self.last_time = timestamp
+        if anomalies:
+            self.last_anomaly = {'kind': anomalies[0], 'value': value, 'time': timestamp}
+        return anomalies
+
+    def _slide(self, value: float):
+        if len(self.window) == self.window.maxlen:
+            old = self.window.popleft()
+            del self.sorted[bisect_left(self.sorted, old)]
+            n = len(self.window)
+            delta = old - self.mean
+            self.mean = self.mean - delta / n if n else 0.0
+            self.m2 = max(self.m2 - delta * (old - self.mean), 0.0) if n else 0.0
+
+        self.window.append(value)
+        insort(self.sorted, value)
+        delta = value - self.mean
+        self.mean += delta / len(self.window)
+        self.m2 += delta * (value - self.mean)
+
+    def median(self) -> Optional[float]:
+        n = len(self.sorted)
+        if not n:
+            return None
+        middle = n // 2
+        return self.sorted[middle] if n % 2 else (self.sorted[middle - 1] + self.sorted[middle]) / 2
+
+    def stddev(self) -> float:
+        n = len(self.window)
+        return math.sqrt(self.m2 / (n - 1)) if n > 1 else 0.0
+
+    def severity(self, recent: float = 60) -> str:
+        """'alert' after a jump in the last `recent` seconds, 'warn' while stuck."""
+        anomaly = self.last_anomaly
+        if anomaly is not None and anomaly['kind'] == 'jump' and time.time() - anomaly['time'] <= recent:
+            return 'alert'
+        return 'warn' if self.stuck else 'ok'
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'window': len(self.window),
+            'last': self.last,
+            'last_time': self.last_time,
+            'mean': round(self.mean, 4),
+            'stddev': round(self.stddev(), 4),
+            'median': self.median(),
+            'ewma': round(self.ewma, 4) if self.ewma is not None else None,
+            'ewm_stddev': round(math.sqrt(self.ewm_var), 4),
+            'min': self.minimum if self.count else None,
+            'max': self.maximum if self.count else None,
+            'jumps': self.jumps,
+            'stuck': self.stuck,
+            'stuck_episodes': self.stuck_episodes,
+            'last_anomaly': self.last_anomaly,
+            'severity': self.severity(),
+        }
+
+
+class StreamAnalytics():
+    """One RollingStats per sensor name, `settings` are per sensor keyword arguments."""
+
+    def __init__(self, settings: Dict[str, Dict[str, Any]]):
+        self.sensors = {sensor: RollingStats(**options) for sensor, options in settings.items()}
+        self.lock = threading.Lock()
+
+    def record(self, sensor: str, value: Any, timestamp: Optional[float] = None) -> List[str]:
+        stats = self.sensors.get(sensor)
+        if stats is None or not isinstance(value, (int, float)) or isinstance(value, bool):
+            return []
+        with self.lock:
+            return stats.update(float(value), timestamp)
+
+    def severity(self, sensor: str) -> str:
+        with self.lock:
+            return self.sensors[sensor].severity()
+
+    def summary(self, sensor: Optional[str] = None) -> Dict[str, Any]:
+        if sensor is not None and sensor not in self.sensors:
+            raise KeyError(f'unknown sensor {sensor!r}')
+        with self.lock:
+            if sensor is not None:
+                return self.sensors[sensor].summary()
+            return {name: stats.summary() for name, stats in self.sensors.items()}
@@ -0,0 +1,286 @@
+"""
+Structured, rate limited logging for the sensor loops.
+
+Every log line is an event name plus key/value fields, written as logfmt
+(`ts=... level=info event=light_sample lux=250.83`) so Loki can parse it
+with `| logfmt`. The calling thread only checks the per-event rate limit
+or sample rate and puts the record on a bounded queue; formatting and the
+stdout write happen on a QueueListener thread. When the queue is full the
+line is dropped and counted instead of blocking a sensor loop.
+
+LOG_LEVEL        minimum level (default INFO)
+LOG_RATE_LIMITS  lines per second per event, e.g. "distance_sample=0.1,light_sample=0.5",
+                 on top of DEFAULT_RATE_LIMITS
+LOG_SAMPLE_EVERY keep one line out of N per event, e.g. "distance_sample=100"
+
+Suppressed lines are not lost without a trace: the next line of the same
+event carries `suppressed=<count>`.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+# the sampling loops log every reading; one line per minute and sensor is
+# plenty for Loki, the values themselves are in /metrics and the store
+DEFAULT_RATE_LIMITS = {
+    'distance_sample': 1 / 60,
+    'light_sample': 1 / 60,
+    'air_sample': 1 / 60,
+    'sampling_task_failed': 0.2,
+    # a stuck display fails on every frame
+    'matrix_update_failed': 0.1,
+}
+# events rate limited per value of a field instead of as a whole
+RATE_LIMIT_KEYS = {
+    'sampling_task_failed': 'task',
+}
+
+# (event, value of its key field) a rate limit applies to
+Bucket = Tuple[str, Optional[str]]
+
+_SAFE_CHARACTERS = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789._-:/+')
+
+
+def parse_limits(text: Optional[str]) -> Dict[str, float]:
+    """Parses "event=value,event=value" as used by LOG_RATE_LIMITS and LOG_SAMPLE_EVERY."""
+    limits = {}
+    for item in (text or '').split(','):
+        if '=' not in item:
+            continue
+        event, value = item.split('=', 1)
+        limits[event.strip()] = float(value)
+    return limits
+
+
+def format_field(value: Any) -> str:
+    if isinstance(value, float):
+        text = repr(round(value, 6))
+    else:
+        text = str(value)
+    if text and all(character in _SAFE_CHARACTERS for character in text):
+        return text
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+
+class LogStats():
+    """Log volume and the time spent logging, by event and outcome."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events: Dict[str, Dict[str, int]] = {}
+        self.lines = 0
+        self.bytes = 0
+        self.dropped = 0
+        self.suppressed = 0
+        self.caller_seconds = 0.0
+        self.writer_seconds = 0.0
+
+    def count(self, event: str, outcome: str):
+        with self.lock:
+            counts = self.events.setdefault(event, {'written': 0, 'suppressed': 0, 'dropped': 0})
+            counts[outcome] += 1
+            if outcome == 'suppressed':
+                self.suppressed += 1
+            elif outcome == 'dropped':
+                self.dropped += 1
+
+    def written(self, event: str, size: int, seconds: float):
+        with self.lock:
+            counts = self.events.setdefault(event, {'written': 0, 'suppressed': 0, 'dropped': 0})
+            counts['written'] += 1
+            self.lines += 1
+            self.bytes += size
+            self.writer_seconds += seconds
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'lines': self.lines,
+                'bytes': self.bytes,
+                'suppressed': self.suppressed,
+                'dropped': self.dropped,
+                'caller_ms': round(self.caller_seconds * 1000, 3),
+                'writer_ms': round(self.writer_seconds * 1000, 3),
+                'events': {event: dict(counts) for event, counts in self.events.items()},
+            }
+
+
+stats = LogStats()
+
+
+class EventFilter():
+    """Rate limit (token bucket, burst of one line) or 1-in-N sampling per event.
+
+    Events listed in `keys` get a bucket per value of that field instead of
+    one per event, e.g. one per sampling task, so a sensor that fails all
+    the time cannot use up the budget of the others.
+    """
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None, sample_every: Optional[Dict[str, float]] = None,
+                 keys: Optional[Dict[str, str]] = None):
+        self.rates = rates or {}
+        self.sample_every = {event: max(1, int(every)) for event, every in (sample_every or {}).items()}
+        self.keys = keys or {}
+        self.lock = threading.Lock()
+        self.tokens: Dict[Bucket, float] = {}
+        self.refilled: Dict[Bucket, float] = {}
+        self.seen: Dict[Bucket, int] = {}
+        self.pending_suppressed: Dict[Bucket, int] = {}
+
+    def check(self, event: str, fields: Optional[Dict[str, Any]] = None) -> Optional[int]:
+        """None when the line is held back, else how many lines of its bucket were held back before it."""
+        # only events with a configured limit are ever held back
+        if event not in self.rates and event not in self.sample_every:
+            return 0
+        key_field = self.keys.get(event)
+        bucket = (event, str((fields or {}).get(key_field)) if key_field else None)
+        with self.lock:
+            if self._allowed(event, bucket):
+                return self.pending_suppressed.pop(bucket, 0)
+            self.pending_suppressed[bucket] = self.pending_suppressed.get(bucket, 0) + 1
+        stats.count(event, 'suppressed')
+        return None
+
+    def _allowed(self, event: str, bucket: Bucket) -> bool:
+        every = self.sample_every.get(event)
+        if every is not None:
+            seen = self.seen.get(bucket, 0)
+            self.seen[bucket] = seen + 1
+            if seen % every:
+                return False
+        rate = self.rates.get(event)
+        if rate is None:
+            return True
+        now = time.monotonic()
+        tokens = min(1.0, self.tokens.get(bucket, 1.0) + (now - self.refilled.get(bucket, now)) * rate)
+        self.refilled[bucket] = now
+        if tokens < 1.0:
+            self.tokens[bucket] = tokens
+            return False
+        self.tokens[bucket] = tokens - 1.0
+        return True
+
+
+class LogfmtFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        created = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created))
+        parts = [f'ts={created}.{int(record.msecs):03d}Z', f'level={record.levelname.lower()}', f'logger={record.name}']
+        if hasattr(record, 'event'):
+            parts.append(f'event={format_field(record.event)}')
+        else:
+            # lines from plain logging calls of other libraries
+            parts.append(f'msg={format_field(record.getMessage())}')
+        for key, value in getattr(record, 'fields', {}).items():
+            parts.append(f'{key}={format_field(value)}')
+        if record.exc_info:
+            parts.append(f'exc={format_field(self.formatException(record.exc_info))}')
+        return ' '.join(parts)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks and leaves the formatting to the listener."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            stats.count(getattr(record, 'event', record.name), 'dropped')
+
+
+class CountingStreamHandler(logging.StreamHandler):
+    """Writes on the listener thread and accounts the bytes and time per line."""
+
+    def emit(self, record: logging.LogRecord):
+        started = time.perf_counter()
+        try:
+            line = self.format(record) + self.terminator
+            self.stream.write(line)
+            self.flush()
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+            return
+        stats.written(getattr(record, 'event', record.name), len(line.encode()), time.perf_counter() - started)
+
+
+class EventLogger():
+    """logging.Logger wrapper taking an event name and key/value fields.
+
+    The rate limit is checked before a LogRecord is built, so a held back
+    line costs a dict lookup and a lock.
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+
+    def log(self, level: int, event: str, exc_info: Any = None, **fields: Any):
+        if not self.logger.isEnabledFor(level):
+            return
+        started = time.perf_counter()
+        suppressed = _filter.check(event, fields)
+        if suppressed is None:
+            return
+        if suppressed:
+            fields['suppressed'] = suppressed
+        self.logger.log(level, event, exc_info=exc_info, extra={'event': event, 'fields': fields})
+        elapsed = time.perf_counter() - started
+        with stats.lock:
+            stats.caller_seconds += elapsed
+
+    def debug(self, event: str, **fields: Any):
+        self.log(logging.DEBUG, event, **fields)
+
+    def info(self, event: str, **fields: Any):
+        self.log(logging.INFO, event, **fields)
+
+    def warning(self, event: str, **fields: Any):
+        self.log(logging.WARNING, event, **fields)
+
+    def error(self, event: str, **fields: Any):
+        self.log(logging.ERROR, event, **fields)
+
+
+_filter = EventFilter(keys=RATE_LIMIT_KEYS)
+_listener: Optional[logging.handlers.QueueListener] = None
+_configure_lock = threading.Lock()
+
+
+def configure(level: Optional[str] = None, rates: Optional[Dict[str, float]] = None,
+              sample_every: Optional[Dict[str, float]] = None, max_queue: int = 1024, stream: Any = None):
+    """Installs the queue handler on the root logger; later calls only update the limits."""
+    global _listener
+    with _configure_lock:
+        root = logging.getLogger()
+        rates = rates if rates is not None else dict(DEFAULT_RATE_LIMITS, **parse_limits(os.getenv('LOG_RATE_LIMITS')))
+        sample_every = sample_every if sample_every is not None else parse_limits(os.getenv('LOG_SAMPLE_EVERY'))
+        root.setLevel((level or os.getenv('LOG_LEVEL', 'INFO')).upper())
+        with _filter.lock:
+            _filter.rates.update(rates)
+            _filter.sample_every.update({event: max(1, int(every)) for event, every in sample_every.items()})
+        if _listener is not None:
+            return
+
+        records: 'queue.Queue[logging.LogRecord]' = queue.Queue(max_queue)
+        handler = DroppingQueueHandler(records)
+        writer = CountingStreamHandler(stream or sys.stdout)
+        writer.setFormatter(LogfmtFormatter())
+        _listener = logging.handlers.QueueListener(records, writer)
+        _listener.start()
+        root.addHandler(handler)
+        # writes what is still queued when the process exits normally
+        atexit.register(_listener.stop)
+
+
+def get_logger(name: str) -> EventLogger:
+    if _listener is None:
+        configure()
+    return EventLogger(logging.getLogger(name))
@@ -0,0 +1,292 @@
+"""
+On-device time-series store for the sensor samples.
+
+Samples are kept in memory and written by a background thread in one
+SQLite transaction every `flush_interval` seconds, so the SD card sees a
+few large writes instead of one per sample. The database runs in WAL mode
+with synchronous=NORMAL; readers never block the writer.
+
+Three tiers, each with its own retention:
+
+    samples    raw values (ms timestamps)
+    rollup_1m  min/max/sum/count per minute
+    rollup_1h  min/max/sum/count per hour
+
+Rollups are updated from each batch with upserts, so a flush touches at
+most one row per sensor and minute/hour besides the raw rows. Sensors are
+stored by their wire_format id.
+"""
+
+from collections import deque
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from structured_log import get_logger
+from wire_format import SENSOR_IDS, SENSORS
+
+log = get_logger('tsdb')
+
+DAY = 24 * 3600
+
+# resolution -> (table, bucket seconds)
+ROLLUPS = {
+    '1m': ('rollup_1m', 60),
+    '1h': ('rollup_1h', 3600),
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS samples (
+    sensor INTEGER NOT NULL,
+    t INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (sensor, t)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_1m (
+    sensor INTEGER NOT NULL,
+    t INTEGER NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    sum REAL NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (sensor, t)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_1h (
+    sensor INTEGER NOT NULL,
+    t INTEGER NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    sum REAL NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (sensor, t)
+) WITHOUT ROWID;
+'''
+
+UPSERT = '''
+INSERT INTO {table} (sensor, t, min, max, sum, count) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (sensor, t) DO UPDATE SET
+    min = min(min, excluded.min),
+    max = max(max, excluded.max),
+    sum = sum + excluded.sum,
+    count = count + excluded.count
+'''
+
+Sample = Tuple[int, int, float]  # sensor id, unix ms, value
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    connection.execute('PRAGMA journal_mode=WAL')
+    # a power cut may lose the last transaction, never corrupts the database
+    connection.execute('PRAGMA synchronous=NORMAL')
+    # keep the WAL small on the card after each checkpoint
+    connection.execute('PRAGMA journal_size_limit=4194304')
+    return connection
+
+
+class TimeSeriesStore():
+    """Batched SQLite store with 1 minute and 1 hour rollups and retention per tier.
+
+    `record()` only appends to memory. At most `max_pending` samples wait for
+    the writer; when the disk cannot keep up the oldest are dropped.
+    """
+
+    MAX_POINTS = 2000
+
+    def __init__(self, path: str, flush_interval: float = 10.0, raw_retention: float = 2 * DAY,
+                 minute_retention: float = 60 * DAY, hour_retention: Optional[float] = 5 * 365 * DAY,
+                 max_pending: int = 100000, start_thread: bool = True):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.retention = {'samples': raw_retention, 'rollup_1m': minute_retention, 'rollup_1h': hour_retention}
+        self.pending: Deque[Sample] = deque(maxlen=max_pending)
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.read_lock = threading.Lock()
+        self.stopped = threading.Event()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.writer = _connect(path)
+        self.writer.executescript(SCHEMA)
+        self.reader = _connect(path)
+
+        self.samples_dropped = 0
+        self.flushes = 0
+        self.samples_written = 0
+        self.rollup_rows_written = 0
+        self.last_flush_seconds = 0.0
+        self.last_prune = 0.0
+
+        self.thread: Optional[threading.Thread] = None
+        if start_thread:
+            self.thread = threading.Thread(target=self._run, name='tsdb-writer', daemon=True)
+            self.thread.start()
+
+    def record(self, sensor: str, value: Any, timestamp: Optional[float] = None):
+        sensor_id = SENSOR_IDS.get(sensor)
+        if sensor_id is None or not isinstance(value, (int, float)) or isinstance(value, bool):
+            return
+        timestamp = timestamp if timestamp is not None else time.time()
+        with self.lock:
+            if len(self.pending) == self.pending.maxlen:
+                self.samples_dropped += 1
+            self.pending.append((sensor_id, int(timestamp * 1000), float(value)))
+
+    def flush(self):
+        """Writes everything pending in one transaction."""
+        with self.write_lock:
+            with self.lock:
+                batch = list(self.pending)
+                self.pending.clear()
+            if not batch:
+                return
+            started = time.perf_counter()
+            rollups = {resolution: self._aggregate(batch, seconds) for resolution, (_, seconds) in ROLLUPS.items()}
+            try:
+                with self.writer:
+                    self.writer.execute('BEGIN')
+                    self.writer.executemany('INSERT OR REPLACE INTO samples (sensor, t, value) VALUES (?, ?, ?)', batch)
+                    for resolution, rows in rollups.items():
+                        self.writer.executemany(UPSERT.format(table=ROLLUPS[resolution][0]), rows)
+            except sqlite3.Error:
+                # rolled back, keep the batch for the next try
+                self._requeue(batch)
+                raise
+            self.flushes += 1
+            self.samples_written += len(batch)
+            self.rollup_rows_written += sum(len(rows) for rows in rollups.values())
+            self.last_flush_seconds = time.perf_counter() - started
+
+    def _requeue(self, batch: List[Sample]):
+        """Puts a failed batch back in front of what was recorded since, dropping the oldest rows on overflow."""
+        with self.lock:
+            # extendleft on a full deque would silently drop the newest samples instead
+            overflow = len(batch) + len(self.pending) - self.pending.maxlen
+            if overflow > 0:
+                batch = batch[overflow:]
+                self.samples_dropped += overflow
+            self.pending.extendleft(reversed(batch))
+
+    @staticmethod
+    def _aggregate(batch: List[Sample], seconds: int) -> List[Tuple[int, int, float, float, float, int]]:
+        buckets: Dict[Tuple[int, int], List[float]] = {}
+        for sensor_id, t, value in batch:
+            key = (sensor_id, t // 1000 // seconds * seconds)
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [value, value, value, 1]
+                continue
+            if value < bucket[0]:
+                bucket[0] = value
+            if value > bucket[1]:
+                bucket[1] = value
+            bucket[2] += value
+            bucket[3] += 1
+        return [(sensor_id, t, low, high, total, int(count))
+                for (sensor_id, t), (low, high, total, count) in buckets.items()]
+
+    def prune(self, now: Optional[float] = None):
+        """Deletes what is older than the retention of its tier."""
+        now = now if now is not None else time.time()
+        with self.write_lock, self.writer:
+            self.writer.execute('BEGIN')
+            for table, retention in self.retention.items():
+                if retention is None:
+                    continue
+                cutoff = now - retention
+                if table == 'samples':
+                    cutoff *= 1000
+                for sensor_id in SENSORS:
+                    self.writer.execute(f'DELETE FROM {table} WHERE sensor = ? AND t < ?', (sensor_id, int(cutoff)))
+        self.last_prune = now
+
+    def query(self, sensor: str, start: float, end: Optional[float] = None, resolution: str = 'auto') -> Dict[str, Any]:
+        """Points of `sensor` between `start` and `end` (unix seconds, <= 0 is relative to now)."""
+        sensor_id = SENSOR_IDS.get(sensor)
+        if sensor_id is None:
+            raise KeyError(f'unknown sensor {sensor!r}')
+        now = time.time()
+        end = now if end is None else end
+        start = now + start if start <= 0 else start
+        end = now + end if end <= 0 else end
+        if end < start:
+            raise ValueError('end must not be before start')
+        if resolution == 'auto':
+            resolution = self._resolution(start, end, now)
+        if resolution != 'raw' and resolution not in ROLLUPS:
+            raise ValueError(f"resolution must be one of {['auto', 'raw'] + list(ROLLUPS)}")
+
+        if resolution == 'raw':
+            with self.read_lock:
+                rows = self.reader.execute(
+                    'SELECT t, value FROM samples WHERE sensor = ? AND t >= ? AND t <= ? ORDER BY t LIMIT ?',
+                    (sensor_id, int(start * 1000), int(end * 1000), self.MAX_POINTS)).fetchall()
+            points = [{'t': t / 1000, 'value': value} for t, value in rows]
+            # samples the writer has not flushed yet
+            with self.lock:
+                pending = [(t, value) for pending_id, t, value in self.pending
+                           if pending_id == sensor_id and start * 1000 <= t <= end * 1000]
+            points.extend({'t': t / 1000, 'value': value} for t, value in pending[:self.MAX_POINTS - len(points)])
+        else:
+            table, seconds = ROLLUPS[resolution]
+            with self.read_lock:
+                rows = self.reader.execute(
+                    f'SELECT t, min, max, sum, count FROM {table} WHERE sensor = ? AND t >= ? AND t <= ? ORDER BY t LIMIT ?',
+                    (sensor_id, int(start // seconds * seconds), int(end), self.MAX_POINTS)).fetchall()
+            points = [{'t': t, 'min': low, 'max': high, 'avg': round(total / count, 4), 'count': count}
+                      for t, low, high, total, count in rows]
+
+        return {'sensor': sensor, 'resolution': resolution, 'start': start, 'end': end, 'points': points}
+
+    def _resolution(self, start: float, end: float, now: float) -> str:
+        """Finest tier that still holds `start` and keeps the answer below MAX_POINTS."""
+        span = end - start
+        if now - start <= self.retention['samples'] and span <= 3600:
+            return 'raw'
+        if now - start <= self.retention['rollup_1m'] and span / 60 <= self.MAX_POINTS:
+            return '1m'
+        return '1h'
+
+    def stats(self) -> Dict[str, Any]:
+        sizes = {}
+        for suffix in ('', '-wal'):
+            try:
+                sizes['db' + suffix.replace('-', '_')] = os.path.getsize(self.path + suffix)
+            except OSError:
+                sizes['db' + suffix.replace('-', '_')] = 0
+        with self.lock:
+            pending = len(self.pending)
+        return {
+            'path': self.path,
+            'pending': pending,
+            'samples_dropped': self.samples_dropped,
+            'flushes': self.flushes,
+            'samples_written': self.samples_written,
+            'rollup_rows_written': self.rollup_rows_written,
+            'rows_per_flush': round((self.samples_written + self.rollup_rows_written) / self.flushes, 1) if self.flushes else None,
+            'last_flush_ms': round(self.last_flush_seconds * 1000, 3),
+            'bytes': sizes['db'],
+            'wal_bytes': sizes['db_wal'],
+        }
+
+    def close(self):
+        """Writes what is pending and stops the writer."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+        self.writer.close()
+        self.reader.close()
+
+    def _run(self):
+        while not self.stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.time() - self.last_prune >= 3600:
+                    self.prune()
+            except sqlite3.Error as exc:
+                log.error('tsdb_write_failed', error=exc)
@@ -1,5 +1,5 @@
-import RPi.GPIO as GPIO
-import time
+from actuators import ActuatorTimeline
+from hardware import GPIO
 
 # Pin für den Buzzer (BOARD-Modus = physikalisch Pin 33 = GPIO13)
 buzzer_pin = 13
@@ -38,18 +38,13 @@ GPIO.setup(buzzer_pin, GPIO.OUT)
 pwm = GPIO.PWM(buzzer_pin, 440)  # Initialfrequenz
 pwm.start(0)
 
+# spielt im Hintergrund, das Skript wartet hier nur auf das Ende der Melodie
+actuators = ActuatorTimeline()
 try:
-    for note in melody:
-        freq = notes[note]
-        if freq == 0:
-            pwm.ChangeDutyCycle(0)
-        else:
-            pwm.ChangeFrequency(freq)
-            pwm.ChangeDutyCycle(200)  # 50% Duty für hörbaren Ton
-        time.sleep(note_duration)
-        pwm.ChangeDutyCycle(0)
-        time.sleep(0.05)  # kurze Pause zwischen Noten
+    playing = actuators.melody(pwm, [(notes[note], note_duration) for note in melody], gap=0.05, duty_cycle=50)
+    playing.result()
 
 finally:
+    actuators.close()
     pwm.stop()
     GPIO.cleanup()
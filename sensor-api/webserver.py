@@ -1,60 +1,195 @@
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from time import sleep
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
 import threading
 import json
+import math
 import os
-from typing import Any, Dict
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlsplit
 
-import paho.mqtt.client as mqtt
+from hardware import GPIO, MqttClient
+from structured_log import get_logger, stats as log_stats
+
+log = get_logger('webserver')
 
 
 def on_connect(client, userdata, flags, reason_code, properites):
-    print(f'Connected to MQTT Broker with result {reason_code}')
+    log.info('mqtt_connected', result=reason_code)
+    # subscribing here renews the command subscriptions after every reconnect
+    router.subscribe(client)
 
 
 def on_disconnect(client, userdata, reason_code, properties=None):  # pylint: disable=unused-argument
     if reason_code != 0:
-        print('MQTT connection lost, attempting to reconnect...')
-
+        log.warning('mqtt_disconnected', result=reason_code)
 
 
-def on_message(client, userdata, msg: object):
-    print(msg.topic + ' ' + str(msg.payload))
-
 
 MQTT_BROKER_HOST = os.getenv('MQTT_BROKER_HOST', '192.168.1.129')
 MQTT_BROKER_PORT = int(os.getenv('MQTT_BROKER_PORT', '1883'))
-
-mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+# when set, sensor readings are collected into one JSON message on this topic
+MQTT_BATCH_TOPIC = os.getenv('MQTT_BATCH_TOPIC') or None
+# when set, messages are spooled to disk here while the broker is unreachable
+MQTT_SPOOL_DIR = os.getenv('MQTT_SPOOL_DIR') or None
+# when set, the node id is put into the sensor topics so aggregator.py can
+# tell the nodes of a fleet apart (mondaymorning/sensors/<node>/light)
+NODE_ID = os.getenv('NODE_ID') or None
+SENSOR_TOPIC = 'mondaymorning/sensors/' + (f'{NODE_ID}/' if NODE_ID else '')
+LIGHT_TOPIC = SENSOR_TOPIC + 'light'
+DISTANCE_TOPIC = SENSOR_TOPIC + 'distance'
+# when set, readings are also sent as binary frames (wire_format.py) with
+# sequence number and capture time; the text topics stay for the dashboard
+MQTT_BINARY_TOPIC = os.getenv('MQTT_BINARY_TOPIC') or None
+if MQTT_BINARY_TOPIC and NODE_ID:
+    MQTT_BINARY_TOPIC += f'/{NODE_ID}'
+# commands for this node, e.g. mondaymorning/commands/<node>/sensors/light/cadence
+COMMAND_TOPIC = 'mondaymorning/commands/' + (f'{NODE_ID}/' if NODE_ID else '')
+
+mqtt_client = MqttClient()
 mqtt_client.on_connect = on_connect
 mqtt_client.on_disconnect = on_disconnect
-mqtt_client.on_message = on_message
-mqtt_client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT, 60)
 
-from air_sensor import AirSensor
-from light_sensor import LightSensor
+from actuators import ActuatorTimeline
+from air_sensor import MIN_INTERVAL as AIR_INTERVAL, AirSensor
 from distance_sensor import DistanceSensor
-
-
-airSensor = AirSensor()
-lightSensor = LightSensor()
-distanceSensor = DistanceSensor()
+from broadcaster import Broadcaster
+from history import SensorHistory
+from i2c_bus import buses
+from lazy_device import LazyDevice
+from instrumentation import (
+    OPENMETRICS_CONTENT_TYPE, PROMETHEUS_CONTENT_TYPE, REGISTRY, Counter, Gauge, Histogram, wants_openmetrics,
+)
+from mqtt_publisher import MqttPublisher, TopicPolicy
+from mqtt_router import TopicRouter
+from mqtt_spool import MqttSpool
+from response_cache import ResponseCache, Snapshot
+from scheduler import SamplingScheduler, SamplingTask
+from stream_stats import StreamAnalytics
+from tsdb import DAY, TimeSeriesStore
+
+
+# Readings only go out when they moved more than the deadband and at most
+# once per min_interval; the heartbeat republishes unchanged values.
+publisher = MqttPublisher(
+    mqtt_client,
+    {
+        LIGHT_TOPIC: TopicPolicy(
+            qos=1,
+            deadband=float(os.getenv('MQTT_LIGHT_DEADBAND', '1.0')),
+            min_interval=2,
+            max_interval=60,
+            batch=MQTT_BATCH_TOPIC is not None,
+            sensor='light',
+        ),
+        DISTANCE_TOPIC: TopicPolicy(
+            qos=0,
+            deadband=float(os.getenv('MQTT_DISTANCE_DEADBAND', '0.5')),
+            min_interval=1,
+            max_interval=60,
+            batch=MQTT_BATCH_TOPIC is not None,
+            sensor='distance',
+        ),
+        'mondaymorning/up': TopicPolicy(qos=1, retain=True),
+    },
+    batch_topic=MQTT_BATCH_TOPIC,
+    spool=MqttSpool(MQTT_SPOOL_DIR, max_segments=int(os.getenv('MQTT_SPOOL_SEGMENTS', '16'))) if MQTT_SPOOL_DIR else None,
+    binary_topic=MQTT_BINARY_TOPIC,
+)
+
+# command topics are handled on a small worker pool, never on the paho network thread
+router = TopicRouter(workers=int(os.getenv('MQTT_COMMAND_WORKERS', '2')),
+                     max_pending=int(os.getenv('MQTT_COMMAND_QUEUE', '32')))
+mqtt_client.on_message = router.on_message
+
+
+SENSOR_READ_SECONDS = Histogram('sensor_read_duration_seconds', 'time spent reading a sensor', ['sensor'])
+SENSOR_READ_ERRORS = Counter('sensor_read_errors_total', 'sensor reads that raised an error', ['sensor'])
+SENSOR_READ_RETRIES = Counter('sensor_read_retries_total', 'invalid readouts that had to be repeated', ['sensor'])
+SENSOR_LAST_UPDATE = Gauge('sensor_last_update_timestamp_seconds', 'unix time of the last sample', ['sensor'])
+MQTT_MESSAGES = Counter('mqtt_messages_total', 'messages seen by the MQTT publisher by outcome', ['outcome'])
+MQTT_QUEUE = Gauge('mqtt_queue_messages', 'messages waiting in the MQTT publisher', ['queue'])
+SAMPLING_DEADLINE_MISSES = Counter('sampling_deadline_misses_total', 'sampling runs that finished after their deadline', ['task'])
+SAMPLING_JITTER = Gauge('sampling_jitter_seconds', 'average start delay of a sampling task', ['task'])
+SAMPLING_LATE_STARTS = Counter('sampling_late_starts_total', 'sampling runs that started more than 20 ms after their due time', ['task'])
+LOG_LINES = Counter('log_lines_total', 'log lines by outcome', ['outcome'])
+LOG_BYTES = Counter('log_bytes_total', 'bytes of log lines written to stdout')
+LOG_SECONDS = Counter('log_seconds_total', 'time spent logging, in the caller and on the writer thread', ['side'])
+
+for outcome in ('published', 'suppressed_deadband', 'coalesced', 'batched', 'spooled'):
+    MQTT_MESSAGES.labels(outcome).set_function(lambda outcome=outcome: publisher.counters[outcome])
+MQTT_QUEUE.labels('pending').set_function(publisher.pending)
+if publisher.spool is not None:
+    MQTT_QUEUE.labels('spool').set_function(publisher.spool.depth)
+LOG_LINES.labels('written').set_function(lambda: log_stats.lines)
+LOG_LINES.labels('suppressed').set_function(lambda: log_stats.suppressed)
+LOG_LINES.labels('dropped').set_function(lambda: log_stats.dropped)
+LOG_BYTES.labels().set_function(lambda: log_stats.bytes)
+LOG_SECONDS.labels('caller').set_function(lambda: log_stats.caller_seconds)
+LOG_SECONDS.labels('writer').set_function(lambda: log_stats.writer_seconds)
+
+
+def publish(topic: str, value: Any, captured_ns: Optional[int] = None) -> bool:
+    return publisher.publish(topic, value, captured_ns)
 
 
 host = '0.0.0.0'
-port = 8080
+port = int(os.getenv('WEBSERVER_PORT', '8080'))
+started_monotonic = time.monotonic()
+# 'threaded' serves every request on its own thread, 'single' keeps the old
+# one-request-at-a-time HTTPServer (useful as a benchmark baseline).
+server_mode = os.getenv('WEBSERVER_MODE', 'threaded')
 
 
 latest_values: Dict[str, Any] = {
     'light': None,
     'distance': None,
+    'air': None,
 }
 latest_values_lock = threading.Lock()
+# bumped whenever one of the latest values actually changes
+latest_generation = 0
+
+# fixed memory history of every sample, 16 bytes per slot and sensor
+history = SensorHistory(
+    ['light', 'distance', 'air_temperature', 'air_humidity'],
+    int(os.getenv('HISTORY_SIZE', '43200')),
+)
+
+# every sample on disk with 1m/1h rollups, see GET /range; off unless TSDB_PATH is set
+TSDB_PATH = os.getenv('TSDB_PATH') or None
+store = TimeSeriesStore(
+    TSDB_PATH,
+    flush_interval=float(os.getenv('TSDB_FLUSH_INTERVAL', '30')),
+    raw_retention=float(os.getenv('TSDB_RAW_DAYS', '2')) * DAY,
+    minute_retention=float(os.getenv('TSDB_MINUTE_DAYS', '60')) * DAY,
+) if TSDB_PATH else None
+
+# rolling statistics and jump/stuck detection per sensor, see GET /stats;
+# the DHT11 only reports whole degrees/percent, so it is never flagged as stuck;
+# the BH1750 returns the same count for hours in steady indoor light, so
+# light only counts as stuck after an hour of identical samples (at 2 s)
+analytics = StreamAnalytics({
+    'light': {'min_jump': 20.0, 'stuck_after': 1800},
+    'distance': {'min_jump': 10.0},
+    'air_temperature': {'min_jump': 1.5, 'stuck_after': None},
+    'air_humidity': {'min_jump': 5.0, 'stuck_after': None},
+})
 
 
 def _cache_value(sensor: str, value: Any) -> Any:
+    global latest_generation
+    SENSOR_LAST_UPDATE.labels(sensor).set(time.time())
+    history.record(sensor, value)
+    analytics.record(sensor, value)
+    if store is not None:
+        store.record(sensor, value)
     with latest_values_lock:
-        latest_values[sensor] = value
+        changed = latest_values.get(sensor) != value
+        if changed:
+            latest_values[sensor] = value
+            latest_generation += 1
+    if changed:
+        _broadcast_update()
     return value
 
 
@@ -63,151 +198,517 @@ def _get_cached_value(sensor: str):
         return latest_values.get(sensor)
 
 
-def get_light_value() -> float:
-    cached_value = _get_cached_value('light')
-    if cached_value is not None:
-        return cached_value
+def _get_generation() -> int:
+    return latest_generation
 
-    try:
-        light_value = round(lightSensor.readLight(), 2)
-    except Exception as exc:  # pylint: disable=broad-except
-        print(f'Failed to read light sensor: {exc}')
-        raise
 
-    return _cache_value('light', light_value)
+def _snapshot_values() -> Snapshot:
+    with latest_values_lock:
+        return latest_generation, dict(latest_values)
+
+
+def _broadcast_update():
+    if not broadcaster.has_subscribers():
+        return
+    # the stream reuses the body rendered for GET /, serialized once for all clients
+    cached = response_cache.get('index')
+    broadcaster.publish(b'id: %d\nevent: update\ndata: %s\n\n' % (cached.generation, cached.body))
+
+
+def _cache_air(readout: Any):
+    if readout.is_valid():
+        history.record('air_temperature', readout.temperature)
+        history.record('air_humidity', readout.humidity)
+        analytics.record('air_temperature', readout.temperature)
+        analytics.record('air_humidity', readout.humidity)
+        if store is not None:
+            store.record('air_temperature', readout.temperature)
+            store.record('air_humidity', readout.humidity)
+    _cache_value('air', dict(readout.__dict__))
+
+
+def render_index(values: Dict[str, Any]) -> bytes:
+    response: Dict[str, Any] = {
+        'status': 'Ok',
+        'light': values.get('light'),
+        'air': values.get('air') or {},
+    }
+
+    if values.get('distance') is not None:
+        response['distance'] = values['distance']
+
+    return json.dumps(response).encode()
+
+
+def render_metrics(values: Dict[str, Any]) -> bytes:
+    light_value = values.get('light')
+    air = values.get('air') or {}
+    distance_value = values.get('distance')
+
+    metrics_lines = [
+        '# HELP light measured light intensity in lux',
+        '# TYPE light gauge',
+        f'light {light_value if light_value is not None else "NaN"}',
+        '# HELP air_temperature measured temperature in celcius',
+        '# TYPE air_temperature gauge',
+        f'air_temperature {air.get("temperature", "NaN")}',
+        '# HELP air_humidity measured humidity in percent',
+        '# TYPE air_humidity gauge',
+        f'air_humidity {air.get("humidity", "NaN")}',
+    ]
+
+    if distance_value is not None:
+        metrics_lines.extend([
+            '# HELP distance measured distance to obstacle in centimeters',
+            '# TYPE distance gauge',
+            f'distance {distance_value}',
+        ])
+
+    return ('\n'.join(metrics_lines) + '\n').encode()
+
+
+scheduler = SamplingScheduler()
+broadcaster = Broadcaster(max_subscribers=int(os.getenv('STREAM_MAX_CLIENTS', '64')))
+# a stream client whose socket takes no data for this long is disconnected
+STREAM_WRITE_TIMEOUT = float(os.getenv('STREAM_WRITE_TIMEOUT', '10'))
+
+
+response_cache = ResponseCache(_get_generation, _snapshot_values)
+response_cache.register('index', render_index)
+response_cache.register('metrics', render_metrics)
+
+
+
+
+def _create_light_sensor():
+    # importing light_sensor already opens the I2C bus
+    from light_sensor import LightSensor
+    return LightSensor()
+
+
+# sensors are created in the background by start_sampling(), so the server
+# answers right away; sampling skips a sensor until it is ready
+airSensor = LazyDevice('air', lambda: AirSensor(on_update=_cache_air, start_thread=False, initial_read=False))
+lightSensor = LazyDevice('light', _create_light_sensor)
+distanceSensor = LazyDevice('distance', DistanceSensor)
+sensors = [airSensor, lightSensor, distanceSensor]
+SENSOR_READ_RETRIES.labels('air').set_function(lambda: airSensor.instance.invalid_count if airSensor.ready else 0)
+# delay before sampling a sensor that is still initializing is retried
+NOT_READY_RETRY = 0.5
+
+
+# --- MQTT commands ---
+# the relay of the Joy-Pi (BOARD pin 40) is active low, like in relay.py
+RELAY_PIN = int(os.getenv('RELAY_PIN', '40'))
+# longest pulse a relay command may ask for, in seconds
+RELAY_MAX_PULSE = float(os.getenv('RELAY_MAX_PULSE', '60'))
+# longest cadence a command may set, in seconds
+MAX_CADENCE = DAY
+actuators: Optional[ActuatorTimeline] = None
+actuators_lock = threading.Lock()
+
+
+def _sensor_from_topic(topic: str) -> str:
+    # .../sensors/<sensor>/<command>
+    return topic.split('/')[-2]
+
+
+def _command_seconds(topic: str, payload: bytes, minimum: float, maximum: float) -> Optional[float]:
+    """The payload as seconds in [minimum, maximum]; None, and logged, for anything else."""
+    try:
+        seconds = float(payload)
+    except ValueError:
+        seconds = math.nan
+    if not (math.isfinite(seconds) and minimum <= seconds <= maximum):
+        log.warning('command_rejected', topic=topic, payload=payload[:32].decode(errors='replace'),
+                    minimum=minimum, maximum=maximum)
+        return None
+    return seconds
+
+
+def _command_task(topic: str) -> Optional[SamplingTask]:
+    """The sampling task named in the topic; None, and logged, for an unknown sensor."""
+    task = scheduler.tasks.get(_sensor_from_topic(topic))
+    if task is None:
+        log.warning('command_rejected', topic=topic, reason='unknown sensor')
+    return task
+
+
+@router.route(COMMAND_TOPIC + 'sensors/+/cadence')
+def command_cadence(topic: str, payload: bytes):
+    task = _command_task(topic)
+    if task is None:
+        return
+    sensor = task.name
+    cadence = _command_seconds(topic, payload, task.min_cadence, MAX_CADENCE)
+    if cadence is None:
+        return
+    scheduler.set_cadence(sensor, cadence)
+    log.info('command_cadence', sensor=sensor, cadence=cadence)
+
+
+@router.route(COMMAND_TOPIC + 'sensors/+/pause')
+def command_pause(topic: str, payload: bytes):  # pylint: disable=unused-argument
+    task = _command_task(topic)
+    if task is None:
+        return
+    sensor = task.name
+    scheduler.pause(sensor)
+    log.info('command_pause', sensor=sensor)
+
+
+@router.route(COMMAND_TOPIC + 'sensors/+/resume')
+def command_resume(topic: str, payload: bytes):  # pylint: disable=unused-argument
+    task = _command_task(topic)
+    if task is None:
+        return
+    sensor = task.name
+    scheduler.resume(sensor)
+    log.info('command_resume', sensor=sensor)
+
+
+@router.route(COMMAND_TOPIC + 'relay')
+def command_relay(topic: str, payload: bytes):
+    """'on', 'off', or seconds (up to RELAY_MAX_PULSE) to close the relay for."""
+    global actuators
+    command = payload.decode(errors='replace').strip().lower()
+    hold = None
+    if command not in ('on', 'off'):
+        # the actuator timeline has a resolution of 1 ms, shorter pulses make no sense
+        hold = _command_seconds(topic, payload, 0.001, RELAY_MAX_PULSE)
+        if hold is None:
+            return
+    with actuators_lock:
+        if actuators is None:
+            GPIO.setup(RELAY_PIN, GPIO.OUT, initial=GPIO.HIGH)
+            actuators = ActuatorTimeline()
+    if command == 'on':
+        actuators.switch(RELAY_PIN, GPIO.LOW, channel='relay')
+    elif command == 'off':
+        actuators.switch(RELAY_PIN, GPIO.HIGH, channel='relay')
+    else:
+        # a pulse; a new command on the relay cancels the running one
+        actuators.switch(RELAY_PIN, GPIO.LOW, hold=hold, channel='relay')
+        log.info('command_relay', hold=hold)
 
 
 class Server(BaseHTTPRequestHandler):
-    def sendJSON(self, object: object, code: int = 200):
-        self.send_response(code)
+    def sendCorsHeaders(self):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', '*')
         self.send_header('Access-Control-Allow-Headers', '*')
         self.send_header('Vary', 'Origin')
+
+    def sendJSON(self, object: object, code: int = 200):
+        self.send_response(code)
+        self.sendCorsHeaders()
+        body = json.dumps(object).encode()
         self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def sendCached(self, name: str, content_type: str):
+        cached = response_cache.get(name)
+        if self.headers.get('If-None-Match') == cached.etag:
+            self.send_response(304)
+            self.sendCorsHeaders()
+            self.send_header('ETag', cached.etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.sendCorsHeaders()
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(cached.body)))
+        self.send_header('ETag', cached.etag)
+        self.send_header('Cache-Control', 'no-cache')
         self.end_headers()
-        self.wfile.write(json.dumps(object).encode())
+        self.wfile.write(cached.body)
 
 
-    def do_GET(self):
-        if self.path == '/':
-            air = airSensor.readAir()
-            try:
-                light_value = get_light_value()
-            except Exception:
-                light_value = None
-
-            with latest_values_lock:
-                distance_value = latest_values.get('distance')
-
-            response: Dict[str, Any] = {
-                'status': 'Ok',
-                'light': light_value,
-                'air': air.__dict__,
-            }
-
-            if distance_value is not None:
-                response['distance'] = distance_value
-
-            self.sendJSON(response)
-            return
-
-        if self.path == '/metrics':
-            air = airSensor.readAir()
-            try:
-                light_value = get_light_value()
-            except Exception:
-                light_value = 'nan'
-
-            with latest_values_lock:
-                distance_value = latest_values.get('distance')
-
-            metrics_lines = [
-                '# HELP light measured light intensity in lux',
-                '# TYPE light gauge',
-                f'light {light_value}',
-                '# HELP air_temperature measured temperature in celcius',
-                '# TYPE air_temperature gauge',
-                f'air_temperature {air.temperature}',
-                '# HELP air_humidity measured humidity in percent',
-                '# TYPE air_humidity gauge',
-                f'air_humidity {air.humidity}',
-            ]
-
-            if distance_value is not None:
-                metrics_lines.extend([
-                    '# HELP distance measured distance to obstacle in centimeters',
-                    '# TYPE distance gauge',
-                    f'distance {distance_value}',
-                ])
-
-            response = '\n'.join(metrics_lines)
-            self.send_response(200)
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', '*')
-            self.send_header('Access-Control-Allow-Headers', '*')
-            self.send_header('Vary', 'Origin')
-            self.send_header('Content-type', 'text/plain')
-            self.end_headers()
-            self.wfile.write(response.encode())
-            publish('serverPi/metrics', 'requested')
+    def sendMetrics(self):
+        # the sensor gauges come pre-rendered, the self-instrumentation is
+        # rendered per scrape since its counters move all the time; the
+        # registry comes last since it ends OpenMetrics output with # EOF
+        openmetrics = wants_openmetrics(self.headers.get('Accept'))
+        body = response_cache.get('metrics').body + REGISTRY.render(openmetrics)
 
+        self.send_response(200)
+        self.sendCorsHeaders()
+        self.send_header('Content-type', OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
 
-def readLightSensor(delay: float = 5):
-    while True:
+    def sendHistory(self, query: str):
+        params = parse_qs(query)
         try:
-            lux = round(lightSensor.readLight(), 2)
-            print(f'Light intensity: {lux} lux')
-            _cache_value('light', lux)
-            publish('mondaymorning/sensors/light', lux)
-        except Exception as exc:  # pylint: disable=broad-except
-            print(f'Unable to read from BH1750 sensor: {exc}')
-        sleep(delay)
+            sensor = params['sensor'][0]
+            since = float(params.get('since', ['-3600'])[0])
+            step = float(params.get('step', ['60'])[0])
+            result = history.query(sensor, since, step)
+        except KeyError:
+            self.sendJSON({'status': 'Error', 'message': f'sensor must be one of {sorted(history.buffers)}'}, 400)
+            return
+        except ValueError as exc:
+            self.sendJSON({'status': 'Error', 'message': str(exc)}, 400)
+            return
 
+        self.sendJSON(result)
 
+    def sendRange(self, query: str):
+        if store is None:
+            self.sendJSON({'status': 'Error', 'message': 'the time-series store is disabled, set TSDB_PATH'}, 404)
+            return
+        params = parse_qs(query)
+        try:
+            sensor = params['sensor'][0]
+            start = float(params.get('start', ['-3600'])[0])
+            end = float(params['end'][0]) if 'end' in params else None
+            result = store.query(sensor, start, end, params.get('resolution', ['auto'])[0])
+        except KeyError:
+            self.sendJSON({'status': 'Error', 'message': f'sensor must be one of {sorted(history.buffers)}'}, 400)
+            return
+        except ValueError as exc:
+            self.sendJSON({'status': 'Error', 'message': str(exc)}, 400)
+            return
 
-def readLightSensor(delay: float = 5):
-    while True:
+        self.sendJSON(result)
+
+    def sendHealth(self):
+        # liveness: the server answers and the sampling thread did not die
+        sampling = scheduler.thread.is_alive() if scheduler.thread is not None else None
+        self.sendJSON({
+            'status': 'Ok' if sampling is not False else 'Error',
+            'uptime': round(time.monotonic() - started_monotonic, 3),
+            'sampling': sampling,
+        }, 200 if sampling is not False else 503)
+
+    def sendReady(self):
+        # readiness: every sensor is initialized; MQTT is reported but not
+        # required since the publisher spools or drops while it is offline
+        ready = all(sensor.ready for sensor in sensors)
+        self.sendJSON({
+            'status': 'Ready' if ready else 'Not ready',
+            'sensors': {sensor.name: dict(sensor.status(), sampled=_get_cached_value(sensor.name) is not None) for sensor in sensors},
+            'mqtt': {'connected': mqtt_client.is_connected()},
+        }, 200 if ready else 503)
+
+    def sendStats(self, query: str):
+        sensor = parse_qs(query).get('sensor', [None])[0]
         try:
-            lux = round(lightSensor.readLight(), 2)
-            print(f'Light intensity: {lux} lux')
-            _cache_value('light', lux)
-            mqtt_client.publish('mondaymorning/sensors/light', lux, qos=2)
-        except Exception as exc:  # pylint: disable=broad-except
-            print(f'Unable to read from BH1750 sensor: {exc}')
-        sleep(delay)
+            self.sendJSON(analytics.summary(sensor))
+        except KeyError:
+            self.sendJSON({'status': 'Error', 'message': f'sensor must be one of {sorted(analytics.sensors)}'}, 400)
+
 
+    def sendStream(self):
+        subscriber = broadcaster.subscribe()
+        if subscriber is None:
+            self.sendJSON({'status': 'Error', 'message': 'too many stream clients'}, 503)
+            return
 
-def readDistanceSensor(delay: float = 1):
-    while True:
         try:
-            distance = distanceSensor.read()
-            print(f'Distance: {distance} cm')
-            _cache_value('distance', distance)
-            mqtt_client.publish('mondaymorning/sensors/distance', distance, qos=2)
-        except Exception as exc:  # pylint: disable=broad-except
-            print(f'Unable to read distance sensor value: {exc}')
-        sleep(delay)
+            # a stalled client must not hold its handler thread in a blocking write forever
+            self.connection.settimeout(STREAM_WRITE_TIMEOUT)
+            self.send_response(200)
+            self.sendCorsHeaders()
+            self.send_header('Content-type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+
+            cached = response_cache.get('index')
+            self.wfile.write(b'id: %d\nevent: update\ndata: %s\n\n' % (cached.generation, cached.body))
+            self.wfile.flush()
+
+            while not subscriber.closed:
+                frames = subscriber.next(timeout=15)
+                # comment lines keep proxies from closing an idle stream
+                self.wfile.write(b''.join(frames) if frames else b': keepalive\n\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, TimeoutError):
+            pass
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/history':
+            self.sendHistory(url.query)
+            return
+
+        if url.path == '/stats':
+            self.sendStats(url.query)
+            return
+
+        if url.path == '/range':
+            self.sendRange(url.query)
+            return
+
+        if url.path == '/store':
+            self.sendJSON(store.stats() if store is not None else {'status': 'disabled'})
+            return
+
+        if url.path == '/stream':
+            self.sendStream()
+            return
+
+        if url.path == '/healthz':
+            self.sendHealth()
+            return
+
+        if url.path == '/readyz':
+            self.sendReady()
+            return
+
+        if url.path == '/stream/stats':
+            self.sendJSON(broadcaster.stats())
+            return
+
+        if url.path == '/scheduler':
+            self.sendJSON(scheduler.stats())
+            return
+
+        if url.path == '/i2c':
+            self.sendJSON({f'i2c-{number}': bus.stats() for number, bus in buses.items()})
+            return
+
+        if url.path == '/mqtt':
+            self.sendJSON(publisher.stats())
+            return
+
+        if url.path == '/commands':
+            self.sendJSON(router.stats())
+            return
+
+        if url.path == '/logging':
+            self.sendJSON(log_stats.summary())
+            return
+
+        if url.path == '/':
+            self.sendCached('index', 'application/json')
+            return
+
+        if url.path == '/metrics':
+            self.sendMetrics()
+            publish('serverPi/metrics', 'requested')
+            return
+
+        self.sendJSON({'status': 'Error', 'message': f'no route for {url.path}'}, 404)
+
+
+def sampleLight():
+    sensor = lightSensor.get()
+    if sensor is None:
+        return NOT_READY_RETRY
+    try:
+        with SENSOR_READ_SECONDS.labels('light').time():
+            lux = round(sensor.readLight(), 2)
+        captured_ns = time.time_ns()
+    except Exception:
+        # logged once, by the scheduler
+        SENSOR_READ_ERRORS.labels('light').inc()
+        raise
+    log.info('light_sample', lux=lux)
+    _cache_value('light', lux)
+    publish(LIGHT_TOPIC, lux, captured_ns)
+    return None
+
+
+def sampleDistance():
+    sensor = distanceSensor.get()
+    if sensor is None:
+        return NOT_READY_RETRY
+    try:
+        with SENSOR_READ_SECONDS.labels('distance').time():
+            distance = sensor.read()
+        captured_ns = time.time_ns()
+    except Exception:
+        # logged once, by the scheduler
+        SENSOR_READ_ERRORS.labels('distance').inc()
+        raise
+    log.info('distance_sample', cm=distance)
+    _cache_value('distance', distance)
+    publish(DISTANCE_TOPIC, distance, captured_ns)
+    return None
+
+
+def sampleAir() -> Optional[float]:
+    sensor = airSensor.get()
+    if sensor is None:
+        return NOT_READY_RETRY
+    with SENSOR_READ_SECONDS.labels('air').time():
+        delay = sensor.sample()
+    # only the backoff after a bad readout overrides the cadence of the task,
+    # otherwise a cadence set at runtime would never apply
+    return delay if sensor.failures else None
+
+
+def start_mqtt():
+    # connects and reconnects in the background, a missing broker never blocks startup
+    router.start()
+    mqtt_client.connect_async(MQTT_BROKER_HOST, MQTT_BROKER_PORT, 60)
+    mqtt_client.loop_start()
+    publisher.start()
+
+
+def start_sampling():
+    for sensor in sensors:
+        sensor.start()
+
+    # One worker thread per bus; the DHT11 and HC-SR04 both sit on GPIO and
+    # are staggered against each other, the BH1750 on I2C never waits for them.
+    # min_cadence: a distance read is a burst of 3 pings 60 ms apart, the
+    # BH1750 needs up to 180 ms per conversion, the DHT11 about 2 s
+    scheduler.register('distance', sampleDistance, cadence=0.3, priority=0, bus='gpio', min_cadence=0.2)
+    scheduler.register('light', sampleLight, cadence=2, priority=1, bus='i2c', min_cadence=0.2)
+    scheduler.register('air', sampleAir, cadence=AIR_INTERVAL, priority=2, bus='gpio', start_in=AIR_INTERVAL,
+                       min_cadence=AIR_INTERVAL)
+    for name, task in scheduler.tasks.items():
+        SAMPLING_DEADLINE_MISSES.labels(name).set_function(lambda task=task: task.deadline_misses)
+        SAMPLING_JITTER.labels(name).set_function(lambda task=task: task.avg_jitter)
+        SAMPLING_LATE_STARTS.labels(name).set_function(lambda task=task: task.late_starts)
+    scheduler.start()
+
+
+class SingleSensorHTTPServer(HTTPServer):
+    # Keep a backlog large enough for bursts of dashboard clients hitting the
+    # server together with scrapes; the default of 5 overflows and the
+    # dropped connections wait for a SYN retransmit (1 s).
+    request_queue_size = 64
+
+
+class SensorHTTPServer(ThreadingHTTPServer):
+    # Every request runs on its own daemon thread, same backlog as above.
+    daemon_threads = True
+    request_queue_size = SingleSensorHTTPServer.request_queue_size
+
+
+def create_server(mode: str = server_mode) -> HTTPServer:
+    if mode == 'single':
+        return SingleSensorHTTPServer((host, port), Server)
+    return SensorHTTPServer((host, port), Server)
+
 
 def main():
-    webServer = HTTPServer((host, port), Server)
-    print(f'Server started and listen to {host}:{port}')
+    webServer = create_server()
+    log.info('server_started', mode=server_mode, host=host, port=port)
 
-    distanceSensorThread = threading.Thread(target=readDistanceSensor, args=(0.3,), daemon=True)
-    lightSensorThread = threading.Thread(target=readLightSensor, args=(2,), daemon=True)
-    distanceSensorThread.start()
-    lightSensorThread.start()
+    start_sampling()
 
     try:
-        mqtt_client.connect_async(MQTT_BROKER_HOST, MQTT_BROKER_PORT, 60)
-        mqtt_client.loop_start()
+        start_mqtt()
         publish('mondaymorning/up', 'true')
         webServer.serve_forever()
     except KeyboardInterrupt:
         pass
 
     webServer.server_close()
-    print('Server stopped.')
+    if store is not None:
+        store.close()
+    log.info('server_stopped')
 
 if __name__ == '__main__':
     main()
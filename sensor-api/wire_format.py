@@ -0,0 +1,84 @@
+"""
+Binary MQTT payload for sensor readings.
+
+A frame is a header followed by `count` fixed size readings, all little
+endian:
+
+    header   version u8, count u8
+    reading  sensor id u8, sequence u32, capture time i64 (unix ns), value f64
+
+A single reading is a frame with count 1 (23 bytes), batches carry up to
+MAX_READINGS readings. Sequence numbers count per sensor and wrap at 2**32,
+so a consumer can spot lost messages. Consumers reject frames of an unknown
+version instead of guessing.
+"""
+
+import struct
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+VERSION = 1
+FRAME_HEADER = struct.Struct('<BB')
+READING = struct.Struct('<BIqd')
+MAX_READINGS = 255
+
+# sensor id -> (name, unit); ids are part of the format and never reused
+SENSORS = {
+    1: ('light', 'lx'),
+    2: ('distance', 'cm'),
+    3: ('air_temperature', 'celsius'),
+    4: ('air_humidity', 'percent'),
+}
+SENSOR_IDS = {name: sensor_id for sensor_id, (name, _) in SENSORS.items()}
+
+
+class Reading(NamedTuple):
+    sensor: str
+    seq: int
+    time_ns: int
+    value: float
+
+
+class Sequencer():
+    """Hands out the next sequence number per sensor."""
+
+    def __init__(self):
+        self.sequences: Dict[str, int] = {}
+
+    def next(self, sensor: str) -> int:
+        seq = self.sequences.get(sensor, 0)
+        self.sequences[sensor] = (seq + 1) & 0xFFFFFFFF
+        return seq
+
+    def reading(self, sensor: str, value: float, time_ns: Optional[int] = None) -> Reading:
+        return Reading(sensor, self.next(sensor), time_ns if time_ns is not None else time.time_ns(), value)
+
+
+def encode(readings: Iterable[Reading]) -> bytes:
+    readings = list(readings)
+    if not 0 < len(readings) <= MAX_READINGS:
+        raise ValueError(f'a frame carries 1 to {MAX_READINGS} readings, got {len(readings)}')
+    frame = bytearray(FRAME_HEADER.size + READING.size * len(readings))
+    FRAME_HEADER.pack_into(frame, 0, VERSION, len(readings))
+    offset = FRAME_HEADER.size
+    for reading in readings:
+        READING.pack_into(frame, offset, SENSOR_IDS[reading.sensor], reading.seq, reading.time_ns, reading.value)
+        offset += READING.size
+    return bytes(frame)
+
+
+def decode(payload: bytes) -> List[Reading]:
+    if len(payload) < FRAME_HEADER.size:
+        raise ValueError('frame too short')
+    version, count = FRAME_HEADER.unpack_from(payload, 0)
+    if version != VERSION:
+        raise ValueError(f'unsupported frame version {version}')
+    if len(payload) != FRAME_HEADER.size + READING.size * count:
+        raise ValueError(f'frame length {len(payload)} does not match {count} readings')
+
+    readings = []
+    for sensor_id, seq, time_ns, value in READING.iter_unpack(memoryview(payload)[FRAME_HEADER.size:]):
+        if sensor_id not in SENSORS:
+            raise ValueError(f'unknown sensor id {sensor_id}')
+        readings.append(Reading(SENSORS[sensor_id][0], seq, time_ns, value))
+    return readings